@@ -6,49 +6,51 @@ from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 import chardet # Added for encoding detection
-import os # Ensure os is imported for path operations
 
 # Define the Gmail API scope
 SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 
 # Load feedback data
 file_path = "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/Assignments for Mailing/MGMT4901_3B_Evaluation_OutputR1.csv"
-
-# Try to detect encoding first
-try:
-    with open(file_path, 'rb') as f:
-        result = chardet.detect(f.read())
-    detected_encoding = result['encoding']
-    if detected_encoding:
-        print(f"Detected encoding: {detected_encoding}")
-        df = pd.read_csv(file_path, encoding=detected_encoding)
-    else:
-        # If chardet fails to detect, try fallback
-        raise ValueError("Chardet could not detect encoding.")
-except Exception as e:
-    print(f"Encoding detection/read failed: {e}. Trying fallback encodings...")
-    fallback_encodings = ['latin1', 'ISO-8859-1', 'cp1252']
-    df = None
-    for enc in fallback_encodings:
-        try:
-            df = pd.read_csv(file_path, encoding=enc)
-            print(f"Successfully read file with fallback encoding: {enc}")
-            break
-        except UnicodeDecodeError:
-            print(f"Failed to read with encoding: {enc}")
-        except Exception as ex:
-            print(f"An unexpected error occurred with encoding {enc}: {ex}")
-            break 
-    if df is None:
-        print("Failed to read the CSV file with all attempted encodings. Please check the file.")
-        # Handle the error as appropriate for your script, e.g., exit or raise
-        exit()
+credentials_dir = "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/"
+
+def load_feedback(file_path=file_path):
+    """Read the feedback CSV, detecting its encoding and falling back to common Windows encodings."""
+    # Try to detect encoding first
+    try:
+        with open(file_path, 'rb') as f:
+            result = chardet.detect(f.read())
+        detected_encoding = result['encoding']
+        if detected_encoding:
+            print(f"Detected encoding: {detected_encoding}")
+            df = pd.read_csv(file_path, encoding=detected_encoding)
+        else:
+            # If chardet fails to detect, try fallback
+            raise ValueError("Chardet could not detect encoding.")
+    except Exception as e:
+        print(f"Encoding detection/read failed: {e}. Trying fallback encodings...")
+        fallback_encodings = ['latin1', 'ISO-8859-1', 'cp1252']
+        df = None
+        for enc in fallback_encodings:
+            try:
+                df = pd.read_csv(file_path, encoding=enc)
+                print(f"Successfully read file with fallback encoding: {enc}")
+                break
+            except UnicodeDecodeError:
+                print(f"Failed to read with encoding: {enc}")
+            except Exception as ex:
+                print(f"An unexpected error occurred with encoding {enc}: {ex}")
+                break 
+        if df is None:
+            print("Failed to read the CSV file with all attempted encodings. Please check the file.")
+            # Handle the error as appropriate for your script, e.g., exit or raise
+            exit()
+    return df
 
 
 # Authenticate with Gmail API using credentials.json from Google Cloud Console
-def authenticate_gmail():
-    # Define the directory where credentials.json and token.json are stored
-    credentials_dir = "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/"
+def authenticate_gmail(credentials_dir=credentials_dir):
+    # credentials_dir is the directory where credentials.json and token.json are stored
     credentials_path = os.path.join(credentials_dir, 'credentials.json')
     token_path = os.path.join(credentials_dir, 'token.json')
 
@@ -115,15 +117,21 @@ def create_message(to, subject, body):
 def send_email(service, message):
     return service.users().messages().send(userId="me", body=message).execute()
 
+def send_all(df, gmail_service, limit=None):
+    """Send the 3B feedback email to the first `limit` rows of df (every row if limit is None)."""
+    rows = df if limit is None else df.head(limit)
+    for _, row in rows.iterrows():
+        to = row['E-Mail Address']
+        subject = "Your Feedback for Assignment 3B – MGMT 4901"
+        body = create_email_body(row)
+        msg = create_message(to, subject, body)
+        print(f"Sending to {to}...")
+        send_email(gmail_service, msg)
+        print("Sent!")
+
 if __name__ == '__main__':
+    df = load_feedback()
     gmail_service = authenticate_gmail()
 
     # Just run a single test row for now
-    row = df.iloc[0]
-    to = row['E-Mail Address']
-    subject = "Your Feedback for Assignment 3B – MGMT 4901"
-    body = create_email_body(row)
-    msg = create_message(to, subject, body)
-    print(f"Sending to {to}...")
-    send_email(gmail_service, msg)
-    print("Sent!")
+    send_all(df, gmail_service, limit=1)
@@ -3,7 +3,10 @@ from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import FormulaRule
 import os
 
+from artifacts import find_artifact, read_artifact, write_artifact
+
 file_path = "TEAM_FEATURES.xlsx"
+output_path = "TEAM_FEATURES_COLORED.xlsx"
 
 likert_headers = [
     "I enjoy designing user experiences, visuals, or branding (Hipster – Designer).",
@@ -23,23 +26,36 @@ likert_headers = [
     "I prefer content that allows me to test my understanding as I go."
 ]
 
-wb = openpyxl.load_workbook(file_path)
-ws = wb.active
+def apply_likert_formatting(file_path=file_path, output_path=output_path):
+    """Colour the Likert columns of the team features workbook green/yellow/red by agreement.
+
+    The team features may be a Parquet or Arrow intermediate; the output is always Excel.
+    """
+    file_path = find_artifact(file_path)
+    if not file_path.endswith(".xlsx"):
+        # write_artifact expands multi-select bitmasks into 0/1 columns for Excel
+        write_artifact(read_artifact(file_path), output_path)
+        file_path = output_path
+    wb = openpyxl.load_workbook(file_path)
+    ws = wb.active
+
+    green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+    yellow_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
 
-green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-yellow_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
+    header_row = 1
+    header_to_col = {cell.value: cell.column_letter for cell in ws[header_row] if cell.value in likert_headers}
 
-header_row = 1
-header_to_col = {cell.value: cell.column_letter for cell in ws[header_row] if cell.value in likert_headers}
+    for header, col in header_to_col.items():
+        ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
+            FormulaRule(formula=[f'OR({col}2="Agree",{col}2="Strongly Agree")'], fill=green_fill))
+        ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
+            FormulaRule(formula=[f'OR({col}2="Disagree",{col}2="Strongly Disagree")'], fill=red_fill))
+        ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
+            FormulaRule(formula=[f'{col}2="Neutral"'], fill=yellow_fill))
 
-for header, col in header_to_col.items():
-    ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
-        FormulaRule(formula=[f'OR({col}2="Agree",{col}2="Strongly Agree")'], fill=green_fill))
-    ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
-        FormulaRule(formula=[f'OR({col}2="Disagree",{col}2="Strongly Disagree")'], fill=red_fill))
-    ws.conditional_formatting.add(f"{col}2:{col}{ws.max_row}",
-        FormulaRule(formula=[f'{col}2="Neutral"'], fill=yellow_fill))
+    wb.save(output_path)
+    print(f"Conditional formatting applied and saved as {output_path}")
 
-wb.save("TEAM_FEATURES_COLORED.xlsx")
-print("Conditional formatting applied and saved as TEAM_FEATURES_COLORED.xlsx")
+if __name__ == "__main__":
+    apply_likert_formatting()
@@ -0,0 +1,89 @@
+"""Intermediate files handed from one script to the next.
+
+The cleaning and merging scripts used to exchange .xlsx files, which are
+slow to write and read and lose dtypes. ARTIFACT_CONFIG["format"] picks
+the format of those hand-offs instead:
+
+- "xlsx": Excel, as before (the default)
+- "parquet": compressed columnar files with dtypes preserved
+- "arrow": uncompressed Arrow IPC files, memory-mapped when read
+
+Parquet and Arrow need pyarrow. Human-facing outputs (the coloured team
+features, graded workbooks, formatted feedback) stay Excel/CSV whatever the
+format. Multi-select answers stay compact bitmasks in Parquet and Arrow
+and are expanded to 0/1 columns in Excel (see multiselect.py). Scripts name intermediates by their .xlsx name and pass it through
+artifact_path(), so "ALL_MERGED.xlsx" becomes "ALL_MERGED.parquet".
+
+    python mgmt4901.py --artifacts parquet clean
+"""
+import os
+import shutil
+
+import pandas as pd
+
+from multiselect import expand_multi_select
+
+ARTIFACT_CONFIG = {
+    "format": "xlsx",
+}
+
+EXTENSIONS = {
+    "xlsx": ".xlsx",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+def artifact_path(path: str, fmt: str = None) -> str:
+    """path with its .xlsx extension replaced by the one of the configured (or given) format."""
+    extension = EXTENSIONS[fmt or ARTIFACT_CONFIG["format"]]
+    root, ext = os.path.splitext(path)
+    return root + extension if ext in EXTENSIONS.values() else path
+
+def find_artifact(path: str) -> str:
+    """The configured-format version of an intermediate if it exists, otherwise path itself."""
+    candidate = artifact_path(path)
+    return candidate if os.path.exists(candidate) else path
+
+def arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Make object columns that mix value types (e.g. numbers and text answers) plain strings for Arrow."""
+    mixed = [col for col in df.columns
+             if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1]
+    if not mixed:
+        return df
+    df = df.copy()
+    for col in mixed:
+        df[col] = df[col].astype("string")
+    return df
+
+def write_artifact(df: pd.DataFrame, path: str) -> str:
+    """Write df in the format given by path's extension and return path."""
+    ext = os.path.splitext(path)[1]
+    if ext == ".parquet":
+        arrow_safe(df).to_parquet(path, index=False)
+    elif ext == ".arrow":
+        import pyarrow as pa
+        table = pa.Table.from_pandas(arrow_safe(df), preserve_index=False)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        # Multi-select bitmasks are only expanded to 0/1 columns for Excel
+        expand_multi_select(df).to_excel(path, index=False)
+    return path
+
+def read_artifact(path: str) -> pd.DataFrame:
+    """Read a file written by write_artifact (or any .xlsx), by its extension."""
+    ext = os.path.splitext(path)[1]
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    if ext == ".arrow":
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_pandas()
+    return pd.read_excel(path)
+
+def backup_copy(path: str) -> str:
+    """Copy path byte for byte to a timestamped _BACKUP_ file next to it; returns the copy's path."""
+    root, ext = os.path.splitext(path)
+    backup = f"{root}_BACKUP_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+    shutil.copy2(path, backup)
+    return backup
@@ -0,0 +1,142 @@
+"""Chat-completion backends: the hosted OpenAI API or a local OpenAI-compatible server.
+
+completions.create_chat_completion sends every request through the backend
+named in CLIENT_CONFIG["backend"], built from BACKEND_CONFIG:
+
+- "openai": the hosted API via openai.ChatCompletion (needs OPENAI_API_KEY)
+- "local": a llama.cpp server, Ollama or any other server exposing
+  /v1/chat/completions, for fully offline grading on a workstation
+
+Each backend admits at most max_concurrency requests at a time. The
+evaluators grade that many students in parallel, so a freed slot is refilled
+with the next waiting request straight away; a server with continuous
+batching (llama.cpp --parallel N --cont-batching, OLLAMA_NUM_PARALLEL) then
+keeps its batch full instead of waiting for a whole round of requests.
+
+    python mgmt4901.py grade 3A --backend local --backend-url http://127.0.0.1:8080/v1 \\
+        --local-model qwen2.5-7b-instruct --concurrency 8
+"""
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import openai
+
+# Options per backend; the CLI may override them
+BACKEND_CONFIG = {
+    "openai": {
+        "max_concurrency": 1,
+    },
+    "local": {
+        "api_base": "http://127.0.0.1:8080/v1",
+        "model": None,          # model name on the local server; None sends the evaluator's model name
+        "max_concurrency": 4,   # match the server's parallel slots
+        "request_timeout": 600,  # CPU-only generation can be slow
+    },
+}
+
+class ChatBackend:
+    """Base class: limits in-flight requests to max_concurrency and delegates the call to _create()."""
+
+    name = "base"
+    requires_api_key = False
+
+    def __init__(self, max_concurrency: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def resolve_model(self, model: str) -> str:
+        """The model name actually sent to the server."""
+        return model
+
+    def create(self, model: str, messages: List[Dict], temperature: float = 0.7, stream: bool = False,
+               slot: bool = True):
+        """Send one chat completion request once a slot is free; streams hold their slot until closed.
+
+        slot=False sends it straight away, for hedged duplicates of a request that already holds one.
+        """
+        if not slot:
+            return self._create(self.resolve_model(model), messages, temperature, stream)
+        self._slots.acquire()
+        try:
+            response = self._create(self.resolve_model(model), messages, temperature, stream)
+        except BaseException:
+            self._slots.release()
+            raise
+        if stream:
+            return _SlotStream(response, self._slots)
+        self._slots.release()
+        return response
+
+    def _create(self, model: str, messages: List[Dict], temperature: float, stream: bool):
+        raise NotImplementedError
+
+class OpenAIBackend(ChatBackend):
+    """The hosted OpenAI API."""
+
+    name = "openai"
+    requires_api_key = True
+
+    def _create(self, model: str, messages: List[Dict], temperature: float, stream: bool):
+        return openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature, stream=stream)
+
+class LocalBackend(ChatBackend):
+    """A local OpenAI-compatible server (llama.cpp server, Ollama, vLLM, ...)."""
+
+    name = "local"
+
+    def __init__(self, api_base: str = "http://127.0.0.1:8080/v1", model: Optional[str] = None,
+                 max_concurrency: int = 4, request_timeout: float = 600):
+        super().__init__(max_concurrency)
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.request_timeout = request_timeout
+
+    def resolve_model(self, model: str) -> str:
+        return self.model or model
+
+    def _create(self, model: str, messages: List[Dict], temperature: float, stream: bool):
+        # Local servers ignore the key, but the client refuses to send a request without one
+        return openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature, stream=stream,
+                                            api_base=self.api_base, api_key="local",
+                                            request_timeout=self.request_timeout)
+
+class _SlotStream:
+    """Iterates a streamed response and frees the backend slot when it ends or is closed."""
+
+    def __init__(self, stream: Iterator, slots: threading.BoundedSemaphore):
+        self._stream = stream
+        self._slots = slots
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            close = getattr(self._stream, "close", None)
+            if close:
+                close()
+        finally:
+            self._slots.release()
+
+BACKENDS = {backend.name: backend for backend in (OpenAIBackend, LocalBackend)}
+
+_instances: Dict[tuple, ChatBackend] = {}
+_instances_lock = threading.Lock()
+
+def get_backend(name: str) -> ChatBackend:
+    """The backend for name built from its current BACKEND_CONFIG, shared by every caller."""
+    options = BACKEND_CONFIG.get(name, {})
+    key = (name, tuple(sorted(options.items())))
+    with _instances_lock:
+        if key not in _instances:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown backend: {name}")
+            _instances[key] = BACKENDS[name](**options)
+        return _instances[key]
@@ -0,0 +1,417 @@
+"""Synthetic-cohort benchmark for the cleaning, merging, grading and formatting pipeline.
+
+Generates Brightspace "Attempt Details" exports, a class list and a rubric
+table for a made-up cohort, then runs clean_quiz_file → merge_all_cleaned →
+evaluators → format_feedback against a local MockChatServer, so no API
+money or student data is involved. Reports wall time, peak traced memory and
+requests/sec for every stage. With --artifacts the intermediates are written
+as Parquet or Arrow instead of Excel (see artifacts.py), and
+--artifact-report times writing and reading each intermediate in every
+format. --hedge-report grades 3A without and then with request hedging
+and prints p95/p99 latency for both; pair it with --latency-dist pareto.
+--memory-report writes each stage's peak and top allocation sites as JSON,
+and --memory-budget MB lets the stages switch to their low-memory paths
+(see memory.py).
+
+    python benchmark.py --students 200 --quizzes 3 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from artifacts import ARTIFACT_CONFIG, EXTENSIONS, artifact_path, read_artifact, write_artifact
+from memory import MEMORY, MEMORY_CONFIG, load_factors
+from multiselect import expand_multi_select
+from mock_chat_server import LATENCY_DISTRIBUTIONS, MockChatServer
+
+CATEGORIES = [
+    "Capstone Execution",
+    "Theory Development",
+    "Hypothesis Development",
+    "Hypothesis Testing",
+    "Evaluation / Decision",
+]
+
+WORDS = (
+    "customer interview prototype landing page signup hypothesis assumption test users "
+    "value pricing channel feedback pivot persevere survey mock-up demo conversion "
+    "problem solution segment early adopters pain gain metric experiment learning"
+).split()
+
+LIKERT = ["Strongly Disagree", "Disagree", "Neutral", "Agree", "Strongly Agree"]
+
+def _sentence(rng: random.Random, words: int = 25) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def make_class_list(n_students: int, team_size: int = 4, seed: int = 0) -> pd.DataFrame:
+    """Synthetic "00 Class List.xlsx" with usernames, emails, degrees and team numbers."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_students):
+        username = f"st{i:05d}"
+        rows.append({
+            "Last Name": f"Student{i}",
+            "First Name": f"Test{i}",
+            "username": username,
+            "E-Mail Address": f"{username}@example.edu",
+            "Team Number": i // team_size + 1,
+            "Degree": rng.choice(["Bachelor of Management", "Bachelor of Commerce Co-op*", "Bachelor of Arts"]),
+            "Major": rng.choice(["Entrepreneurship", "Marketing", "Finance", "Economics"]),
+        })
+    return pd.DataFrame(rows)
+
+def make_attempt_details(usernames: List[str], quiz_index: int, questions_per_category: int = 2,
+                         ms_options: int = 5, seed: int = 0, team_size: int = 4,
+                         duplicate_rate: float = 0.0) -> pd.DataFrame:
+    """Synthetic Brightspace Attempt Details export (one row per question option per student).
+
+    With duplicate_rate, that share of students hand in their first teammate's written answers verbatim.
+    """
+    rng = random.Random(seed + quiz_index)
+    rows = []
+    team_answers: Dict[int, List[str]] = {}
+    for i, username in enumerate(usernames):
+        answers = [_sentence(rng, rng.randint(15, 80)) for _ in range(len(CATEGORIES) * questions_per_category)]
+        team = i // team_size
+        if team in team_answers and rng.random() < duplicate_rate:
+            answers = team_answers[team]
+        team_answers.setdefault(team, answers)
+        # Brightspace puts explainer rows with a Section # above each attempt
+        rows.append({"Section #": 1, "Username": username, "Q #": None, "Q Type": None,
+                     "Q Text": "Instructions", "Answer": None, "Answer Match": None})
+        q = 0
+        for category in CATEGORIES:
+            for j in range(questions_per_category):
+                q += 1
+                rows.append({"Section #": None, "Username": username, "Q #": q, "Q Type": "WR",
+                             "Q Text": f"{category} (quiz {quiz_index}, question {j + 1}): describe your work.",
+                             "Answer": answers[q - 1], "Answer Match": None})
+        q += 1
+        choice = rng.choice(LIKERT)
+        for option in LIKERT:
+            rows.append({"Section #": None, "Username": username, "Q #": q, "Q Type": "MC",
+                         "Q Text": f"Quiz {quiz_index}: I like building and testing prototypes.",
+                         "Answer": option, "Answer Match": "Checked" if option == choice else "Unchecked"})
+        q += 1
+        for k in range(ms_options):
+            rows.append({"Section #": None, "Username": username, "Q #": q, "Q Type": "M-S",
+                         "Q Text": f"Quiz {quiz_index}: which methods did you use?", "Answer": f"Method {k + 1}",
+                         "Answer Match": "Checked" if rng.random() < 0.3 else "Unchecked"})
+        q += 1
+        for k in range(2):
+            rows.append({"Section #": None, "Username": username, "Q #": q, "Q Type": "MSA",
+                         "Q Text": f"Quiz {quiz_index}: rate your team", "Answer": None,
+                         "Answer Match": str(rng.randint(1, 5))})
+    return pd.DataFrame(rows)
+
+def make_rubric(items_per_category: int = 4) -> pd.DataFrame:
+    """Synthetic rubric table in the layout of 2025_05_Rubric_Table.xlsx (sheet "Rubric")."""
+    rows = []
+    for c, category in enumerate(CATEGORIES):
+        for i in range(items_per_category):
+            rows.append({
+                "ID": f"{c + 1}.{i + 1}",
+                "Rubric Category": category,
+                "Rubric Item": f"{category} item {i + 1}: the submission shows evidence of rigorous {WORDS[(c + i) % len(WORDS)]}.",
+                "Weighting": 0.05,
+            })
+    return pd.DataFrame(rows)
+
+def write_cohort(out_dir: str, students: int, quizzes: int, questions_per_category: int, seed: int = 0,
+                 duplicate_rate: float = 0.0, ms_options: int = 5) -> Dict[str, object]:
+    """Write the class list, rubric and quiz exports for a synthetic cohort into out_dir."""
+    class_list = make_class_list(students, seed=seed)
+    paths = {
+        "class_list": os.path.join(out_dir, "00 Class List.xlsx"),
+        "rubric": os.path.join(out_dir, "Rubric_Table.xlsx"),
+        "exports": [],
+    }
+    class_list.to_excel(paths["class_list"], index=False)
+    make_rubric().to_excel(paths["rubric"], sheet_name="Rubric", index=False)
+    for quiz in range(1, quizzes + 1):
+        path = os.path.join(out_dir, f"{quiz} Synthetic Quiz - Attempt Details.xlsx")
+        make_attempt_details(class_list["username"].tolist(), quiz, questions_per_category, ms_options=ms_options,
+                             seed=seed, duplicate_rate=duplicate_rate).to_excel(path, index=False)
+        paths["exports"].append(path)
+    return paths
+
+class StageTimer:
+    """Runs pipeline stages and records wall time, traced memory peak and mock-server requests."""
+
+    def __init__(self, server: Optional[MockChatServer] = None, trace_memory: bool = True):
+        self.server = server
+        self.trace_memory = trace_memory
+        self.results: List[Dict] = []
+        self.artifacts: List[Dict] = []
+
+    def run(self, name: str, fn: Callable):
+        from metrics import METRICS
+        METRICS.reset()
+        requests_before = self.server.request_count if self.server else 0
+        start = time.perf_counter()
+        tracking = MEMORY.track(name) if self.trace_memory else nullcontext({})
+        try:
+            with tracking as memory:
+                return fn()
+        finally:
+            wall = time.perf_counter() - start
+            requests = (self.server.request_count if self.server else 0) - requests_before
+            stage = {
+                "stage": name,
+                "wall_seconds": wall,
+                "peak_memory_mb": memory.get("peak_mb", 0.0),
+                "requests": requests,
+                "requests_per_second": requests / wall if wall > 0 else 0.0,
+            }
+            if memory.get("top_sites"):
+                stage["top_sites"] = memory["top_sites"]
+            summary = METRICS.summary()
+            if summary["calls"]:
+                stage["latency_seconds"] = summary["latency_seconds"]
+                stage["retries"] = summary["retries"]
+                stage["prompt_tokens"] = summary["prompt_tokens"]
+                stage["parse_failures"] = summary["parse_failures"]
+                stage["prompt_cache_hit_rate"] = summary["prompt_cache_hit_rate"]
+                stage["estimated_cost_usd"] = summary["estimated_cost_usd"]
+                if "dedup" in summary:
+                    stage["calls_saved"] = summary["dedup"]["calls_saved"]
+                if "cascade" in summary:
+                    stage["escalation_rate"] = summary["cascade"]["escalation_rate"]
+                if "hedging" in summary:
+                    stage["hedged_calls"] = summary["hedging"]["hedged_calls"]
+            self.results.append(stage)
+
+    def print_report(self):
+        print(f"{'stage':<16}{'wall s':>10}{'peak MB':>10}{'requests':>10}{'req/s':>10}{'p95 s':>8}{'p99 s':>8}")
+        for r in self.results:
+            latency = r.get("latency_seconds", {})
+            percentiles = "".join(f"{latency[p]:>8.3f}" if p in latency else f"{'':>8}" for p in ("p95", "p99"))
+            print(f"{r['stage']:<16}{r['wall_seconds']:>10.3f}{r['peak_memory_mb']:>10.1f}"
+                  f"{r['requests']:>10}{r['requests_per_second']:>10.1f}{percentiles}")
+
+def masks_kept(df: pd.DataFrame, back: pd.DataFrame) -> bool:
+    """True if every multi-select answer of df reads back the same from back, compact or expanded."""
+    expanded, back = expand_multi_select(df), expand_multi_select(back)
+    options = [col for col in expanded.columns if col not in df.columns]
+    if not all(col in back.columns for col in options):
+        return False
+    return expanded[options].astype("Int8").reset_index(drop=True).equals(back[options].astype("Int8"))
+
+def compare_artifacts(work_dir: str, frames: Dict[str, pd.DataFrame], formats=tuple(EXTENSIONS)) -> List[Dict]:
+    """Write and read back each intermediate frame in every format; returns times, sizes, kept dtypes and masks."""
+    rows = []
+    for name, df in frames.items():
+        for fmt in formats:
+            path = os.path.join(work_dir, f"artifact_{name}{EXTENSIONS[fmt]}")
+            start = time.perf_counter()
+            write_artifact(df, path)
+            written = time.perf_counter()
+            back = read_artifact(path)
+            done = time.perf_counter()
+            kept = sum(str(df[col].dtype) == str(back[col].dtype) for col in df.columns if col in back.columns)
+            rows.append({
+                "artifact": name,
+                "format": fmt,
+                "rows": len(df),
+                "columns": len(df.columns),
+                "write_seconds": written - start,
+                "read_seconds": done - written,
+                "size_mb": os.path.getsize(path) / 1e6,
+                "dtypes_kept": kept / max(len(df.columns), 1),
+                "masks_kept": masks_kept(df, back),
+            })
+            os.remove(path)
+    return rows
+
+def print_artifact_report(rows: List[Dict]):
+    print(f"{'artifact':<10}{'format':<9}{'shape':>11}{'write s':>10}{'read s':>10}{'w+r s':>10}{'size MB':>10}{'dtypes':>8}"
+          f"{'masks':>7}")
+    for r in rows:
+        shape = f"{r['rows']}x{r['columns']}"
+        print(f"{r['artifact']:<10}{r['format']:<9}{shape:>11}{r['write_seconds']:>10.3f}{r['read_seconds']:>10.3f}"
+              f"{r['write_seconds'] + r['read_seconds']:>10.3f}{r['size_mb']:>10.3f}{r['dtypes_kept']:>8.0%}"
+              f"{'ok' if r['masks_kept'] else 'LOST':>7}")
+
+def run_benchmark(args) -> StageTimer:
+    """Generate a cohort, run every pipeline stage against the mock server and return the StageTimer with the results."""
+    import openai
+    from backends import BACKEND_CONFIG
+    from completions import CLIENT_CONFIG
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="mgmt4901_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    server = MockChatServer(latency=args.latency, latency_dist=args.latency_dist, error_rate=args.error_rate,
+                            malformed_rate=args.malformed_rate, seed=args.seed,
+                            token_latency=args.token_latency, sloppy_rate=args.sloppy_rate,
+                            sloppy_models=[args.cascade_model] if args.cascade_model else []).start()
+    timer = StageTimer(server, trace_memory=not args.no_tracemalloc)
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    openai.api_base = server.api_base
+    # The mock stands in for whichever backend is benchmarked
+    CLIENT_CONFIG["backend"] = args.backend
+    if args.backend == "local":
+        BACKEND_CONFIG["local"]["api_base"] = server.api_base
+    if args.concurrency:
+        BACKEND_CONFIG[args.backend]["max_concurrency"] = args.concurrency
+    CLIENT_CONFIG["retry_backoff"] = args.retry_backoff
+    CLIENT_CONFIG["stream"] = args.stream
+    CLIENT_CONFIG["hedge"] = args.hedge
+    CLIENT_CONFIG["hedge_budget"] = args.hedge_budget
+    ARTIFACT_CONFIG["format"] = args.artifacts
+    MEMORY_CONFIG.update({"budget_mb": args.memory_budget, "report_file": args.memory_report,
+                          "factors_file": args.memory_factors})
+    load_factors()
+    try:
+        paths = timer.run("generate", lambda: write_cohort(work_dir, args.students, args.quizzes, args.questions, args.seed,
+                                                           args.duplicate_rate, args.ms_options))
+
+        def clean_all():
+            from clean_brightspace_quiz import clean_quiz_file
+            for path in paths["exports"]:
+                write_artifact(clean_quiz_file(path, compact_multi_select=not args.wide_multi_select),
+                               artifact_path(path.replace(".xlsx", "_CLEANED.xlsx")))
+        timer.run("clean", clean_all)
+
+        from merge_all_cleaned import merge_all_cleaned
+        merged = timer.run("merge", lambda: merge_all_cleaned(work_dir))
+
+        cleaned = artifact_path(paths["exports"][0].replace(".xlsx", "_CLEANED.xlsx"))
+        if args.artifact_report:
+            from merge_team_number import merge_team_number
+            teams = merge_team_number(cleaned, paths["class_list"], os.path.join(work_dir, "teams.xlsx"))
+            frames = {"cleaned": read_artifact(cleaned), "merged": merged, "teams": teams}
+            timer.artifacts = compare_artifacts(work_dir, frames)
+        eval_csv = os.path.join(work_dir, "Evaluation_Output.csv")
+        if args.scheduler:
+            import scheduler
+            jobs = []
+            for evaluator in args.evaluators:
+                submission_file = cleaned
+                output = eval_csv if evaluator == "3A" else None
+                if evaluator == "3d":
+                    submission_file = artifact_path(os.path.join(work_dir, "3D Submissions.xlsx"))
+                    shutil.copy(cleaned, submission_file)
+                job = scheduler.Job(evaluator, evaluator, submission_file, paths["rubric"], output=output)
+                job.evaluator.CONFIG.update({"cascade_model": args.cascade_model, "dedup": args.dedup})
+                jobs.append(job)
+            logging.getLogger().setLevel(args.log_level)
+            timer.run("grade_scheduled", lambda: scheduler.run_jobs(jobs))
+        elif args.queue_workers:
+            import evaluate_3A
+            import workqueue
+            logging.getLogger().setLevel(args.log_level)
+            evaluate_3A.CONFIG.update({"rubric_file": paths["rubric"], "submission_file": cleaned, "output_csv": eval_csv})
+            db_path = os.path.join(work_dir, "grading_queue.db")
+
+            def grade_through_queue():
+                workqueue.enqueue(db_path, "3A")
+                workqueue.run_workers(db_path, args.queue_workers, poll_seconds=0.1)
+                workqueue.merge(db_path)
+            timer.run("grade_queue", grade_through_queue)
+        elif "3A" in args.evaluators:
+            import evaluate_3A
+            logging.getLogger().setLevel(args.log_level)
+            evaluate_3A.CONFIG.update({"rubric_file": paths["rubric"], "submission_file": cleaned, "output_csv": eval_csv,
+                                       "cascade_model": args.cascade_model, "dedup": args.dedup})
+            if args.hedge_report:
+                # The same grading run without and then with hedging, for their latency percentiles
+                CLIENT_CONFIG["hedge"] = False
+                timer.run("grade_3A", evaluate_3A.main)
+                CLIENT_CONFIG["hedge"] = True
+                timer.run("grade_3A_hedged", evaluate_3A.main)
+            else:
+                timer.run("grade_3A", evaluate_3A.main)
+        if "3d" in args.evaluators and not args.scheduler:
+            import evaluate_3d
+            logging.getLogger().setLevel(args.log_level)
+            workbook = artifact_path(os.path.join(work_dir, "3D Submissions.xlsx"))
+            shutil.copy(cleaned, workbook)
+            evaluate_3d.CONFIG.update({"rubric_file": paths["rubric"], "submission_file": workbook,
+                                       "cascade_model": args.cascade_model, "dedup": args.dedup,
+                                       "summary_mode": args.summary_mode})
+            timer.run("grade_3d", lambda: evaluate_3d.main(test_mode=False))
+
+        if os.path.exists(eval_csv):
+            from format_feedback import format_feedback
+            timer.run("format", lambda: format_feedback(eval_csv, paths["class_list"],
+                                                        os.path.join(work_dir, "Final_Formatted_Feedback.csv")))
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return timer
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on a synthetic cohort against a mock API.")
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--quizzes", type=int, default=2)
+    parser.add_argument("--questions", type=int, default=2, help="Written-response questions per rubric category")
+    parser.add_argument("--evaluators", default="3A,3d", help="Comma-separated evaluators to run (3A, 3d)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean mock API latency in seconds")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Mock delay between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="Grade with streamed, incrementally validated completions")
+    parser.add_argument("--summary-mode", choices=["raw", "categories"], default="raw",
+                        help="3d summaries from the raw answers or from the category evaluations")
+    parser.add_argument("--hedge", action="store_true", help="Hedge calls slower than their category's p95")
+    parser.add_argument("--hedge-budget", type=float, default=0.1, help="Most duplicate requests per call when hedging")
+    parser.add_argument("--hedge-report", action="store_true",
+                        help="Grade 3A twice, without and with hedging, to compare tail latency")
+    parser.add_argument("--cascade-model", help="Grade with this fast model first, escalating to gpt-4")
+    parser.add_argument("--sloppy-rate", type=float, default=0.0,
+                        help="Share of sloppy mock answers (out-of-band score or no quote) from the cascade model, or all models")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Share of students who hand in a teammate's written answers verbatim")
+    parser.add_argument("--dedup", action="store_true", help="Grade identical submissions once")
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai",
+                        help="Backend client to benchmark (both talk to the mock server)")
+    parser.add_argument("--concurrency", type=int, help="Requests in flight at once (default: the backend's setting)")
+    parser.add_argument("--scheduler", action="store_true",
+                        help="Grade the evaluators as jobs of one scheduled run instead of one after another")
+    parser.add_argument("--queue-workers", type=int,
+                        help="Grade 3A through the SQLite work queue with this many worker processes")
+    parser.add_argument("--ms-options", type=int, default=5, help="Options of each quiz's multi-select question")
+    parser.add_argument("--wide-multi-select", action="store_true",
+                        help="Clean multi-select answers into one 0/1 column per option instead of a bitmask")
+    parser.add_argument("--artifacts", choices=sorted(EXTENSIONS), default="xlsx",
+                        help="Format of the intermediate files between stages")
+    parser.add_argument("--artifact-report", action="store_true",
+                        help="Time writing and reading each intermediate in every format")
+    parser.add_argument("--retry-backoff", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory-budget", type=float,
+                        help="MB; clean and merge take their low-memory paths when projected above it")
+    parser.add_argument("--memory-report", help="Write per-stage peaks, top allocation sites and budget decisions here")
+    parser.add_argument("--memory-factors", help="Footprint factors file to load and update from the memory report")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip memory tracing (it slows stages down)")
+    parser.add_argument("--keep", help="Generate into this directory and keep it instead of a temp dir")
+    parser.add_argument("--json", help="Write stage results to this JSON file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    args.evaluators = [e.strip() for e in args.evaluators.split(",") if e.strip()]
+
+    timer = run_benchmark(args)
+    timer.print_report()
+    if timer.artifacts:
+        print()
+        print_artifact_report(timer.artifacts)
+    if args.memory_report:
+        MEMORY.report(args.memory_report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "json"}, "stages": timer.results,
+                       "artifacts": timer.artifacts}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Two-tier model cascade for category grading.
+
+With CONFIG["cascade_model"] set, an evaluator grades each category with that
+fast, cheap model first and only re-grades with CONFIG["model"] when the
+first pass is not usable:
+
+- invalid_json: the response could not be parsed into an evaluation
+- score_out_of_band: the score is outside the evaluator's CONFIG["score_band"]
+  (15–18 in evaluate_3d, whose prompt asks for that range) or not a number;
+  a blank score (the prompts' "insufficient data") is left as it is, and
+  evaluators whose band is None skip the check
+- no_quote: the feedback neither quotes nor echoes the student's own words
+
+Every first pass and escalation is recorded in METRICS, so the run summary
+reports how often (and why) the strong model was needed.
+"""
+import logging
+import re
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import METRICS
+
+# Consecutive words the feedback must share with the student's text when nothing is in quotation marks
+MIN_ECHOED_WORDS = 4
+
+_QUOTED = re.compile(r'["“”]([^"“”]+)["“”]')
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+def quotes_student(feedback: str, student_text: str) -> bool:
+    """True if the feedback quotes the student's text, or echoes MIN_ECHOED_WORDS of it verbatim."""
+    source = f" {_normalize(student_text)} "
+    for quote in _QUOTED.findall(str(feedback)):
+        quote = _normalize(quote)
+        if len(quote) >= 4 and f" {quote} " in source:
+            return True
+    words = _normalize(feedback).split()
+    for i in range(len(words) - MIN_ECHOED_WORDS + 1):
+        if f" {' '.join(words[i:i + MIN_ECHOED_WORDS])} " in source:
+            return True
+    return False
+
+def score_out_of_band(score, score_band: Optional[Tuple[float, float]]) -> bool:
+    """True if score is not a number within score_band; blank scores and a None band always pass."""
+    if score_band is None or score is None or str(score).strip() == "":
+        return False
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return True
+    return not score_band[0] <= score <= score_band[1]
+
+def escalation_reason(evaluation: Dict, parsed: bool, student_text: str,
+                      score_band: Optional[Tuple[float, float]] = None) -> Optional[str]:
+    """Why a first-pass evaluation should be re-graded by the strong model, or None if it is usable."""
+    if not parsed:
+        return "invalid_json"
+    if score_out_of_band(evaluation.get("score"), score_band):
+        return "score_out_of_band"
+    if student_text.strip() and not quotes_student(evaluation.get("feedback", ""), student_text):
+        return "no_quote"
+    return None
+
+def grade_with_cascade(student_id: str, category: str, student_text: str,
+                       grade: Callable[[str], Tuple[Dict, bool]], fast_model: str, strong_model: str,
+                       score_band: Optional[Tuple[float, float]] = None) -> Dict:
+    """Grade with fast_model and escalate to strong_model when the result fails the checks above.
+
+    grade(model) returns (evaluation, parsed) where parsed is False if the
+    evaluation is a fallback for an unparseable response. score_band is the
+    evaluator's CONFIG["score_band"].
+    """
+    try:
+        evaluation, parsed = grade(fast_model)
+        reason = escalation_reason(evaluation, parsed, student_text, score_band)
+    except Exception as e:
+        logging.warning(f"[{student_id} | {category}] First pass with {fast_model} failed: {str(e)}")
+        reason = "api_error"
+    METRICS.record_cascade(student_id, category, fast_model, reason)
+    if reason is None:
+        return evaluation
+    logging.info(f"[{student_id} | {category}] Escalating to {strong_model} ({reason})")
+    return grade(strong_model)[0]
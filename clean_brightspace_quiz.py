@@ -1,7 +1,119 @@
 import os
 import pandas as pd
 
-def clean_quiz_file(filepath):
+from artifacts import artifact_path, write_artifact
+from memory import over_budget
+from multiselect import MULTI_SELECT_ATTR, mask_column
+
+# Columns of the export that cleaning uses
+KEEP_COLUMNS = ['username', 'q #', 'q type', 'q text', 'answer', 'answer match']
+
+def iter_export_rows(filepath):
+    """Yield each row of an export as a dict of its section and KEEP_COLUMNS cells, with lower-cased names.
+
+    Streams the sheet with openpyxl's read-only mode, so no more than one row is held at a time.
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(col).lower().strip() if col is not None else "" for col in next(rows, ())]
+        wanted = [(i, col) for i, col in enumerate(header) if col in KEEP_COLUMNS or col == 'section #']
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            yield {col: row[i] if i < len(row) else None for i, col in wanted}
+    finally:
+        workbook.close()
+
+def widen_question(user_data, qtype, qtext, answers, matches, multi_select, compact_multi_select=True):
+    """Add one question's columns to a student's wide row, from the answer and answer match of its rows."""
+    if qtype == 'WR':
+        # Written Response
+        user_data[qtext] = answers[0]
+    elif qtype == 'MC':
+        # Multiple Choice - get checked answer
+        checked = [answer for answer, match in zip(answers, matches) if str(match).lower() == 'checked']
+        if checked:
+            user_data[qtext] = checked[0]
+    elif qtype == 'M-S' and compact_multi_select:
+        # Multi-Select - one bit per option, numbered in the order options are first seen
+        bits = multi_select.setdefault(qtext, {})
+        mask = 0
+        for answer, match in zip(answers, matches):
+            bit = bits.setdefault(str(answer), len(bits))
+            if str(match).lower() == 'checked':
+                mask |= 1 << bit
+        user_data[qtext] = mask
+    elif qtype == 'M-S':
+        # Multi-Select - make a column for each option
+        for answer, match in zip(answers, matches):
+            user_data[f"{qtext}: {answer}"] = 1 if str(match).lower() == 'checked' else 0
+    elif qtype == 'MSA':
+        # Each MSA row gets its own column, value from 'answer match'
+        for idx, match in enumerate(matches):
+            msa_col = f"{qtext} {idx+1}" if len(matches) > 1 else qtext
+            user_data[msa_col] = match
+
+def finish_wide(user_data_list, multi_select):
+    """The wide frame of the students' rows, with multi-select bitmask dtypes and option lists."""
+    wide = pd.DataFrame(user_data_list)
+    if multi_select:
+        specs = {qtext: list(bits) for qtext, bits in multi_select.items()}
+        for qtext, options in specs.items():
+            # From the row values, not the frame's column: unanswered rows would make it float and drop low bits
+            wide[qtext] = mask_column([row.get(qtext) for row in user_data_list], options, wide.index)
+        wide.attrs[MULTI_SELECT_ATTR] = specs
+    return wide
+
+def clean_export_streaming(filepath, compact_multi_select=True):
+    """clean_quiz_file for exports over the memory budget: widens the export as its rows stream in.
+
+    The long table is never built. Each row goes straight into its
+    student's question state, which keeps only what the wide row needs:
+    the first answer of a written response, the first checked option of a
+    multiple choice and every row of multi-select and MSA questions. The
+    states are turned into wide rows at the end, in the same order as the
+    in-memory path, so the result is the same.
+    """
+    questions = {}  # username -> {q #: (q type, q text, answers, answer matches)}
+    for row in iter_export_rows(filepath):
+        # Explainer rows have a section #
+        if row.get('section #') is not None:
+            continue
+        user_questions = questions.setdefault(row.get('username'), {})
+        if row.get('username') is None or row.get('q #') is None:
+            continue
+        qtype, _, answers, matches = user_questions.setdefault(
+            row['q #'], (row.get('q type'), row.get('q text'), [], []))
+        answer, match = row.get('answer'), row.get('answer match')
+        if qtype == 'WR' and answers:
+            continue
+        if qtype == 'MC' and (answers or str(match).lower() != 'checked'):
+            continue
+        answers.append(answer)
+        matches.append(match)
+
+    user_data_list = []
+    multi_select = {}  # question -> {option: bit}
+    for user, user_questions in questions.items():
+        user_data = {'username': user}
+        for qtype, qtext, answers, matches in user_questions.values():
+            widen_question(user_data, qtype, qtext, answers, matches, multi_select, compact_multi_select)
+        user_data_list.append(user_data)
+    return finish_wide(user_data_list, multi_select)
+
+def clean_quiz_file(filepath, compact_multi_select=True):
+    """Widen a Brightspace Attempt Details export to one row per student.
+
+    Multi-select answers become one bitmask column per question (see
+    multiselect.py) unless compact_multi_select is False, which gives the
+    old one 0/1 column per option. Exports projected to exceed the memory
+    budget are widened as they stream in (clean_export_streaming, see
+    memory.py).
+    """
+    if over_budget("clean", [filepath]):
+        return clean_export_streaming(filepath, compact_multi_select)
     df = pd.read_excel(filepath)
     # Make all columns lower-case and strip spaces for consistency
     df.columns = [col.lower().strip() for col in df.columns]
@@ -9,48 +121,32 @@ def clean_quiz_file(filepath):
     if 'section #' in df.columns:
         df = df[df['section #'].isna()]
     # 2. Keep only relevant columns
-    keep_cols = ['username', 'q #', 'q type', 'q text', 'answer', 'answer match']
-    df = df[[col for col in keep_cols if col in df.columns]]
+    df = df[[col for col in KEEP_COLUMNS if col in df.columns]]
 
     # 3. Pivot/widen data by Q Type using a list of dicts
     user_data_list = []
+    multi_select = {}  # question -> {option: bit}
     usernames = df['username'].unique()
     for user in usernames:
         user_rows = df[df['username'] == user]
         user_data = {'username': user}
         for qnum in user_rows['q #'].dropna().unique():
             qrows = user_rows[user_rows['q #'] == qnum]
-            qtype = qrows['q type'].iloc[0]
-            qtext = qrows['q text'].iloc[0]
-            if qtype == 'WR':
-                # Written Response
-                user_data[qtext] = qrows['answer'].iloc[0]
-            elif qtype == 'MC':
-                # Multiple Choice - get checked answer
-                checked = qrows[qrows['answer match'].str.lower() == 'checked']
-                if not checked.empty:
-                    user_data[qtext] = checked['answer'].iloc[0]
-            elif qtype == 'M-S':
-                # Multi-Select - make a column for each option
-                for _, row in qrows.iterrows():
-                    colname = f"{qtext}: {row['answer']}"
-                    user_data[colname] = 1 if str(row['answer match']).lower() == 'checked' else 0
-            elif qtype == 'MSA':
-                # Each MSA row gets its own column, value from 'answer match'
-                for idx, (_, msa_row) in enumerate(qrows.iterrows()):
-                    msa_col = f"{qtext} {idx+1}" if len(qrows) > 1 else qtext
-                    user_data[msa_col] = msa_row['answer match']
+            widen_question(user_data, qrows['q type'].iloc[0], qrows['q text'].iloc[0], qrows['answer'].tolist(),
+                           qrows['answer match'].tolist(), multi_select, compact_multi_select)
         user_data_list.append(user_data)
-    wide = pd.DataFrame(user_data_list)
-    return wide
+    return finish_wide(user_data_list, multi_select)
 
-if __name__ == "__main__":
-    data_dir = os.path.dirname(os.path.abspath(__file__))
-    # Example: Clean all quiz files in the directory except the class list
-    for fname in os.listdir(data_dir):
-        if fname.endswith('.xlsx') and not fname.startswith('00 Class List'):
+def clean_directory(data_dir):
+    """Clean every quiz export in data_dir, skipping the class list and already-cleaned files."""
+    for fname in sorted(os.listdir(data_dir)):
+        if fname.endswith('.xlsx') and not fname.startswith('00 Class List') and not fname.endswith('_CLEANED.xlsx'):
             print(f"Cleaning {fname}...")
             cleaned = clean_quiz_file(os.path.join(data_dir, fname))
-            outname = fname.replace('.xlsx', '_CLEANED.xlsx')
-            cleaned.to_excel(os.path.join(data_dir, outname), index=False)
+            outname = artifact_path(fname.replace('.xlsx', '_CLEANED.xlsx'))
+            write_artifact(cleaned, os.path.join(data_dir, outname))
             print(f"Saved cleaned file: {outname}")
+
+if __name__ == "__main__":
+    # Example: Clean all quiz files in the directory except the class list
+    clean_directory(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,379 @@
+"""Shared chat-completion call used by every evaluator.
+
+Sends requests through the backend named in CLIENT_CONFIG["backend"] (the
+hosted OpenAI API or a local server, see backends.py) with retries and
+records latency, token usage and retry counts in metrics.METRICS, labelled
+by student, category and the model that answered.
+
+With CLIENT_CONFIG["stream"] the completion is streamed and checked token by
+token with IncrementalJSONValidator: as soon as the output can no longer
+become a JSON object the stream is dropped and the request re-issued, and
+once the object closes nothing after it is read. Time to first token is
+recorded for streamed calls.
+
+With CLIENT_CONFIG["hedge"] a non-streamed call that is still waiting after
+the p95 latency observed for its category sends a duplicate request; the
+first response that holds a JSON object wins and the loser is cancelled: it
+sends no further attempts or retries. (The blocking client cannot abort a
+request already in flight, so that one finishes in the background and its
+answer is dropped.) Duplicates, and any retries the original sends while
+racing one, are capped at hedge_budget times the number of calls. Duplicates
+skip the backend's concurrency slots since the original request already
+holds one. Calls in a category without a threshold yet are sent directly.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from backends import ChatBackend, get_backend
+from metrics import METRICS, percentile
+from tracing import span
+
+# Settings shared by every evaluator; the CLI may override them
+CLIENT_CONFIG = {
+    "backend": "openai",  # a key of backends.BACKENDS
+    "max_retries": 2,
+    "retry_backoff": 2.0,  # seconds, doubled after each failed attempt
+    "stream": False,
+    "stream_max_reissues": 2,  # re-issues after an aborted stream; the last attempt is read to the end
+    "hedge": False,
+    "hedge_percentile": 95,  # a call waiting longer than this percentile of its category's latencies is hedged
+    "hedge_budget": 0.1,  # at most this many duplicate requests per call
+    "hedge_min_samples": 20,  # latencies to observe in a category before hedging it
+}
+
+# Characters that may appear outside strings in a JSON object (numbers, literals, punctuation)
+_JSON_BARE_CHARS = set("0123456789+-.eE" "truefalsn" ",: \t\r\n")
+_CODE_FENCE = "```json"
+
+class IncrementalJSONValidator:
+    """Tracks whether a partially received completion can still become one JSON object.
+
+    Leading whitespace and a ```json code fence are allowed before the opening
+    brace. The check is structural (strings, escapes, bracket nesting and the
+    characters allowed between tokens); the finished object is confirmed with
+    json.loads.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.state = "pending"  # pending | complete | invalid
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, piece: str) -> str:
+        """Add streamed text and return the new state."""
+        self.text += piece
+        while self._pos < len(self.text) and self.state == "pending":
+            self._step(self.text[self._pos])
+            self._pos += 1
+        return self.state
+
+    def _step(self, ch: str):
+        if self._start is None:
+            if ch == "{":
+                self._start = self._pos
+                self._stack.append("}")
+            elif not ch.isspace():
+                prefix = self.text[:self._pos + 1].strip().lower()
+                if not _CODE_FENCE.startswith(prefix):
+                    self.state = "invalid"
+            return
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            elif ord(ch) < 0x20:
+                self.state = "invalid"
+            return
+        if ch == '"':
+            self._in_string = True
+        elif ch in "{[":
+            self._stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not self._stack or self._stack.pop() != ch:
+                self.state = "invalid"
+            elif not self._stack:
+                self._end = self._pos + 1
+                try:
+                    json.loads(self.json_text())
+                    self.state = "complete"
+                except json.JSONDecodeError:
+                    self.state = "invalid"
+        elif ch not in _JSON_BARE_CHARS:
+            self.state = "invalid"
+
+    def json_text(self) -> str:
+        """The JSON object received so far (everything from the opening brace)."""
+        if self._start is None:
+            return ""
+        return self.text[self._start:self._end]
+
+class HedgePolicy:
+    """Rolling per-category request latencies and the duplicate-request budget."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies: Dict[str, Deque[float]] = {}
+            self.calls = 0
+            self.hedges = 0
+
+    def observe(self, category: str, latency: float):
+        """Record the latency of one successful request (original or duplicate)."""
+        with self._lock:
+            self.latencies.setdefault(category, deque(maxlen=self.window)).append(latency)
+
+    def threshold(self, category: str) -> Optional[float]:
+        """Seconds after which a call in category is hedged, or None until enough latencies are known."""
+        with self._lock:
+            self.calls += 1
+            observed = list(self.latencies.get(category, ()))
+        if len(observed) < CLIENT_CONFIG["hedge_min_samples"]:
+            return None
+        return percentile(observed, CLIENT_CONFIG["hedge_percentile"])
+
+    def charge(self):
+        """Count an extra request sent while racing a duplicate, whether or not the budget allows it."""
+        with self._lock:
+            self.hedges += 1
+
+    def spend(self) -> bool:
+        """Take one duplicate request from the budget; False once it is used up."""
+        with self._lock:
+            if self.hedges + 1 > CLIENT_CONFIG["hedge_budget"] * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+HEDGING = HedgePolicy()
+
+class HedgeCancelled(Exception):
+    """Raised instead of sending another attempt once a hedged call's race is decided."""
+
+_HEDGE_POOL: Optional[ThreadPoolExecutor] = None
+_HEDGE_POOL_LOCK = threading.Lock()
+
+def active_backend() -> ChatBackend:
+    """The backend selected in CLIENT_CONFIG."""
+    return get_backend(CLIENT_CONFIG["backend"])
+
+def _call_with_retries(student_id: str, category: str, call: Callable, attempt_label: str = "chat_completion",
+                       sleep: Callable[[float], object] = time.sleep) -> Tuple[object, int]:
+    """Run call(), retrying exceptions with exponential backoff; returns (result, retries used).
+
+    sleep waits out the backoff; a hedged call passes one that returns early
+    when its race is decided.
+    """
+    retries = 0
+    while True:
+        try:
+            with span(attempt_label, "api", student=student_id, category=category, attempt=retries + 1):
+                return call(), retries
+        except Exception as e:
+            if isinstance(e, HedgeCancelled) or retries >= CLIENT_CONFIG["max_retries"]:
+                e.retries = retries
+                raise
+            delay = CLIENT_CONFIG["retry_backoff"] * (2 ** retries)
+            retries += 1
+            logging.warning(f"[{student_id} | {category}] API call failed ({str(e)}); retry {retries} in {delay:.0f}s")
+            sleep(delay)
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    """Threads that carry hedged calls; reused so each keeps its HTTP connection open."""
+    global _HEDGE_POOL
+    with _HEDGE_POOL_LOCK:
+        if _HEDGE_POOL is None:
+            _HEDGE_POOL = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+        return _HEDGE_POOL
+
+def _holds_json(response) -> bool:
+    validator = IncrementalJSONValidator()
+    return validator.feed(response["choices"][0]["message"]["content"] or "") == "complete"
+
+def _hedged_call(student_id: str, category: str, send: Callable[[bool], object]) -> Tuple[object, int, bool]:
+    """Send a request, duplicating it once it outlasts the category's hedge threshold.
+
+    send(slot) performs one request. Returns (response, retries, hedged) from
+    the first response holding a JSON object, or the original's outcome when
+    neither does. Once the race is decided the loser sends nothing more.
+    """
+    def timed(fn: Callable) -> Callable:
+        def call():
+            start = time.perf_counter()
+            result = fn()
+            HEDGING.observe(category, time.perf_counter() - start)
+            return result
+        return call
+
+    threshold = HEDGING.threshold(category)
+    if threshold is None:
+        return (*_call_with_retries(student_id, category, timed(lambda: send(True))), False)
+
+    decided = threading.Event()
+    hedge_sent = threading.Event()
+
+    def attempt(slot: bool) -> Callable:
+        def call():
+            if decided.is_set():
+                raise HedgeCancelled(f"[{student_id} | {category}] race already decided")
+            if slot and hedge_sent.is_set():
+                # A retry of the original while the duplicate is out is an extra request too
+                HEDGING.charge()
+            return send(slot)
+        return timed(call)
+
+    original = _hedge_pool().submit(lambda: _call_with_retries(student_id, category, attempt(True), sleep=decided.wait))
+    if wait([original], timeout=threshold).done or not HEDGING.spend():
+        return (*original.result(), False)
+
+    logging.info(f"[{student_id} | {category}] No response after {threshold:.2f}s; sending a hedged request")
+    hedge_sent.set()
+    duplicate = _hedge_pool().submit(lambda: (attempt(False)(), 0))
+    racing = {original: "original", duplicate: "hedge"}
+    answered = None
+    try:
+        while racing:
+            done, _ = wait(racing, return_when=FIRST_COMPLETED)
+            for future in done:
+                sender = racing.pop(future)
+                if future.exception() is not None:
+                    continue
+                if _holds_json(future.result()[0]):
+                    METRICS.record_hedge(student_id, category, won=sender == "hedge")
+                    return (*future.result(), True)
+                answered = answered or future
+    finally:
+        # Stops the loser's retries (and the duplicate, if it has not been sent yet)
+        decided.set()
+    METRICS.record_hedge(student_id, category, won=False)
+    # Neither answer is JSON: hand back whichever arrived so the evaluator's fallback applies
+    return (*(answered or original).result(), True)
+
+def create_chat_completion(student_id: str, category: str, model: str, messages: List[Dict], temperature: float = 0.7) -> str:
+    """Call the chat completions API and return the assistant message content.
+
+    Transient failures are retried and the call is recorded in METRICS. When
+    CLIENT_CONFIG["stream"] is set the response is streamed and validated
+    incrementally (see stream_chat_completion); otherwise, with
+    CLIENT_CONFIG["hedge"], slow calls are hedged (see _hedged_call).
+    """
+    if CLIENT_CONFIG["stream"]:
+        return stream_chat_completion(student_id, category, model, messages, temperature)
+
+    backend = active_backend()
+    model = backend.resolve_model(model)
+    start = time.perf_counter()
+    send = lambda slot=True: backend.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        slot=slot
+    )
+    try:
+        if CLIENT_CONFIG["hedge"]:
+            response, retries, _ = _hedged_call(student_id, category, send)
+        else:
+            response, retries = _call_with_retries(student_id, category, send)
+    except Exception as e:
+        METRICS.record_call(student_id, category, model, time.perf_counter() - start,
+                            retries=getattr(e, "retries", 0), succeeded=False)
+        raise
+
+    usage = response.get('usage', {})
+    # Providers report the part of the prompt served from their prefix cache here
+    cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+    METRICS.record_call(
+        student_id, category, model, time.perf_counter() - start,
+        prompt_tokens=usage.get('prompt_tokens', 0),
+        completion_tokens=usage.get('completion_tokens', 0),
+        retries=retries,
+        cached_tokens=cached_tokens
+    )
+    logging.info(f"[{student_id} | {category}] Token usage — prompt: {usage.get('prompt_tokens', 0)} (cached: {cached_tokens}), completion: {usage.get('completion_tokens', 0)}, total: {usage.get('total_tokens', 0)}")
+    return response.choices[0].message.content
+
+def stream_chat_completion(student_id: str, category: str, model: str, messages: List[Dict], temperature: float = 0.7) -> str:
+    """Stream a completion, aborting and re-issuing it as soon as it cannot become a JSON object.
+
+    Returns the JSON object text once it closes (anything generated after it is
+    not read). If every attempt drifts out of JSON, the final attempt is read
+    to the end and returned as-is so the evaluator's usual fallback applies.
+    Streamed responses carry no usage block, so token counts are estimated at
+    four characters per token.
+    """
+    backend = active_backend()
+    model = backend.resolve_model(model)
+    start = time.perf_counter()
+    prompt_chars = sum(len(m.get("content", "")) for m in messages)
+    attempts = CLIENT_CONFIG["stream_max_reissues"] + 1
+    ttft = None
+    completion_chars = 0
+    retries = 0
+    aborted = 0
+    content = ""
+
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        attempt_start = time.perf_counter()
+        try:
+            stream, attempt_retries = _call_with_retries(student_id, category, lambda: backend.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True
+            ), attempt_label="chat_completion_stream")
+        except Exception as e:
+            METRICS.record_call(student_id, category, model, time.perf_counter() - start,
+                                prompt_tokens=prompt_chars * attempt // 4, completion_tokens=completion_chars // 4,
+                                retries=retries + getattr(e, "retries", 0), succeeded=False,
+                                ttft=ttft, aborted_streams=aborted)
+            raise
+        retries += attempt_retries
+
+        validator = IncrementalJSONValidator()
+        with span("read_stream", "api", student=student_id, category=category, attempt=attempt + 1):
+            for chunk in stream:
+                piece = chunk["choices"][0].get("delta", {}).get("content") or ""
+                if not piece:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - attempt_start
+                completion_chars += len(piece)
+                state = validator.feed(piece)
+                if state == "complete" or (state == "invalid" and not last_attempt):
+                    break
+            stream.close()
+
+        if validator.state == "complete":
+            content = validator.json_text()
+            break
+        if validator.state == "invalid" and not last_attempt:
+            aborted += 1
+            logging.warning(f"[{student_id} | {category}] Streamed output left JSON format after {len(validator.text)} chars; re-issuing: {validator.text[:50]}...")
+            continue
+        content = validator.text
+        break
+
+    prompt_tokens = prompt_chars * (attempt + 1) // 4
+    completion_tokens = completion_chars // 4
+    METRICS.record_call(student_id, category, model, time.perf_counter() - start,
+                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                        retries=retries, ttft=ttft, aborted_streams=aborted)
+    logging.info(f"[{student_id} | {category}] Streamed — first token: {ttft or 0:.2f}s, aborted: {aborted}, est. tokens prompt: {prompt_tokens}, completion: {completion_tokens}")
+    return content
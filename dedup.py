@@ -0,0 +1,87 @@
+"""Grade identical team submissions once.
+
+Teammates often submit the same text. With CONFIG["dedup"] set, an evaluator
+run (main(), a scheduler job, a queue worker's job or a regrade pass) creates
+its own PayloadCache (payload_cache), hashes each category prompt (which holds the category and the student's
+normalized responses) and grades every unique payload once; the result is
+copied to each other username with the same payload. With
+CONFIG["team_column"] (e.g. "Team Number", added by merge_team_number)
+payloads are only shared within a team.
+
+Placeholder results (failed calls) are not reused, so the next teammate with
+the same payload gets a fresh attempt.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from metrics import METRICS
+
+def normalize_payload(text: str) -> str:
+    """Lower-case the text and collapse whitespace so trivially different copies match."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+def payload_key(payload: str, team=None) -> str:
+    """SHA-256 of the normalized payload, scoped to a team when one is given."""
+    if team is None or (isinstance(team, float) and math.isnan(team)):
+        team = ""
+    return hashlib.sha256(f"{team}\x00{normalize_payload(payload)}".encode()).hexdigest()
+
+class PayloadCache:
+    """Thread-safe map from payload hash to its grading result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every graded payload."""
+        with self._lock:
+            self._results: Dict[str, Future] = {}
+
+    def grade(self, student_id: str, category: str, payload: str, grade: Callable[[], object],
+              team=None, cacheable: Callable[[object], bool] = lambda result: True):
+        """Return the result for payload, calling grade() only if no earlier student had the same payload.
+
+        A concurrent caller with the same payload waits for the first one's result.
+        """
+        key = payload_key(payload, team)
+        with self._lock:
+            future: Optional[Future] = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+        if not owner:
+            result = future.result()
+            if result is not None:
+                METRICS.record_dedup(student_id, category, reused=True)
+                logging.info(f"[{student_id} | {category}] Reusing the grade of an identical submission")
+                return dict(result) if isinstance(result, dict) else result
+            # The first attempt failed; grade this copy ourselves
+            return self.grade(student_id, category, payload, grade, team, cacheable)
+
+        METRICS.record_dedup(student_id, category, reused=False)
+        try:
+            result = grade()
+        except BaseException:
+            self._forget(key, future)
+            raise
+        if cacheable(result):
+            future.set_result(result)
+        else:
+            self._forget(key, future)
+        return result
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            if self._results.get(key) is future:
+                del self._results[key]
+        future.set_result(None)
+
+def payload_cache(config: Dict) -> Optional[PayloadCache]:
+    """A fresh cache for one run if config["dedup"] is set, else None (no dedup)."""
+    return PayloadCache() if config["dedup"] else None
@@ -4,7 +4,21 @@ from dotenv import load_dotenv
 import os
 import json
 import logging
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
+
+from artifacts import artifact_path, read_artifact
+from cascade import grade_with_cascade
+from completions import active_backend, create_chat_completion
+from dedup import PayloadCache, payload_cache
+from incremental import FingerprintStore, fingerprint, fingerprint_store
+from metrics import METRICS
+from multiselect import expand_multi_select
+from prompt_compiler import PromptCompiler
+from grading import is_failed, run_concurrently
+from results_table import SUMMARY_CATEGORY, ResultsTable, apply_results, total_scores
+from student_records import ResponsesView, StudentRecord, build_record
+from tracing import TRACER, span, traced
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,9 +30,19 @@ CONFIG = {
     "submission_file": "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/Data Files/00 Process/3D – Prototype Testing  Quiz Process.xlsx",
     "rubric_file": "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/Data Files/00 Process/2025_05_Rubric_Table.xlsx",
     "output_file": "MGMT4901_3D_Evaluation_OutputR1.csv",
+    "output_workbook": None,  # None writes the graded workbook back over submission_file (as .xlsx)
     "id_column": "username",
     "rubric_sheet": "Rubric",
-    "model": "gpt-4"
+    "model": "gpt-4",
+    "cascade_model": None,  # optional fast first-pass model; escalates to "model" when needed (see cascade.py)
+    "score_band": (15, 18), # scores the prompt asks for; the cascade re-grades others (None: no check)
+    "dedup": False,         # grade identical submissions once (see dedup.py)
+    "team_column": None,    # with dedup, only share grades within this column's teams, e.g. "Team Number"
+    "incremental": False,   # only grade answers that changed since the last run (see incremental.py)
+    "summary_mode": "raw",  # "categories" summarizes the category evaluations instead of the raw answers
+    "metrics_json": None,  # optional path for the run metrics summary
+    "metrics_prom": None,  # optional path for a Prometheus textfile
+    "trace_file": None     # optional path for a Chrome trace-event JSON of the run
 }
 
 # System and prompt templates - Token efficient version
@@ -54,32 +78,77 @@ Use these style guidelines:
 
 IMPORTANT: Always return a valid JSON object with no additional text or explanations outside the JSON."""
 
-RUBRIC_PROMPT_TEMPLATE = """Evaluate student's {category} submission.
+# Static part of each prompt first (rendered once per category), student content last,
+# so every request for a category shares a byte-identical prefix for provider caching
+RUBRIC_PROMPT_PREFIX_TEMPLATE = """Evaluate student's {category} submission.
 
 Rubric: {rubric_items}
-Guidance: {professor_guidance}
-Response: {responses}
 
 JSON only: {{"rubric_category": "{category}", "feedback": "Your feedback", "score": "XX"}}
+
+"""
+
+RUBRIC_PROMPT_STUDENT_TEMPLATE = """Guidance: {professor_guidance}
+Response: {responses}
 """
 
 # Summary prompt template
-SUMMARY_PROMPT_TEMPLATE = """Summarize student's prototype testing approach.
+SUMMARY_PROMPT_PREFIX = """Summarize student's prototype testing approach.
+
+Mention: prototype type, testing method, hypothesis validation. Quote student directly.
+
+JSON only: {"feedback": "Your summary", "score": "XX"}
+
+"""
 
-Guidance: {professor_guidance}
+SUMMARY_PROMPT_STUDENT_TEMPLATE = """Guidance: {professor_guidance}
 Submissions: {responses}
 Prototype content: {prototype_testing_content}
+"""
 
-Mention: prototype type, testing method, hypothesis validation. Quote student directly.
+# Summary built from the category evaluations (summary_mode "categories"): their
+# feedback already quotes the student, so the raw answers need not be re-sent
+CATEGORY_SUMMARY_PROMPT_PREFIX = """Summarize student's prototype testing approach from these category evaluations.
+
+Mention: prototype type, testing method, hypothesis validation. Reuse the student quotes in the evaluations.
+
+JSON only: {"feedback": "Your summary", "score": "XX"}
 
-JSON only: {{"feedback": "Your summary", "score": "XX"}}
 """
 
+CATEGORY_SUMMARY_STUDENT_TEMPLATE = """Guidance: {professor_guidance}
+Evaluations:
+{evaluations}
+"""
+
+SUMMARY_MODES = ("raw", "categories")
+
+# Mapping of category names to the workbook's output column names
+FEEDBACK_COLUMNS = {
+    "Capstone Execution": "Capstone Execution Feedback",
+    "Theory Development": "Theory Development Feedback",
+    "Hypothesis Development": "Hypothesis Development Feedback",
+    "Hypothesis Testing": "Hypothesis Testing Feedback",
+    "Evaluation / Decision": "Evaluation / Decision Feedback"
+}
+
+SCORE_COLUMNS = {
+    "Capstone Execution": "Capstone Execution Score (on 20)",
+    "Theory Development": "Theory Development Score (on 20)",
+    "Hypothesis Development": "Hypothesis Development Score (on 20)",
+    "Hypothesis Testing": "Hypothesis Testing Score (on 20)",
+    "Evaluation / Decision": "Evaluation / Decision Score (on 20)"
+}
+
+OUTPUT_COLUMNS = ["Summary Feedback", "Total Score"] + list(FEEDBACK_COLUMNS.values()) + list(SCORE_COLUMNS.values())
+
+@traced("load_rubric")
 def load_rubric() -> Dict[str, List[Dict]]:
     """Load rubric from Excel file and enhance with prototype testing criteria."""
     try:
         # Load rubric data from Excel file
-        rubric_df = pd.read_excel(CONFIG["rubric_file"], sheet_name=CONFIG["rubric_sheet"])
+        with span("read_excel", file=CONFIG["rubric_file"]):
+            rubric_df = pd.read_excel(CONFIG["rubric_file"], sheet_name=CONFIG["rubric_sheet"])
         
         # Group by category and convert to list of dictionaries
         rubric_by_category = {}
@@ -112,42 +181,90 @@ def collect_category_responses(student_responses: Dict, category: str) -> str:
     
     # Extract category prefix (e.g., "Evaluation" from "Evaluation / Decision")
     category_prefix = category.split(" ")[0]
+    # Match if full category name is in column OR if the column starts with the category prefix
+    matches = lambda col: category in col or col.startswith(category_prefix)
+    
+    if isinstance(student_responses, StudentRecord):
+        ids = student_responses.columns.select(("category", category), matches)
+        return "\n".join(r.strip() for r in student_responses.take(ids) if isinstance(r, str))
     
     for col, response in student_responses.items():
-        # Match if full category name is in column OR if the column starts with the category prefix
-        if isinstance(response, str) and (category in col or col.startswith(category_prefix)):
+        if isinstance(response, str) and matches(col):
             responses.append(response.strip())
             
     return "\n".join(responses)
 
-def create_prompt(category: str, rubric_items: List[Dict], student_responses: Dict) -> str:
-    """Create the evaluation prompt for OpenAI API."""
+def render_prompt_prefix(category: str, rubric_items: List[Dict]) -> str:
+    """Render the static part of a category prompt (rubric items and JSON format)."""
+    if category == "SUMMARY":
+        return SUMMARY_PROMPT_PREFIX
+    if category == "CATEGORY_SUMMARY":
+        return CATEGORY_SUMMARY_PROMPT_PREFIX
     # Use only key rubric items to reduce tokens
     rubric_items_str = "; ".join(item['item'].split(":")[0] for item in rubric_items[:2])
-    
+    return RUBRIC_PROMPT_PREFIX_TEMPLATE.format(category=category, rubric_items=rubric_items_str)
+
+PROMPTS = PromptCompiler(render_prompt_prefix, SYSTEM_PROMPT)
+
+@traced("create_prompt")
+def create_prompt(category: str, rubric_items: List[Dict], student_responses: Dict) -> str:
+    """Create the evaluation prompt for OpenAI API."""
     # Get professor feedback, or use a placeholder if not available
     professor_feedback = student_responses.get('Professor Feedback', '')
     professor_guidance = professor_feedback if professor_feedback else "None provided yet."
     
-    # Create the prompt
-    prompt = RUBRIC_PROMPT_TEMPLATE.format(
-        category=category,
-        rubric_items=rubric_items_str,
+    # Append the student's content to the category's precompiled prefix
+    return PROMPTS.build(category, rubric_items, RUBRIC_PROMPT_STUDENT_TEMPLATE.format(
         professor_guidance=professor_guidance,
         responses=student_responses.get('responses', '')
-    )
-    
-    return prompt
+    ))
 
-def evaluate_category(student_id: str, category: str, rubric_items: List[Dict], student_responses: Dict) -> Dict:
-    """Evaluate a single rubric category for a student and return a dictionary with feedback and score."""
+@traced("evaluate_category")
+def evaluate_category(student_id: str, category: str, rubric_items: List[Dict], student_responses: Dict,
+                      payloads: Optional[PayloadCache] = None, fingerprints: Optional[FingerprintStore] = None) -> Dict:
+    """Evaluate a single rubric category for a student and return a dictionary with feedback and score.
+
+    Identical payloads are graded once through payloads, and unchanged ones
+    get the previous run's result from fingerprints, when those are given.
+    """
     try:
         # Create the prompt
         prompt = create_prompt(category, rubric_items, student_responses)
-        
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model=CONFIG["model"],
+    except Exception as e:
+        logging.error(f"Error processing evaluation for student {student_id}, category {category}: {str(e)}")
+        return {
+            "rubric_category": category,
+            "feedback": f"Error processing evaluation for {category}. Please try again.",
+            "score": ""
+        }
+    
+    def grade(model: str) -> Tuple[Dict, bool]:
+        return grade_category(student_id, category, prompt, model)
+    
+    def grade_payload() -> Dict:
+        if CONFIG["cascade_model"]:
+            return grade_with_cascade(student_id, category, student_responses.get('responses', ''), grade,
+                                      CONFIG["cascade_model"], CONFIG["model"],
+                                      CONFIG["score_band"])
+        return grade(CONFIG["model"])[0]
+    
+    def grade_result() -> Dict:
+        if payloads is None:
+            return grade_payload()
+        return payloads.grade(student_id, category, prompt, grade_payload, team=student_team(student_responses),
+                              cacheable=lambda e: not is_failed(e["feedback"], e["score"]))
+    
+    if fingerprints is None:
+        return grade_result()
+    return fingerprints.grade(student_id, category, fingerprint(prompt, CONFIG["model"], CONFIG["cascade_model"]),
+                              grade_result, cacheable=lambda e: not is_failed(e["feedback"], e["score"]))
+
+def grade_category(student_id: str, category: str, prompt: str, model: str) -> Tuple[Dict, bool]:
+    """Grade one category prompt with model; returns (evaluation, parsed), with parsed False for placeholders."""
+    try:
+        # Call OpenAI API (token usage is logged and recorded by create_chat_completion)
+        content = create_chat_completion(
+            student_id, category, model,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
@@ -155,60 +272,59 @@ def evaluate_category(student_id: str, category: str, rubric_items: List[Dict],
             temperature=0.7
         )
         
-        # Log token usage
-        usage = response['usage']
-        logging.info(f"[{student_id} | {category}] Token usage — prompt: {usage['prompt_tokens']}, completion: {usage['completion_tokens']}, total: {usage['total_tokens']}")
-        
         # Extract JSON from the response with enhanced error handling
-        content = response.choices[0].message.content
         
-        # Add additional sanitizing to help with common JSON errors
-        try:
-            # Log the raw content for debugging
-            logging.debug(f"Raw API response for {student_id}, category {category}: {content}")
+        with span("parse_json", student=student_id, category=category):
+            # Add additional sanitizing to help with common JSON errors
+            try:
+                # Log the raw content for debugging
+                logging.debug(f"Raw API response for {student_id}, category {category}: {content}")
             
-            # Check if we have a properly formatted JSON response (must start with { and end with })
-            content = content.strip()
-            if not (content.startswith('{') and content.endswith('}')):
-                logging.warning(f"Response not valid JSON format: {content[:50]}...")
-                # Try to extract a JSON object if it exists within the text
-                json_start = content.find('{')
-                json_end = content.rfind('}')
+                # Check if we have a properly formatted JSON response (must start with { and end with })
+                content = content.strip()
+                if not (content.startswith('{') and content.endswith('}')):
+                    logging.warning(f"Response not valid JSON format: {content[:50]}...")
+                    # Try to extract a JSON object if it exists within the text
+                    json_start = content.find('{')
+                    json_end = content.rfind('}')
                 
-                if json_start >= 0 and json_end > json_start:
-                    content = content[json_start:json_end+1]
-                    logging.info(f"Extracted JSON content: {content[:50]}...")
-                else:
-                    raise ValueError("Could not extract valid JSON from response")
+                    if json_start >= 0 and json_end > json_start:
+                        content = content[json_start:json_end+1]
+                        logging.info(f"Extracted JSON content: {content[:50]}...")
+                    else:
+                        raise ValueError("Could not extract valid JSON from response")
             
-            result = json.loads(content)
+                result = json.loads(content)
             
-            # Validate the response
-            if 'rubric_category' not in result or 'feedback' not in result or 'score' not in result:
-                logging.warning(f"Missing required fields in response for {student_id}, category {category}")
+                # Validate the response
+                if 'rubric_category' not in result or 'feedback' not in result or 'score' not in result:
+                    logging.warning(f"Missing required fields in response for {student_id}, category {category}")
+                    METRICS.record_parse_failure(student_id, category, model)
+                    return {
+                        "rubric_category": category,
+                        "feedback": f"Error processing evaluation for {category}. Please try again.",
+                        "score": ""
+                    }, False
+                
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.error(f"JSON parsing error for {student_id}, category {category}: {str(e)}\nContent: {content[:200]}")
+                METRICS.record_parse_failure(student_id, category, model)
                 return {
                     "rubric_category": category,
                     "feedback": f"Error processing evaluation for {category}. Please try again.",
                     "score": ""
-                }
-                
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON parsing error for {student_id}, category {category}: {str(e)}\nContent: {content[:200]}")
-            return {
-                "rubric_category": category,
-                "feedback": f"Error processing evaluation for {category}. Please try again.",
-                "score": ""
-            }
+                }, False
             
-        return result
+        return result, True
     except Exception as e:
         logging.error(f"Error processing evaluation for student {student_id}, category {category}: {str(e)}")
         return {
             "rubric_category": category,
             "feedback": f"Error processing evaluation for {category}. Please try again.",
             "score": ""
-        }
+        }, False
 
+@traced("create_summary_prompt")
 def create_summary_prompt(student_responses: Dict) -> str:
     """Create the summary prompt for OpenAI API with professor guidance."""
     # Get professor feedback if available
@@ -219,14 +335,19 @@ def create_summary_prompt(student_responses: Dict) -> str:
     prototype_testing_details = []
     
     # Look for columns related to Hypothesis Testing or including 'prototype' keyword
-    for col, val in student_responses.items():
-        if isinstance(val, str) and val.strip() and (
-            "Hypothesis Testing" in col 
-            or "prototype" in col.lower() 
-            or "test" in col.lower() 
-            or col.startswith("Evaluation")
-        ):
-            prototype_testing_details.append(val)
+    is_testing_column = lambda col: (
+        "Hypothesis Testing" in col 
+        or "prototype" in col.lower() 
+        or "test" in col.lower() 
+        or col.startswith("Evaluation")
+    )
+    if isinstance(student_responses, StudentRecord):
+        ids = student_responses.columns.select("summary_testing", is_testing_column)
+        prototype_testing_details = [v for v in student_responses.take(ids) if isinstance(v, str)]
+    else:
+        for col, val in student_responses.items():
+            if isinstance(val, str) and val.strip() and is_testing_column(col):
+                prototype_testing_details.append(val)
             
     prototype_testing_content = "\n".join(prototype_testing_details)
     
@@ -236,70 +357,151 @@ def create_summary_prompt(student_responses: Dict) -> str:
     
     # Format the prompt - more token efficient by removing redundant column names
     all_responses = "\n".join(v for k, v in student_responses.items() if k != 'Professor Feedback' and isinstance(v, str) and v.strip())
-    prompt = SUMMARY_PROMPT_TEMPLATE.format(
+    return PROMPTS.build("SUMMARY", [], SUMMARY_PROMPT_STUDENT_TEMPLATE.format(
         professor_guidance=professor_guidance,
         responses=all_responses,
         prototype_testing_content=prototype_testing_content
+    ))
+
+def create_category_summary_prompt(student_responses: Dict, category_results: Dict[str, Dict]) -> str:
+    """Create the summary prompt from the category evaluations ({category: {"feedback", "score"}})."""
+    professor_feedback = student_responses.get('Professor Feedback', '')
+    professor_guidance = professor_feedback if professor_feedback else "None provided yet."
+    evaluations = "\n".join(
+        f"- {category} ({result['score']}/20): {result['feedback']}" if str(result["score"]).strip()
+        else f"- {category}: {result['feedback']}"
+        for category, result in category_results.items()
     )
-    
-    return prompt
+    return PROMPTS.build("CATEGORY_SUMMARY", [], CATEGORY_SUMMARY_STUDENT_TEMPLATE.format(
+        professor_guidance=professor_guidance,
+        evaluations=evaluations
+    ))
 
-def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submission_df: pd.DataFrame, row_index: int) -> Dict:
-    """Evaluate all rubric categories for a single student and return a dictionary of results.
-    
-    Args:
-        student_id: Student identifier
-        rubric_by_category: Dictionary of rubric categories and items
-        submission_df: DataFrame with student submissions
-        row_index: Row index for this student in the DataFrame
+def summary_prompt_for(student_id: str, student_responses: Dict, category_results: Optional[Dict[str, Dict]] = None) -> str:
+    """The summary prompt for the configured summary_mode.
+
+    "categories" summarizes category_results, falling back to the raw answers
+    when they are missing or any of them failed.
     """
-    # Extract student's responses
-    student_row = submission_df.iloc[row_index].to_dict()
+    if CONFIG["summary_mode"] == "categories":
+        usable = bool(category_results) and not any(is_failed(r["feedback"], r["score"]) for r in category_results.values())
+        if usable:
+            return create_category_summary_prompt(student_responses, category_results)
+        logging.info(f"[{student_id} | SUMMARY] Category results incomplete; summarizing the raw answers")
+    return create_summary_prompt(student_responses)
+
+def normalize_column_map(column_map: Dict[str, str], all_columns: List[str]) -> Dict[str, str]:
+    """Match each output column to the workbook, accepting "/" without surrounding spaces."""
+    normalized_map = {}
+    for category, column in column_map.items():
+        # Find best matching column
+        normalized_col = column.replace(" / ", "/")
+        if normalized_col in all_columns:
+            normalized_map[category] = normalized_col
+        elif column in all_columns:
+            normalized_map[category] = column
+        else:
+            logging.warning(f"Could not find column matching '{column}' or '{normalized_col}'")
     
-    # Collect student responses
-    student_responses = {}
-    for col, val in student_row.items():
-        if pd.notna(val) and isinstance(val, str) and val.strip():
-            student_responses[col] = val
+    # Use normalized column names if found
+    if normalized_map:
+        logging.info(f"Using normalized column names: {normalized_map}")
+        return normalized_map
+    return column_map
+
+def score_column(values: pd.Series) -> pd.Series:
+    """values as float64 if every filled cell is a number; otherwise as they were, so notes a TA typed survive."""
+    numbers = pd.to_numeric(values, errors="coerce")
+    typed = values.notna() & values.astype(str).str.strip().ne("") & numbers.isna()
+    if typed.any():
+        logging.warning(f"Keeping {int(typed.sum())} non-numeric cells in '{values.name}' "
+                        f"(e.g. {values[typed].iloc[0]!r}); only the cells this run grades are overwritten")
+        return values.astype(object)
+    return numbers.astype("float64")
+
+def prepare_output_columns(submission_df: pd.DataFrame) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Add any missing output columns and return the (feedback, score) column maps for the workbook."""
+    # Add any missing columns to the dataframe
+    for col in OUTPUT_COLUMNS:
+        if col not in submission_df.columns:
+            submission_df[col] = pd.NA
+    # Give each output column one clean dtype; score columns holding hand-entered text keep it
+    text_columns = ["Summary Feedback"] + list(FEEDBACK_COLUMNS.values())
+    submission_df[text_columns] = submission_df[text_columns].astype("string")
+    for col in SCORE_COLUMNS.values():
+        submission_df[col] = score_column(submission_df[col])
+    submission_df["Total Score"] = pd.to_numeric(submission_df["Total Score"], errors="coerce").round().astype("Int64")
     
-    results = {
-        "feedback_by_category": {},
-        "score_by_category": {},
-        "summary_feedback": ""
-    }
+    # Check if category names and column names exist in the expected format
+    all_columns = submission_df.columns.tolist()
+    logging.info(f"Available columns: {all_columns}")
     
-    # Evaluate each category
-    for category, rubric_items in rubric_by_category.items():
-        try:
-            # Skip empty categories
-            if not rubric_items:
-                continue
-                
-            # Get category-specific responses
-            category_responses = collect_category_responses(student_responses, category)
-            
-            # Include all student responses and category-specific responses
-            eval_responses = student_responses.copy()
-            eval_responses['responses'] = category_responses
-            
-            # Evaluate the category
-            evaluation = evaluate_category(student_id, category, rubric_items, eval_responses)
-            
-            # Extract feedback and score
-            results["feedback_by_category"][category] = evaluation["feedback"]
-            results["score_by_category"][category] = evaluation["score"]
-            
-        except Exception as e:
-            logging.error(f"Error evaluating category {category} for student {student_id}: {str(e)}")
-            results["feedback_by_category"][category] = f"Error processing evaluation for {category}. Please try again."
-            results["score_by_category"][category] = ""
+    return normalize_column_map(FEEDBACK_COLUMNS, all_columns), normalize_column_map(SCORE_COLUMNS, all_columns)
+
+def get_student_responses(submission_df: pd.DataFrame, row_index: int) -> StudentRecord:
+    """Return a student's non-empty text answers, leaving out the evaluator's own output columns.
+
+    The team column is kept whatever its type so dedup can group by team.
+    """
+    return build_record(submission_df, row_index, exclude=OUTPUT_COLUMNS, keep=CONFIG["team_column"])
+
+def evaluate_student_category(student_id: str, category: str, rubric_items: List[Dict], student_responses: Dict,
+                              payloads: Optional[PayloadCache] = None,
+                              fingerprints: Optional[FingerprintStore] = None) -> Dict:
+    """Evaluate one category from a student's full responses, returning a placeholder on failure."""
+    try:
+        # Get category-specific responses
+        category_responses = collect_category_responses(student_responses, category)
+        
+        # Include all student responses and category-specific responses, without copying them
+        eval_responses = ResponsesView(student_responses, category_responses)
+        
+        # Evaluate the category
+        return evaluate_category(student_id, category, rubric_items, eval_responses, payloads, fingerprints)
+        
+    except Exception as e:
+        logging.error(f"Error evaluating category {category} for student {student_id}: {str(e)}")
+        return {
+            "rubric_category": category,
+            "feedback": f"Error processing evaluation for {category}. Please try again.",
+            "score": ""
+        }
+
+def student_team(student_responses: Dict):
+    """The student's team for dedup grouping, or None when dedup is not grouped by team."""
+    return student_responses.get(CONFIG["team_column"]) if CONFIG["team_column"] else None
+
+def evaluate_summary(student_id: str, student_responses: Dict, category_results: Optional[Dict[str, Dict]] = None,
+                     payloads: Optional[PayloadCache] = None, fingerprints: Optional[FingerprintStore] = None) -> str:
+    """Generate the summary feedback for a student, returning an error message on failure.
+
+    category_results ({category: {"feedback", "score"}}) are what the summary
+    is built from in summary_mode "categories".
+    """
+    try:
+        summary_prompt = summary_prompt_for(student_id, student_responses, category_results)
+    except Exception as e:
+        logging.error(f"Error generating summary for student {student_id}: {str(e)}")
+        return "Error generating summary. Please try again."
     
-    # Generate summary feedback
+    def grade_result() -> str:
+        if payloads is None:
+            return grade_summary(student_id, summary_prompt)
+        return payloads.grade(student_id, "SUMMARY", summary_prompt, lambda: grade_summary(student_id, summary_prompt),
+                              team=student_team(student_responses),
+                              cacheable=lambda feedback: not is_failed(feedback, None, check_score=False))
+    
+    if fingerprints is None:
+        return grade_result()
+    return fingerprints.grade(student_id, "SUMMARY", fingerprint(summary_prompt, CONFIG["model"]), grade_result,
+                              cacheable=lambda feedback: not is_failed(feedback, None, check_score=False))
+
+def grade_summary(student_id: str, summary_prompt: str) -> str:
+    """Call the API for a summary prompt and return the summary feedback (or an error message)."""
     try:
         # Call OpenAI API for summary
-        summary_prompt = create_summary_prompt(student_responses)
-        summary_response = openai.ChatCompletion.create(
-            model=CONFIG["model"],
+        summary_content = create_chat_completion(
+            student_id, "SUMMARY", CONFIG["model"],
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": summary_prompt}
@@ -307,40 +509,84 @@ def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submissio
             temperature=0.7
         )
         
-        # Log token usage for summary
-        summary_usage = summary_response['usage']
-        logging.info(f"[{student_id} | SUMMARY] Token usage — prompt: {summary_usage['prompt_tokens']}, completion: {summary_usage['completion_tokens']}, total: {summary_usage['total_tokens']}")
-        
         # Extract JSON from the summary response with enhanced error handling
-        summary_content = summary_response.choices[0].message.content
-        
-        try:
-            # Log the raw content for debugging
-            logging.debug(f"Raw summary API response for {student_id}: {summary_content}")
+        with span("parse_json", student=student_id, category="SUMMARY"):
+            try:
+                # Log the raw content for debugging
+                logging.debug(f"Raw summary API response for {student_id}: {summary_content}")
             
-            # Check if we have a properly formatted JSON response
-            summary_content = summary_content.strip()
-            if not (summary_content.startswith('{') and summary_content.endswith('}')):
-                logging.warning(f"Summary response not valid JSON format: {summary_content[:50]}...")
-                # Try to extract a JSON object if it exists within the text
-                json_start = summary_content.find('{')
-                json_end = summary_content.rfind('}')
+                # Check if we have a properly formatted JSON response
+                summary_content = summary_content.strip()
+                if not (summary_content.startswith('{') and summary_content.endswith('}')):
+                    logging.warning(f"Summary response not valid JSON format: {summary_content[:50]}...")
+                    # Try to extract a JSON object if it exists within the text
+                    json_start = summary_content.find('{')
+                    json_end = summary_content.rfind('}')
                 
-                if json_start >= 0 and json_end > json_start:
-                    summary_content = summary_content[json_start:json_end+1]
-                    logging.info(f"Extracted JSON from summary content: {summary_content[:50]}...")
-                else:
-                    raise ValueError("Could not extract valid JSON from summary response")
+                    if json_start >= 0 and json_end > json_start:
+                        summary_content = summary_content[json_start:json_end+1]
+                        logging.info(f"Extracted JSON from summary content: {summary_content[:50]}...")
+                    else:
+                        raise ValueError("Could not extract valid JSON from summary response")
             
-            summary_result = json.loads(summary_content)
-            results["summary_feedback"] = summary_result.get("feedback", "Error generating summary. Please try again.")
+                summary_result = json.loads(summary_content)
+                return summary_result.get("feedback", "Error generating summary. Please try again.")
             
-        except (json.JSONDecodeError, ValueError) as e:
-            logging.error(f"JSON parsing error for {student_id} summary: {str(e)}\nContent: {summary_content[:200]}")
-            results["summary_feedback"] = f"Error generating summary. JSON parsing failed: {str(e)[:50]}"
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.error(f"JSON parsing error for {student_id} summary: {str(e)}\nContent: {summary_content[:200]}")
+                METRICS.record_parse_failure(student_id, "SUMMARY", CONFIG["model"])
+                return f"Error generating summary. JSON parsing failed: {str(e)[:50]}"
     except Exception as e:
         logging.error(f"Error generating summary for student {student_id}: {str(e)}")
-        results["summary_feedback"] = "Error generating summary. Please try again."
+        return "Error generating summary. Please try again."
+
+def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submission_df: pd.DataFrame, row_index: int,
+                            payloads: Optional[PayloadCache] = None,
+                            fingerprints: Optional[FingerprintStore] = None) -> Dict:
+    """Evaluate all rubric categories for a single student and return a dictionary of results.
+    
+    Args:
+        student_id: Student identifier
+        rubric_by_category: Dictionary of rubric categories and items
+        submission_df: DataFrame with student submissions
+        row_index: Row index for this student in the DataFrame
+        payloads: Dedup cache of this run, or None to grade every payload
+        fingerprints: Previous run's results to carry forward, or None to grade everything
+    """
+    # Extract student's responses
+    student_responses = get_student_responses(submission_df, row_index)
+    
+    results = {
+        "feedback_by_category": {},
+        "score_by_category": {},
+        "latency_by_category": {},
+        "summary_feedback": "",
+        "summary_latency": None
+    }
+    
+    category_results = {}
+    
+    # Evaluate each category
+    for category, rubric_items in rubric_by_category.items():
+        # Skip empty categories
+        if not rubric_items:
+            continue
+        
+        start = time.perf_counter()
+        evaluation = evaluate_student_category(student_id, category, rubric_items, student_responses, payloads,
+                                               fingerprints)
+        
+        # Extract feedback and score
+        results["feedback_by_category"][category] = evaluation["feedback"]
+        results["score_by_category"][category] = evaluation["score"]
+        results["latency_by_category"][category] = time.perf_counter() - start
+        category_results[category] = evaluation
+    
+    # Generate summary feedback
+    start = time.perf_counter()
+    results["summary_feedback"] = evaluate_summary(student_id, student_responses, category_results, payloads,
+                                                   fingerprints)
+    results["summary_latency"] = time.perf_counter() - start
     
     return results
 
@@ -349,11 +595,52 @@ def load_config():
     load_dotenv()
     openai.api_key = os.getenv("OPENAI_API_KEY")
     
-    if not openai.api_key:
+    if not openai.api_key and active_backend().requires_api_key:
         raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
     
     logging.info("Configuration loaded successfully")
 
+def join_student_results(submission_df: pd.DataFrame, graded: List[Tuple[str, int, Dict]],
+                         feedback_column_map: Dict[str, str], score_column_map: Dict[str, str]) -> pd.DataFrame:
+    """Join (student_id, row_index, evaluate_all_categories result) triples onto the workbook; returns the results table."""
+    # Collect the results into a typed table and join it onto the workbook in one step
+    table = ResultsTable()
+    for student_id, row_index, results in graded:
+        for category, feedback in results["feedback_by_category"].items():
+            table.add(row_index, student_id, category, feedback, results["score_by_category"][category],
+                      results["latency_by_category"][category])
+        table.add(row_index, student_id, SUMMARY_CATEGORY, results["summary_feedback"],
+                  latency=results["summary_latency"])
+    results_df = table.to_frame()
+    
+    unparsed = results_df["score"].isna() & results_df["status"].eq("graded") & results_df["category"].ne(SUMMARY_CATEGORY)
+    if unparsed.any():
+        logging.warning(f"{int(unparsed.sum())} scores could not be converted to numbers and were left blank")
+    apply_results(submission_df, results_df, feedback_column_map, score_column_map)
+    
+    # Total score is the rounded sum of the category scores
+    submission_df["Total Score"] = total_scores(submission_df, list(score_column_map.values()))
+    logging.info(f"Joined {len(results_df)} results: {results_df['status'].value_counts().to_dict()}")
+    return results_df
+
+def graded_workbook(config: Dict = CONFIG) -> str:
+    """Where the graded workbook goes: output_workbook, else the submission file as .xlsx."""
+    return config["output_workbook"] or artifact_path(config["submission_file"], "xlsx")
+
+def save_workbook(submission_df: pd.DataFrame, original_file: str, output_file: str):
+    """Write a timestamped backup next to original_file, then the graded workbook to output_file."""
+    backup_file = os.path.splitext(original_file)[0] + f"_BACKUP_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    # Submissions read from Parquet/Arrow may hold multi-select bitmasks
+    submission_df = expand_multi_select(submission_df)
+    with span("write_workbook", file=backup_file):
+        submission_df.to_excel(backup_file, index=False)
+    logging.info(f"Backup saved to {backup_file}")
+    
+    # Save the updated spreadsheet
+    with span("write_workbook", file=output_file):
+        submission_df.to_excel(output_file, index=False)
+    logging.info(f"Updated spreadsheet saved to {output_file}")
+
 def main(test_mode=True):
     """Main function to evaluate submissions.
     
@@ -363,82 +650,25 @@ def main(test_mode=True):
     try:
         # Load configuration settings
         load_config()
+        if CONFIG["trace_file"]:
+            TRACER.enable()
         
         # Load the rubric
         logging.info("Loading rubric...")
         rubric = load_rubric()
+        if CONFIG["summary_mode"] not in SUMMARY_MODES:
+            raise ValueError(f"Unknown summary_mode: {CONFIG['summary_mode']}")
+        PROMPTS.compile({**rubric, "SUMMARY": [], "CATEGORY_SUMMARY": []})
+        fingerprints = fingerprint_store(CONFIG, graded_workbook())
         logging.info(f"Loaded rubric with {sum(len(items) for items in rubric.values())} items across {len(rubric)} categories")
         
         # Load student submissions
         logging.info(f"Loading submissions from {CONFIG['submission_file']}")
-        submission_df = pd.read_excel(CONFIG['submission_file'])
+        with span("read_excel", file=CONFIG['submission_file']):
+            submission_df = read_artifact(CONFIG['submission_file'])
         logging.info(f"Loaded {len(submission_df)} submissions")
         
-        required_columns = [
-            "Summary Feedback", "Total Score", 
-            "Capstone Execution Feedback", "Theory Development Feedback", "Hypothesis Development Feedback", 
-            "Hypothesis Testing Feedback", "Evaluation / Decision Feedback",
-            "Capstone Execution Score (on 20)", "Theory Development Score (on 20)", "Hypothesis Development Score (on 20)", 
-            "Hypothesis Testing Score (on 20)", "Evaluation / Decision Score (on 20)"
-        ]
-        
-        # Add any missing columns to the dataframe
-        for col in required_columns:
-            if col not in submission_df.columns:
-                submission_df[col] = ""
-                
-        # Create a mapping of category names to column names
-        feedback_column_map = {
-            "Capstone Execution": "Capstone Execution Feedback",
-            "Theory Development": "Theory Development Feedback",
-            "Hypothesis Development": "Hypothesis Development Feedback",
-            "Hypothesis Testing": "Hypothesis Testing Feedback",
-            "Evaluation / Decision": "Evaluation / Decision Feedback"
-        }
-        
-        score_column_map = {
-            "Capstone Execution": "Capstone Execution Score (on 20)",
-            "Theory Development": "Theory Development Score (on 20)",
-            "Hypothesis Development": "Hypothesis Development Score (on 20)",
-            "Hypothesis Testing": "Hypothesis Testing Score (on 20)",
-            "Evaluation / Decision": "Evaluation / Decision Score (on 20)"
-        }
-        
-        # Check if category names and column names exist in the expected format
-        all_columns = submission_df.columns.tolist()
-        logging.info(f"Available columns: {all_columns}")
-        
-        # Normalize column names to remove extra spaces around slashes
-        normalized_column_map = {}
-        for category, column in feedback_column_map.items():
-            # Find best matching column
-            normalized_col = column.replace(" / ", "/")
-            if normalized_col in all_columns:
-                normalized_column_map[category] = normalized_col
-            elif column in all_columns:
-                normalized_column_map[category] = column
-            else:
-                logging.warning(f"Could not find column matching '{column}' or '{normalized_col}'")
-        
-        # Use normalized column names if found
-        if normalized_column_map:
-            feedback_column_map = normalized_column_map
-            logging.info(f"Using normalized column names: {feedback_column_map}")
-        
-        # Do the same for score columns
-        normalized_score_map = {}
-        for category, column in score_column_map.items():
-            normalized_col = column.replace(" / ", "/")
-            if normalized_col in all_columns:
-                normalized_score_map[category] = normalized_col
-            elif column in all_columns:
-                normalized_score_map[category] = column
-            else:
-                logging.warning(f"Could not find column matching '{column}' or '{normalized_col}'")
-        
-        if normalized_score_map:
-            score_column_map = normalized_score_map
-            logging.info(f"Using normalized score column names: {score_column_map}")
+        feedback_column_map, score_column_map = prepare_output_columns(submission_df)
         
         # Get list of unique student IDs
         student_ids = submission_df[CONFIG["id_column"]].unique()
@@ -456,64 +686,41 @@ def main(test_mode=True):
             student_ids = [test_student]
         else:
             logging.info(f"FULL MODE: Processing all {len(student_ids)} students")
+            student_ids = list(student_ids)
         
-        # Process selected students
-        for student_id in student_ids:
+        # Evaluate selected students, as many at a time as the backend admits requests; dedup is scoped to this run
+        payloads = payload_cache(CONFIG)
+        def evaluate_student(student_id):
             # Find the row index for this student
             row_indices = submission_df.index[submission_df[CONFIG["id_column"]] == student_id].tolist()
             if not row_indices:
                 logging.warning(f"Could not find row index for student {student_id}, skipping")
-                continue
+                return None
                 
             row_index = row_indices[0]
             
             # Evaluate the student
             logging.info(f"Evaluating student: {student_id}")
             try:
-                results = evaluate_all_categories(student_id, rubric, submission_df, row_index)
-                
-                # Update category feedback and scores
-                total_score = 0
-                score_count = 0
-                
-                for category, feedback in results["feedback_by_category"].items():
-                    if category in feedback_column_map:
-                        submission_df.at[row_index, feedback_column_map[category]] = feedback
-                
-                for category, score in results["score_by_category"].items():
-                    if category in score_column_map:
-                        try:
-                            score_value = float(score)
-                            total_score += score_value
-                            score_count += 1
-                            submission_df.at[row_index, score_column_map[category]] = score_value
-                        except (ValueError, TypeError):
-                            logging.warning(f"Could not convert score to number: {score}")
-                            submission_df.at[row_index, score_column_map[category]] = score
-                
-                # Calculate and update the total score (sum of category scores)
-                if score_count > 0:
-                    calculated_total_score = round(total_score)
-                    submission_df.at[row_index, "Total Score"] = calculated_total_score
-                    logging.info(f"Calculated total score: {calculated_total_score}")
-                else:
-                    submission_df.at[row_index, "Total Score"] = ""
-                    
-                # Update the summary feedback
-                submission_df.at[row_index, "Summary Feedback"] = results["summary_feedback"]
+                with span("evaluate_student", student=student_id):
+                    return row_index, evaluate_all_categories(student_id, rubric, submission_df, row_index, payloads,
+                                                            fingerprints)
             except Exception as e:
                 logging.error(f"Error processing student {student_id}: {str(e)}")
-                continue
+                return None
         
-        # Create a backup of the original file
-        original_file = CONFIG["submission_file"]
-        backup_file = original_file.replace(".xlsx", f"_BACKUP_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        submission_df.to_excel(backup_file, index=False)
-        logging.info(f"Backup saved to {backup_file}")
+        graded_by_student = run_concurrently(student_ids, evaluate_student, active_backend().max_concurrency)
+        
+        graded = [(student_id, *graded_by_student[student_id]) for student_id in student_ids
+                  if graded_by_student[student_id] is not None]
+        join_student_results(submission_df, graded, feedback_column_map, score_column_map)
+        save_workbook(submission_df, CONFIG["submission_file"], graded_workbook())
+        if fingerprints is not None:
+            fingerprints.save()
         
-        # Save the updated spreadsheet
-        submission_df.to_excel(original_file, index=False)
-        logging.info(f"Updated spreadsheet saved to {original_file}")
+        METRICS.report(CONFIG["metrics_json"], CONFIG["metrics_prom"])
+        if CONFIG["trace_file"]:
+            TRACER.write_chrome_trace(CONFIG["trace_file"])
         
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}", exc_info=True)
@@ -4,7 +4,17 @@ from dotenv import load_dotenv
 import os
 import json
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from cascade import grade_with_cascade
+from completions import active_backend, create_chat_completion
+from artifacts import read_artifact
+from dedup import PayloadCache, payload_cache
+from incremental import FingerprintStore, fingerprint, fingerprint_store
+from metrics import METRICS
+from prompt_compiler import PromptCompiler
+from grading import is_failed, run_concurrently
+from tracing import TRACER, span, traced
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,13 +25,26 @@ CONFIG = {
     "rubric_sheet": "Rubric",
     "submission_file": "4) Initial Belief Formation  (Describe 1) Initial Theory of Value and 2) supporting hypotheses.  - Attempt Details_CLEANED.xlsx",
     "id_column": "username",
-    "output_csv": "MGMT4901_Evaluation_Output.csv"
+    "model": "gpt-4",
+    "cascade_model": None,  # optional fast first-pass model; escalates to "model" when needed (see cascade.py)
+    "score_band": None,     # scores the cascade accepts; None: any (the prompt asks for 0–20 or blank)
+    "dedup": False,         # grade identical submissions once (see dedup.py)
+    "team_column": None,    # with dedup, only share grades within this column's teams, e.g. "Team Number"
+    "incremental": False,   # only grade answers that changed since the last run (see incremental.py)
+    "output_csv": "MGMT4901_Evaluation_Output.csv",
+    "metrics_json": None,  # optional path for the run metrics summary
+    "metrics_prom": None,  # optional path for a Prometheus textfile
+    "trace_file": None     # optional path for a Chrome trace-event JSON of the run
 }
 
+SYSTEM_PROMPT = "You are a helpful teaching assistant. Please respond ONLY with a valid JSON object in this exact format: {\"rubric_category\":\"...\", \"feedback\":\"...\", \"score\":...}. Do not include any other text or explanations."
+
+@traced("load_rubric")
 def load_rubric() -> Dict[str, List[Dict]]:
     """Load rubric from Excel file and organize by category."""
     try:
-        rubric_df = pd.read_excel(CONFIG["rubric_file"], sheet_name=CONFIG["rubric_sheet"])
+        with span("read_excel", file=CONFIG["rubric_file"]):
+            rubric_df = pd.read_excel(CONFIG["rubric_file"], sheet_name=CONFIG["rubric_sheet"])
         rubric_by_category = {}
         
         for _, row in rubric_df.iterrows():
@@ -47,8 +70,8 @@ def collect_category_responses(student_responses: Dict, category: str) -> str:
             responses.append(f"{col}: {response}")
     return "\n".join(responses)
 
-def create_prompt(category: str, rubric_items: List[Dict], student_responses: str) -> str:
-    """Create the evaluation prompt for OpenAI API."""
+def render_prompt_prefix(category: str, rubric_items: List[Dict]) -> str:
+    """Render the static part of a category prompt: instructions, style guide, rubric items and JSON format."""
     rubric_items_text = "\n".join([f"- {item['item']}" for item in rubric_items])
     
     return f"""You are acting as the instructor for MGMT 4901: Applied Entrepreneurship & Innovation. You are evaluating one team's submission using a structured rubric.
@@ -79,9 +102,6 @@ Use the following voice and tone guidelines:
 Rubric Items:
 {rubric_items_text}
 
-Student Responses:
-{student_responses}
-
 Respond in JSON with the following format:
 
 ```json
@@ -92,10 +112,26 @@ Respond in JSON with the following format:
 }}
 ```
 If no relevant answers were provided, still write a thoughtful reflection prompt but leave "score": "".
+
+Student Responses:
 """
 
-def evaluate_category(student_id: str, category: str, rubric_items: List[Dict], student_responses: Dict) -> Dict:
-    """Evaluate a single rubric category for a student."""
+# Static prefixes are rendered once per category so every request shares them byte for byte
+PROMPTS = PromptCompiler(render_prompt_prefix, SYSTEM_PROMPT)
+
+@traced("create_prompt")
+def create_prompt(category: str, rubric_items: List[Dict], student_responses: str) -> str:
+    """Create the evaluation prompt for OpenAI API: the category's static prefix, then the student's responses."""
+    return PROMPTS.build(category, rubric_items, student_responses)
+
+@traced("evaluate_category")
+def evaluate_category(student_id: str, category: str, rubric_items: List[Dict], student_responses: Dict,
+                      payloads: Optional[PayloadCache] = None, fingerprints: Optional[FingerprintStore] = None) -> Dict:
+    """Evaluate a single rubric category for a student.
+
+    Identical payloads are graded once through payloads, and unchanged ones
+    get the previous run's result from fingerprints, when those are given.
+    """
     responses_text = collect_category_responses(student_responses, category)
     
     if not responses_text.strip():
@@ -107,76 +143,103 @@ def evaluate_category(student_id: str, category: str, rubric_items: List[Dict],
     
     prompt = create_prompt(category, rubric_items, responses_text)
     
+    def grade(model: str) -> Tuple[Dict, bool]:
+        return grade_category(student_id, category, prompt, model)
+    
+    def grade_payload() -> Dict:
+        if CONFIG["cascade_model"]:
+            return grade_with_cascade(student_id, category, responses_text, grade, CONFIG["cascade_model"], CONFIG["model"],
+                                      CONFIG["score_band"])
+        return grade(CONFIG["model"])[0]
+    
+    def grade_result() -> Dict:
+        if payloads is None:
+            return grade_payload()
+        team = student_responses.get(CONFIG["team_column"]) if CONFIG["team_column"] else None
+        return payloads.grade(student_id, category, prompt, grade_payload, team=team,
+                              cacheable=lambda e: not is_failed(e["feedback"], e["score"]))
+    
+    if fingerprints is None:
+        return grade_result()
+    return fingerprints.grade(student_id, category, fingerprint(prompt, CONFIG["model"], CONFIG["cascade_model"]),
+                              grade_result, cacheable=lambda e: not is_failed(e["feedback"], e["score"]))
+
+def grade_category(student_id: str, category: str, prompt: str, model: str) -> Tuple[Dict, bool]:
+    """Grade one category prompt with model; returns (evaluation, parsed), with parsed False for fallbacks."""
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        content = create_chat_completion(
+            student_id, category, model,
             messages=[
-                {"role": "system", "content": "You are a helpful teaching assistant. Please respond ONLY with a valid JSON object in this exact format: {\"rubric_category\":\"...\", \"feedback\":\"...\", \"score\":...}. Do not include any other text or explanations."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7
         )
         
-        # Extract JSON from response
-        try:
-            # Clean up the response content
-            content = response.choices[0].message.content.strip()
+        with span("parse_json", student=student_id, category=category):
+            # Extract JSON from response
+            try:
+                # Clean up the response content
+                content = content.strip()
             
-            # Try to extract JSON if it's in a code block
-            if content.startswith("```json") and content.endswith("```"):
-                content = content[7:-3].strip()  # Remove code block markers
+                # Try to extract JSON if it's in a code block
+                if content.startswith("```json") and content.endswith("```"):
+                    content = content[7:-3].strip()  # Remove code block markers
             
-            # If we have a string, try to add quotes around it
-            if content and not content.startswith("{"):
-                content = f'{{"rubric_category": "{category}", "feedback": "{content}", "score": ""}}'
+                # If we have a string, try to add quotes around it
+                if content and not content.startswith("{"):
+                    content = f'{{"rubric_category": "{category}", "feedback": "{content}", "score": ""}}'
             
-            # Try to parse the JSON
-            evaluation = json.loads(content)
+                # Try to parse the JSON
+                evaluation = json.loads(content)
             
-            # Validate the structure
-            if not isinstance(evaluation, dict) or \
-               "rubric_category" not in evaluation or \
-               "feedback" not in evaluation or \
-               "score" not in evaluation:
-                raise ValueError("Invalid JSON structure")
+                # Validate the structure
+                if not isinstance(evaluation, dict) or \
+                   "rubric_category" not in evaluation or \
+                   "feedback" not in evaluation or \
+                   "score" not in evaluation:
+                    raise ValueError("Invalid JSON structure")
                 
-            return evaluation
+                return evaluation, True
             
-        except (json.JSONDecodeError, ValueError) as e:
-            logging.error(f"Invalid JSON response for student {student_id}, category {category}: {str(e)}")
-            # Try to create a fallback evaluation
-            try:
-                # Try to extract just the feedback text
-                feedback = content.strip()
-                if not feedback:
-                    feedback = "Error processing evaluation. Please try again."
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.error(f"Invalid JSON response for student {student_id}, category {category}: {str(e)}")
+                METRICS.record_parse_failure(student_id, category, model)
+                # Try to create a fallback evaluation
+                try:
+                    # Try to extract just the feedback text
+                    feedback = content.strip()
+                    if not feedback:
+                        feedback = "Error processing evaluation. Please try again."
                 
-                return {
-                    "rubric_category": category,
-                    "feedback": feedback,
-                    "score": ""
-                }
-            except:
-                return {
-                    "rubric_category": category,
-                    "feedback": "Error processing evaluation. Please try again.",
-                    "score": ""
-                }
+                    return {
+                        "rubric_category": category,
+                        "feedback": feedback,
+                        "score": ""
+                    }, False
+                except:
+                    return {
+                        "rubric_category": category,
+                        "feedback": "Error processing evaluation. Please try again.",
+                        "score": ""
+                    }, False
     except Exception as e:
         logging.error(f"API error for student {student_id}, category {category}: {str(e)}")
         return {
             "rubric_category": category,
             "feedback": "Error processing evaluation. Please try again.",
             "score": ""
-        }
+        }, False
 
-def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submission_df: pd.DataFrame) -> List[Dict]:
+def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submission_df: pd.DataFrame,
+                            payloads: Optional[PayloadCache] = None,
+                            fingerprints: Optional[FingerprintStore] = None) -> List[Dict]:
     """Evaluate all rubric categories for a single student."""
     student_responses = submission_df[submission_df[CONFIG["id_column"]] == student_id].iloc[0].to_dict()
     evaluations = []
     
     for category, rubric_items in rubric_by_category.items():
-        evaluation = evaluate_category(student_id, category, rubric_items, student_responses)
+        evaluation = evaluate_category(student_id, category, rubric_items, student_responses, payloads, fingerprints)
         evaluations.append({
             "username": student_id,
             "rubric_category": evaluation["rubric_category"],
@@ -186,35 +249,56 @@ def evaluate_all_categories(student_id: str, rubric_by_category: Dict, submissio
     
     return evaluations
 
+def load_config():
+    """Load the OpenAI API key from the environment or a .env file."""
+    load_dotenv()
+    openai.api_key = os.getenv('OPENAI_API_KEY')
+
 def main():
     """Main function to process all submissions."""
     # Load OpenAI API key
-    load_dotenv()
-    openai.api_key = os.getenv('OPENAI_API_KEY')
+    load_config()
     
     try:
         # Load rubric
+        if CONFIG["trace_file"]:
+            TRACER.enable()
         rubric_by_category = load_rubric()
+        PROMPTS.compile(rubric_by_category)
+        fingerprints = fingerprint_store(CONFIG, CONFIG["output_csv"])
         
         # Load submission file
-        submission_df = pd.read_excel(CONFIG["submission_file"])
+        with span("read_excel", file=CONFIG["submission_file"]):
+            submission_df = read_artifact(CONFIG["submission_file"])
         
         # Get unique usernames
-        usernames = submission_df[CONFIG["id_column"]].unique()
+        usernames = list(submission_df[CONFIG["id_column"]].unique())
+        
+        # Process each student, as many at a time as the backend admits requests; dedup is scoped to this run
+        payloads = payload_cache(CONFIG)
+        def evaluate_student(username) -> List[Dict]:
+            logging.info(f"Evaluating submissions for user: {username}")
+            with span("evaluate_student", student=username):
+                return evaluate_all_categories(username, rubric_by_category, submission_df, payloads, fingerprints)
         
-        # Process each student
+        evaluations_by_student = run_concurrently(usernames, evaluate_student, active_backend().max_concurrency)
         all_evaluations = []
         for username in usernames:
-            logging.info(f"Evaluating submissions for user: {username}")
-            evaluations = evaluate_all_categories(username, rubric_by_category, submission_df)
-            all_evaluations.extend(evaluations)
+            all_evaluations.extend(evaluations_by_student[username])
         
         # Create output DataFrame
         output_df = pd.DataFrame(all_evaluations)
         
         # Save to CSV
-        output_df.to_csv(CONFIG["output_csv"], index=False)
-        logging.info(f"Evaluation complete. Results saved to {CONFIG["output_csv"]}")
+        with span("write_csv", file=CONFIG["output_csv"]):
+            output_df.to_csv(CONFIG["output_csv"], index=False)
+        logging.info(f"Evaluation complete. Results saved to {CONFIG['output_csv']}")
+        if fingerprints is not None:
+            fingerprints.save()
+        
+        METRICS.report(CONFIG["metrics_json"], CONFIG["metrics_prom"])
+        if CONFIG["trace_file"]:
+            TRACER.write_chrome_trace(CONFIG["trace_file"])
         
     except Exception as e:
         logging.error(f"Error in main execution: {str(e)}")
@@ -1,12 +1,12 @@
 import pandas as pd
 import os
 
+from artifacts import artifact_path, find_artifact, read_artifact, write_artifact
+
 data_dir = "/Users/decosteluke/Dropbox/ACademic  Teaching - Dalhousie/2025-05 - MGMT 4901 Async/Data Files"
 merged_path = os.path.join(data_dir, "ALL_MERGED.xlsx")
 features_path = os.path.join(data_dir, "TEAM_FEATURES.xlsx")
 
-df = pd.read_excel(merged_path)
-
 # List of BComm/BMgmt/derivative degrees (case-insensitive match, ignoring trailing *)
 bcomm_bmgmt_degrees = [
     "bachelor of management",
@@ -24,10 +24,18 @@ def is_bcomm_or_bmgmt(degree):
             return 1
     return 0
 
-df["is_bcomm_or_bmgmt"] = df["Degree"].apply(is_bcomm_or_bmgmt)
+def engineer_features(merged_path=merged_path, features_path=features_path):
+    """Add degree and major flags to the merged class file and save it as the team features file."""
+    df = read_artifact(find_artifact(merged_path))
+
+    df["is_bcomm_or_bmgmt"] = df["Degree"].apply(is_bcomm_or_bmgmt)
+
+    df["is_entrepreneurship_major"] = df["Major"].str.lower().str.contains("entrepreneurship", na=False).astype(int)
 
-df["is_entrepreneurship_major"] = df["Major"].str.lower().str.contains("entrepreneurship", na=False).astype(int)
+    # Save the feature-engineered file
+    features_path = write_artifact(df, artifact_path(features_path))
+    print(f"Feature-engineered file saved as {features_path}")
+    return df
 
-# Save the feature-engineered file
-df.to_excel(features_path, index=False)
-print(f"Feature-engineered file saved as {features_path}")
+if __name__ == "__main__":
+    engineer_features()
@@ -0,0 +1,20 @@
+"""Content hashes of data files, shared by the pipeline cache, the watcher and the roster snapshot."""
+import hashlib
+import zipfile
+
+# Workbook parts that change on every save without the data changing (creation/modification times)
+VOLATILE_XLSX_PARTS = {"docProps/core.xml"}
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's content; for workbooks, of every part except the save timestamps."""
+    digest = hashlib.sha256()
+    if path.endswith(".xlsx") and zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as workbook:
+            for name in sorted(workbook.namelist()):
+                if name not in VOLATILE_XLSX_PARTS:
+                    digest.update(name.encode() + b"\x00" + workbook.read(name))
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
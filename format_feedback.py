@@ -1,18 +1,113 @@
 import pandas as pd
 import logging
+import math
+from typing import Dict, Optional, Tuple
+
+from roster import load_roster, normalize_usernames
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def format_feedback():
+META_COLUMNS = ['username', 'E-Mail Address', 'First Name', 'Team Number']
+
+KEEP_POLICIES = ("last", "best")
+
+def _score_value(score) -> float:
+    """A score as a number for keep="best"; missing or unparseable scores rank lowest."""
+    try:
+        value = float(score)
+    except (TypeError, ValueError):
+        return -math.inf
+    return -math.inf if math.isnan(value) else value
+
+def _reduce_chunk(chunk: pd.DataFrame, keep: str) -> pd.DataFrame:
+    """Keep one row per (username, category) within a chunk, in file order."""
+    if keep == "best":
+        ranked = chunk.assign(_rank=chunk['score'].map(_score_value))
+        # Stable sort so that equal scores keep their file order and the later one wins
+        chunk = ranked.sort_values('_rank', kind='stable').drop(columns='_rank')
+    return chunk.drop_duplicates(['username', 'rubric_category'], keep='last')
+
+def collect_results(eval_file: str, chunksize: int = 50000, keep: str = "last") -> Dict[str, Dict[str, Tuple]]:
+    """Stream the long evaluation CSV and return {username: {category: (feedback, score)}}.
+
+    Each (username, category) pair keeps its last row, or with keep="best" its
+    highest-scoring row (the later one on ties), so repeated runs and
+    re-grades appended to one log collapse to a single result. Memory grows
+    with the number of pairs, not the number of rows.
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"keep must be one of {KEEP_POLICIES}, not {keep!r}")
+    results: Dict[str, Dict[str, Tuple]] = {}
+    rows = 0
+    columns = ['username', 'rubric_category', 'feedback', 'score']
+    # Read as text so scores are written back exactly as they were logged
+    for chunk in pd.read_csv(eval_file, usecols=columns, dtype=str, chunksize=chunksize):
+        rows += len(chunk)
+        chunk = chunk.dropna(subset=['username', 'rubric_category'])
+        chunk['username'] = normalize_usernames(chunk['username'])
+        chunk = _reduce_chunk(chunk, keep)
+        for username, category, feedback, score in zip(*(chunk[c].tolist() for c in columns)):
+            by_category = results.setdefault(username, {})
+            if keep == "best" and category in by_category and _score_value(by_category[category][1]) > _score_value(score):
+                continue
+            by_category[category] = (feedback, score)
+    pairs = sum(len(by_category) for by_category in results.values())
+    logging.info(f"Read {rows} evaluation rows into {pairs} (username, category) results for {len(results)} students")
+    return results
+
+def write_wide(results: Dict[str, Dict[str, Tuple]], class_meta: pd.DataFrame, output_file: str,
+               chunksize: int = 50000):
+    """Write one row per class-list student with _feedback then _score columns, chunksize rows at a time."""
+    categories = sorted({category for by_category in results.values() for category in by_category})
+    columns = META_COLUMNS + [f"{c}_feedback" for c in categories] + [f"{c}_score" for c in categories]
+    for start in range(0, max(len(class_meta), 1), chunksize):
+        block = class_meta.iloc[start:start + chunksize]
+        rows = []
+        for meta in block.itertuples(index=False):
+            by_category = results.get(str(meta[0]), {})
+            found = [by_category.get(c, (None, None)) for c in categories]
+            rows.append(list(meta) + [feedback for feedback, _ in found] + [score for _, score in found])
+        pd.DataFrame(rows, columns=columns).to_csv(output_file, index=False, mode='w' if start == 0 else 'a',
+                                                  header=start == 0)
+
+def format_feedback(eval_file="MGMT4901_3A_Evaluation_Output.csv", class_list_file="00 Class List.xlsx",
+                    output_file="3A Final_Formatted_Feedback.csv", chunksize: Optional[int] = None,
+                    keep: str = "last"):
+    """Pivot the long evaluation output to one row per student and attach class list details.
+
+    With chunksize set, the evaluation CSV is streamed chunksize rows at a
+    time, duplicate (username, category) pairs are resolved by keep ("last"
+    or "best") and the wide file is written in chunks, for evaluation logs
+    that span several assignments or terms.
+    """
+    if chunksize:
+        try:
+            logging.info("Loading class list...")
+            class_meta = load_roster(class_list_file).frame[META_COLUMNS]
+            logging.info(f"Streaming evaluation output in chunks of {chunksize} rows...")
+            results = collect_results(eval_file, chunksize, keep)
+            logging.info("Saving final formatted feedback...")
+            write_wide(results, class_meta, output_file, chunksize)
+            logging.info("Script completed successfully!")
+        except Exception as e:
+            logging.error(f"Error during processing: {str(e)}")
+            raise
+        return
+
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"keep must be one of {KEEP_POLICIES}, not {keep!r}")
     try:
         # Load evaluation output
         logging.info("Loading evaluation output...")
-        eval_df = pd.read_csv("MGMT4901_3A_Evaluation_Output.csv")
+        eval_df = pd.read_csv(eval_file)
+        eval_df['username'] = normalize_usernames(eval_df['username'])
+        # A pair graded more than once (re-runs, re-grades) would make the pivot fail
+        eval_df = _reduce_chunk(eval_df, keep)
         
         # Load class list
         logging.info("Loading class list...")
-        class_df = pd.read_excel("00 Class List.xlsx")
+        class_df = load_roster(class_list_file).frame
         
         # Convert to wide format
         logging.info("Converting to wide format...")
@@ -34,19 +129,19 @@ def format_feedback():
         # Merge with class list
         logging.info("Merging with class list...")
         # Keep only the columns we need from class list
-        class_meta = class_df[['username', 'E-Mail Address', 'First Name', 'Team Number']].copy()
+        class_meta = class_df[META_COLUMNS].copy()
         
         # Merge on username
         final_df = pd.merge(class_meta, wide_df, on='username', how='left')
         
         # Sort columns to put metadata at the start
-        meta_cols = ['username', 'E-Mail Address', 'First Name', 'Team Number']
+        meta_cols = META_COLUMNS
         feedback_score_cols = [col for col in final_df.columns if col not in meta_cols]
         final_df = final_df[meta_cols + feedback_score_cols]
         
         # Save to CSV
         logging.info("Saving final formatted feedback...")
-        final_df.to_csv("3A Final_Formatted_Feedback.csv", index=False)
+        final_df.to_csv(output_file, index=False)
         logging.info("Script completed successfully!")
         
     except Exception as e:
@@ -0,0 +1,27 @@
+"""Helpers shared by the evaluators, the re-grade pass and the results store.
+
+is_failed tells a usable feedback/score pair from a placeholder left by a
+failed call, and run_concurrently runs grading calls on a thread pool.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List
+
+import pandas as pd
+
+PLACEHOLDER_PREFIXES = ("Error processing evaluation", "Error generating summary")
+NO_RESPONSE_PREFIX = "No responses were provided"
+
+def is_failed(feedback, score, check_score: bool = True) -> bool:
+    """True if a feedback/score cell pair holds a placeholder or is missing its score."""
+    feedback = "" if pd.isna(feedback) else str(feedback).strip()
+    if not feedback or feedback.startswith(PLACEHOLDER_PREFIXES):
+        return True
+    # Categories with no answers are legitimately left without a score
+    if not check_score or feedback.startswith(NO_RESPONSE_PREFIX):
+        return False
+    return pd.isna(score) or str(score).strip() == ""
+
+def run_concurrently(tasks: List[Hashable], grade: Callable, workers: int) -> Dict[Hashable, object]:
+    """Run grade(task) for every task on a thread pool and return {task: result}."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(tasks, pool.map(grade, tasks)))
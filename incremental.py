@@ -0,0 +1,94 @@
+"""Re-grade only what changed since the last run.
+
+Late submissions mean re-downloading the export and grading it again. With
+CONFIG["incremental"] set, an evaluator's main() creates a FingerprintStore
+for that run (fingerprint_store), fingerprints every category prompt
+it grades (the rubric prefix plus the student's routed responses, and the
+grading models) and stores the fingerprint with the result in a JSON file
+next to the output, "<output>.fingerprints.json". On the next run a
+(student, category) whose fingerprint is unchanged gets its stored result
+back without a request; new students and changed answers are graded as
+usual.
+
+Placeholder results (failed calls) are not stored, so they are retried on
+the next run.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+FINGERPRINT_SUFFIX = ".fingerprints.json"
+
+def fingerprint_path(output_file: str) -> str:
+    """The fingerprint file stored alongside an output file."""
+    return output_file + FINGERPRINT_SUFFIX
+
+def fingerprint(prompt: str, *models) -> str:
+    """SHA-256 of the prompt and the models that grade it."""
+    key = "\x00".join([str(model) for model in models] + [prompt])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class FingerprintStore:
+    """Thread-safe map from (student, category) to the fingerprint and result of its last grading."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.path: Optional[str] = None
+        self.entries: Dict[str, Dict[str, Dict]] = {}
+        self.carried = 0
+        self.graded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def load(self, path: str):
+        """Use path for this run, reading the fingerprints of the previous run if it exists."""
+        with self._lock:
+            self.path = path
+            self.carried = self.graded = 0
+            self.entries = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.entries = json.load(f)
+        pairs = sum(len(categories) for categories in self.entries.values())
+        logging.info(f"Loaded {pairs} fingerprints for {len(self.entries)} students from {path}")
+
+    def grade(self, student_id, category: str, key: str, grade: Callable[[], object],
+              cacheable: Callable[[object], bool] = lambda result: True):
+        """Return the stored result if the fingerprint key is unchanged, otherwise grade() and store it."""
+        student = str(student_id)
+        with self._lock:
+            entry = self.entries.get(student, {}).get(category)
+            if entry is not None and entry["fingerprint"] == key:
+                self.carried += 1
+                return entry["result"]
+        result = grade()
+        with self._lock:
+            self.graded += 1
+            if cacheable(result):
+                self.entries.setdefault(student, {})[category] = {"fingerprint": key, "result": result}
+        return result
+
+    def save(self):
+        """Write the fingerprints of this run (and of students it did not see) back to the file."""
+        if not self.enabled:
+            return
+        with self._lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+            logging.info(f"Incremental run: {self.carried} results carried forward, {self.graded} graded; "
+                         f"fingerprints saved to {self.path}")
+
+def fingerprint_store(config: Dict, output_file: str) -> Optional[FingerprintStore]:
+    """A store for one run, loaded from output_file's fingerprints, if config["incremental"] is set; else None."""
+    if not config["incremental"]:
+        return None
+    store = FingerprintStore()
+    store.load(fingerprint_path(output_file))
+    return store
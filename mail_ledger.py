@@ -0,0 +1,56 @@
+"""Which feedback rows were already emailed, so a re-run only mails new or changed rows.
+
+The ledger is a JSON file next to the feedback CSV ("<feedback>.sent.json")
+mapping each username to the hash of the feedback row it was sent. A row
+whose username is missing or whose hash differs (the student's feedback or
+scores changed) is unsent. Each send is recorded as soon as it succeeds, so
+a run that fails partway resumes with the students it had not reached.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict
+
+import pandas as pd
+
+LEDGER_SUFFIX = ".sent.json"
+
+def ledger_path(feedback_file: str) -> str:
+    """The sent ledger stored alongside a feedback file."""
+    return feedback_file + LEDGER_SUFFIX
+
+def row_hash(row: pd.Series) -> str:
+    """SHA-256 of every value of one feedback row, keyed by column."""
+    values = {str(column): str(value) for column, value in row.items()}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+class MailLedger:
+    """Thread-safe map from username to the hash of the feedback row last mailed to them."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self.path = path
+        self.sent: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.sent = json.load(f)
+        logging.info(f"Loaded {len(self.sent)} sent feedback rows from {path}")
+
+    def unsent(self, feedback_df: pd.DataFrame, id_column: str = "username") -> pd.DataFrame:
+        """Rows of feedback_df never mailed, or changed since they were."""
+        hashes = feedback_df.apply(row_hash, axis=1)
+        with self._lock:
+            keep = [self.sent.get(str(username)) != digest
+                    for username, digest in zip(feedback_df[id_column], hashes)]
+        return feedback_df.loc[pd.Series(keep, index=feedback_df.index, dtype=bool)]
+
+    def record(self, username, row: pd.Series):
+        """Mark row as mailed to username and write the ledger straight away."""
+        with self._lock:
+            self.sent[str(username)] = row_hash(row)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.sent, f, indent=2)
+            os.replace(tmp, self.path)
@@ -0,0 +1,209 @@
+"""Per-stage memory tracking and a memory budget for the data scripts.
+
+With MEMORY_CONFIG["report_file"] set (mgmt4901.py --memory-report FILE),
+each command or pipeline stage runs under tracemalloc. The report records
+its peak traced memory and the top allocation sites still holding memory
+when the stage ends, as JSON. Pipeline stages then run one at a time so the
+peaks are not mixed up.
+
+With MEMORY_CONFIG["budget_mb"] set (--memory-budget MB), the stages that
+can spike estimate their footprint from their input files before they
+start. A stage whose estimate is over the budget switches to its
+low-memory path:
+
+- clean_quiz_file widens the export as its rows stream in and never builds
+  the long table (clean_export_streaming)
+- merge_all_cleaned reads and merges one cleaned file at a time. This only
+  bounds the inputs held at once: the merged result is still built whole.
+
+format_feedback is not switched: its chunked path keeps every result in
+Python dicts and peaked higher than the in-memory pivot on the benchmark
+cohort.
+
+Estimates are the input size times FOOTPRINT_FACTORS (for workbooks, the
+size of the uncompressed sheet XML). The defaults were measured on the
+benchmark cohort. A tracked stage that took its in-memory path is checked
+against its estimate: a warning is logged when the peak is over it, and the
+observed factor is kept under "<stage>:<kind>" in the report. With
+MEMORY_CONFIG["factors_file"] (--memory-factors FILE) those factors are
+loaded at the start of a run and updated by its report, so later estimates
+follow the data actually seen.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+MEMORY_CONFIG = {
+    "budget_mb": None,     # None: never switch to the low-memory paths
+    "report_file": None,   # None: no tracking
+    "top_sites": 10,       # allocation sites listed per stage
+    "factors_file": None,  # JSON of calibrated footprint factors, read at the start and updated by report()
+}
+
+# A peak this much over its estimate is logged as a projection miss
+PROJECTION_TOLERANCE = 1.25
+
+# Peak traced memory per byte of input, by input kind. tracemalloc does not
+# see Arrow's own buffers, so the Parquet and Arrow factors undercount them.
+FOOTPRINT_FACTORS = {
+    "xlsx": 2.5,     # per byte of uncompressed sheet XML, read with read_excel
+    "csv": 4.5,      # per byte of CSV, read with read_csv
+    "parquet": 2.0,  # per byte of compressed Parquet
+    "arrow": 0.5,    # per byte of the memory-mapped Arrow file
+}
+
+def input_bytes(path: str) -> int:
+    """Size of path for footprint estimates; for workbooks, of the uncompressed sheet XML."""
+    if path.endswith(".xlsx") and zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as workbook:
+            return sum(info.file_size for info in workbook.infolist()
+                       if info.filename.startswith("xl/worksheets/") or info.filename == "xl/sharedStrings.xml")
+    return os.path.getsize(path)
+
+def footprint_factor(stage: Optional[str], kind: str) -> float:
+    """The factor calibrated for stage and input kind, else the default for the kind."""
+    return FOOTPRINT_FACTORS.get(f"{stage}:{kind}", FOOTPRINT_FACTORS.get(kind, FOOTPRINT_FACTORS["csv"]))
+
+def _inputs(paths: List[str]) -> List[Tuple[str, int]]:
+    return [(os.path.splitext(path)[1].lstrip("."), input_bytes(path)) for path in paths]
+
+def projected_bytes(paths: List[str], stage: Optional[str] = None) -> int:
+    """Estimated peak memory of stage reading every file in paths at once."""
+    return sum(int(size * footprint_factor(stage, kind)) for kind, size in _inputs(paths))
+
+def load_factors(path: Optional[str] = None):
+    """Merge the factors calibrated by earlier reports into FOOTPRINT_FACTORS."""
+    path = path or MEMORY_CONFIG["factors_file"]
+    if path and os.path.exists(path):
+        with open(path) as f:
+            FOOTPRINT_FACTORS.update(json.load(f))
+        logging.info(f"Loaded footprint factors from {path}")
+
+def over_budget(stage: str, paths: List[str]) -> bool:
+    """True if reading paths is projected to exceed the memory budget, so stage should take its low-memory path."""
+    budget = MEMORY_CONFIG["budget_mb"]
+    if budget is None and not MEMORY.enabled:
+        return False
+    inputs = _inputs(paths)
+    projected = sum(int(size * footprint_factor(stage, kind)) for kind, size in inputs)
+    low_memory = budget is not None and projected > budget * 1e6
+    kinds = {kind for kind, _ in inputs}
+    MEMORY.decide(stage, kinds.pop() if len(kinds) == 1 else None, sum(size for _, size in inputs), projected, low_memory)
+    return low_memory
+
+class MemoryTracker:
+    """Records tracemalloc peaks and allocation sites per stage, and the budget decisions taken."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: List[Dict] = []
+        self.decisions: List[Dict] = []
+        self._active: Optional[Dict] = None  # the record of the stage being tracked
+
+    @property
+    def enabled(self) -> bool:
+        return MEMORY_CONFIG["report_file"] is not None
+
+    def decide(self, stage: str, kind: Optional[str], input_size: int, projected: int, low_memory: bool):
+        """Record which path stage takes for input_size bytes of kind (None if mixed) projected at projected bytes."""
+        path = "low-memory" if low_memory else "in-memory"
+        budget = MEMORY_CONFIG["budget_mb"]
+        logging.info(f"[{stage}] projected {projected / 1e6:.1f} MB"
+                     + (f" against a {budget} MB budget" if budget is not None else "") + f": {path} path")
+        decision = {"stage": stage, "kind": kind, "input_mb": input_size / 1e6, "projected_mb": projected / 1e6,
+                    "path": path}
+        with self._lock:
+            self.decisions.append(decision)
+            if self._active is not None:
+                self._active.setdefault("decisions", []).append(decision)
+
+    def _check_projection(self, record: Dict):
+        """Compare a tracked stage's peak with the estimate of its largest in-memory read and calibrate from it."""
+        decisions = [d for d in record.get("decisions", []) if d["path"] == "in-memory" and d["input_mb"] > 0]
+        if not decisions:
+            return
+        largest = max(decisions, key=lambda d: d["projected_mb"])
+        record["projected_mb"] = largest["projected_mb"]
+        if largest["kind"] is not None:
+            record["calibration"] = {f"{largest['stage']}:{largest['kind']}": record["peak_mb"] / largest["input_mb"]}
+        if record["peak_mb"] > PROJECTION_TOLERANCE * largest["projected_mb"]:
+            logging.warning(f"[{record['stage']}] peak {record['peak_mb']:.1f} MB is over the "
+                            f"{largest['projected_mb']:.1f} MB projected for {largest['stage']}; "
+                            f"its footprint factor is too low (see --memory-factors)")
+
+    @contextmanager
+    def track(self, name: str):
+        """Trace allocations inside the block; yields the stage's record, filled in when the block ends."""
+        record: Dict = {"stage": name}
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        previous, self._active = self._active, record
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            self._active = previous
+            if started:
+                tracemalloc.stop()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+            record.update({
+                "seconds": seconds,
+                "peak_mb": peak / 1e6,
+                "current_mb": current / 1e6,
+                "top_sites": [{"site": str(stat.traceback), "size_mb": stat.size_diff / 1e6, "count": stat.count_diff}
+                              for stat in growth[:MEMORY_CONFIG["top_sites"]] if stat.size_diff > 0],
+            })
+            self._check_projection(record)
+            with self._lock:
+                self.stages.append(record)
+            logging.info(f"[{name}] peak traced memory {record['peak_mb']:.1f} MB")
+
+    def calibrated_factors(self) -> Dict[str, float]:
+        """Footprint factors observed in the tracked stages so far; later stages win."""
+        factors: Dict[str, float] = {}
+        with self._lock:
+            for stage in self.stages:
+                factors.update(stage.get("calibration", {}))
+        return factors
+
+    def report(self, path: Optional[str] = None):
+        """Write the stages, budget decisions and calibrated factors as JSON, log the peaks and update the factors file."""
+        path = path or MEMORY_CONFIG["report_file"]
+        factors = self.calibrated_factors()
+        with self._lock:
+            report = {"budget_mb": MEMORY_CONFIG["budget_mb"], "stages": list(self.stages),
+                      "decisions": list(self.decisions), "calibrated_factors": factors}
+        for stage in report["stages"]:
+            top = stage["top_sites"][0] if stage["top_sites"] else None
+            logging.info(f"Memory — {stage['stage']}: peak {stage['peak_mb']:.1f} MB"
+                         + (f", largest site {top['site']} ({top['size_mb']:.1f} MB)" if top else ""))
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            logging.info(f"Memory report saved to {path}")
+        factors_file = MEMORY_CONFIG["factors_file"]
+        if factors_file and factors:
+            saved = {}
+            if os.path.exists(factors_file):
+                with open(factors_file) as f:
+                    saved = json.load(f)
+            saved.update(factors)
+            with open(factors_file, "w") as f:
+                json.dump(saved, f, indent=2, sort_keys=True)
+            logging.info(f"Footprint factors saved to {factors_file}")
+        return report
+
+MEMORY = MemoryTracker()
@@ -3,39 +3,76 @@ import glob
 import os
 from functools import reduce
 
-data_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Read class list, normalize username column to lower
-class_list = pd.read_excel(os.path.join(data_dir, "00 Class List.xlsx"))
-# Find the username column (case-insensitive)
-class_username_col = [col for col in class_list.columns if col.lower() == "username"][0]
-class_list["username"] = class_list[class_username_col].astype(str).str.lower()
-
-# Find the name column (first column that is not 'username')
-name_col = [col for col in class_list.columns if col != class_username_col][0]
-# Check for duplicate names
-duplicates = class_list[class_list.duplicated(subset=[name_col], keep=False)]
-if not duplicates.empty:
-    print(f"Warning: Duplicate names found in class list (column '{name_col}'):")
-    print(duplicates[[name_col, 'username']])
-
-# Read all cleaned quiz files
-quiz_files = glob.glob(os.path.join(data_dir, "*_CLEANED.xlsx"))
-quiz_dfs = []
-for f in quiz_files:
-    df = pd.read_excel(f)
-    df["username"] = df["username"].astype(str).str.lower()
-    quiz_dfs.append(df)
-
-# Merge all quiz dataframes on username (wide format)
-if quiz_dfs:
-    quiz_merged = reduce(lambda left, right: pd.merge(left, right, on="username", how="outer"), quiz_dfs)  # Merge all quiz dataframes on username (wide format)
-else:
+from artifacts import ARTIFACT_CONFIG, EXTENSIONS, artifact_path, read_artifact, write_artifact
+from memory import over_budget
+from multiselect import MULTI_SELECT_ATTR, combine_specs
+from roster import load_roster, normalize_usernames
+
+def read_class_list(path):
+    """Every row of the class list, with normalized usernames (duplicates are flagged by the roster)."""
+    return load_roster(path).frame
+
+def read_cleaned(path):
+    """Read one cleaned quiz file with a normalized username column."""
+    df = read_artifact(path)
+    df["username"] = normalize_usernames(df["username"])
+    return df
+
+def merge_frames(class_list, quiz_dfs):
+    """Outer-join the cleaned quiz frames on username, then with the class list."""
+    if quiz_dfs:
+        quiz_merged = reduce(lambda left, right: pd.merge(left, right, on="username", how="outer"), quiz_dfs)  # Merge all quiz dataframes on username (wide format)
+    else:
+        quiz_merged = pd.DataFrame(columns=["username"])
+    merged = pd.merge(class_list, quiz_merged, on="username", how="outer")
+    # merge() drops attrs; keep the multi-select option lists of the quiz files
+    specs = combine_specs(quiz_dfs)
+    if specs:
+        merged.attrs[MULTI_SELECT_ATTR] = specs
+    return merged
+
+def merge_files_incrementally(class_list, paths):
+    """merge_frames over cleaned files read one at a time, each merged in and dropped before the next.
+
+    This bounds the inputs held at once to one cleaned file, not the merge:
+    the wide result of every file and the class list is still built whole,
+    since callers get it back as a DataFrame.
+    """
     quiz_merged = pd.DataFrame(columns=["username"])
+    specs = {}
+    for i, path in enumerate(paths):
+        df = read_cleaned(path)
+        specs.update(df.attrs.get(MULTI_SELECT_ATTR, {}))
+        quiz_merged = df if i == 0 else pd.merge(quiz_merged, df, on="username", how="outer")
+        del df
+    merged = pd.merge(class_list, quiz_merged, on="username", how="outer")
+    if specs:
+        merged.attrs[MULTI_SELECT_ATTR] = specs
+    return merged
+
+def merge_cleaned_files(class_list, paths):
+    """Merge cleaned files with the class list, one file at a time when they would exceed the memory budget."""
+    if over_budget("merge_all", paths):
+        return merge_files_incrementally(class_list, paths)
+    return merge_frames(class_list, [read_cleaned(f) for f in paths])
+
+def merge_all_cleaned(data_dir, class_list_file="00 Class List.xlsx", output_file="ALL_MERGED.xlsx"):
+    """Merge every *_CLEANED quiz file in data_dir with the class list on username.
+
+    Cleaned files and the output use the intermediate format of artifacts.ARTIFACT_CONFIG.
+    """
+    # Read class list, normalize username column to lower
+    class_list = read_class_list(os.path.join(data_dir, class_list_file))
+
+    # Merge all cleaned quiz files on username (wide format), then with the class list
+    quiz_files = glob.glob(os.path.join(data_dir, "*_CLEANED" + EXTENSIONS[ARTIFACT_CONFIG["format"]]))
+    final_merged = merge_cleaned_files(class_list, quiz_files)
 
-# Merge with class list
-final_merged = pd.merge(class_list, quiz_merged, on="username", how="outer")
+    # Save the merged file
+    output_file = artifact_path(output_file)
+    write_artifact(final_merged, os.path.join(data_dir, output_file))
+    print(f"Merged file saved as {output_file}")
+    return final_merged
 
-# Save the merged file
-final_merged.to_excel(os.path.join(data_dir, "ALL_MERGED.xlsx"), index=False)
-print("Merged file saved as ALL_MERGED.xlsx")
+if __name__ == "__main__":
+    merge_all_cleaned(os.path.dirname(os.path.abspath(__file__)))
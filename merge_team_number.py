@@ -1,4 +1,5 @@
-import pandas as pd
+from artifacts import artifact_path, find_artifact, read_artifact, write_artifact
+from roster import load_roster
 
 # === CONFIGURATION ===
 # Update these filenames if needed
@@ -6,16 +7,19 @@ QUIZ_FILE = "2 Capstone Team Infrastructure Establishment (Group) - Attempt Deta
 CLASS_LIST_FILE = "00 Class List.xlsx"
 OUTPUT_FILE = "cleaned_quiz_with_teams.xlsx"
 
-# Read the cleaned quiz file
-quiz_df = pd.read_excel(QUIZ_FILE)
+def merge_team_number(quiz_file=QUIZ_FILE, class_list_file=CLASS_LIST_FILE, output_file=OUTPUT_FILE):
+    """Attach each student's Team Number from the class list to a cleaned quiz file."""
+    # Read the cleaned quiz file
+    quiz_df = read_artifact(find_artifact(quiz_file))
 
-# Read the class list file
-class_list_df = pd.read_excel(CLASS_LIST_FILE)
+    # Look up each quiz row's team in the shared class list index (usernames matched case-insensitively)
+    df_merged = load_roster(class_list_file).join(quiz_df, ['Team Number'])
 
-# Merge on 'username', keeping only quiz rows
-df_merged = pd.merge(quiz_df, class_list_df[['username', 'Team Number']], on='username', how='left')
+    # Save to a new Excel file
+    output_file = write_artifact(df_merged, artifact_path(output_file))
 
-# Save to a new Excel file
-df_merged.to_excel(OUTPUT_FILE, index=False)
+    print(f"Merged file saved as {output_file}")
+    return df_merged
 
-print(f"Merged file saved as {OUTPUT_FILE}")
+if __name__ == "__main__":
+    merge_team_number()
@@ -0,0 +1,314 @@
+"""Per-call latency, token, retry and parse-failure metrics for grading runs.
+
+Every chat completion made through completions.create_chat_completion is
+recorded in METRICS, labelled by student, category and model. At the end of
+a run the evaluators log a summary (p50/p95/p99 latency, tokens per student,
+estimated cost) and optionally write it as JSON and as a Prometheus textfile
+so the throughput of different configurations can be compared.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+# USD per 1K tokens (prompt, completion); unknown models are costed at zero
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+# Share of the prompt price charged for tokens served from the provider's prefix cache
+CACHED_PROMPT_PRICE_FACTOR = 0.5
+
+PERCENTILES = (50, 95, 99)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Estimated USD cost of a call from MODEL_PRICES, with cached prompt tokens at the discounted rate."""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    uncached_tokens = prompt_tokens - cached_tokens
+    return ((uncached_tokens + cached_tokens * CACHED_PROMPT_PRICE_FACTOR) / 1000 * prompt_price
+            + completion_tokens / 1000 * completion_price)
+
+class RunMetrics:
+    """Thread-safe collector of per-call grading metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and restart the run clock."""
+        with self._lock:
+            self.calls: List[Dict] = []
+            self.parse_failures: List[Dict] = []
+            self.cascade: List[Dict] = []
+            self.dedup: List[Dict] = []
+            self.hedges: List[Dict] = []
+            self.started_at = time.time()
+
+    def record_call(self, student_id: str, category: str, model: str, latency: float,
+                    prompt_tokens: int = 0, completion_tokens: int = 0, retries: int = 0,
+                    succeeded: bool = True, ttft: Optional[float] = None, aborted_streams: int = 0,
+                    cached_tokens: int = 0):
+        """Record one completed (or finally failed) API call; ttft is set for streamed calls."""
+        with self._lock:
+            self.calls.append({
+                "student": str(student_id),
+                "category": category,
+                "model": model,
+                "latency": latency,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "retries": retries,
+                "succeeded": succeeded,
+                "ttft": ttft,
+                "aborted_streams": aborted_streams,
+                "cached_tokens": cached_tokens,
+            })
+
+    def record_parse_failure(self, student_id: str, category: str, model: str):
+        """Record a response that could not be turned into a valid evaluation."""
+        with self._lock:
+            self.parse_failures.append({"student": str(student_id), "category": category, "model": model})
+
+    def record_dedup(self, student_id: str, category: str, reused: bool):
+        """Record a deduplicated payload: reused is True when an identical submission's grade was copied."""
+        with self._lock:
+            self.dedup.append({"student": str(student_id), "category": category, "reused": reused})
+
+    def record_hedge(self, student_id: str, category: str, won: bool):
+        """Record a call that sent a hedged duplicate; won is True when the duplicate answered first."""
+        with self._lock:
+            self.hedges.append({"student": str(student_id), "category": category, "won": won})
+
+    def record_cascade(self, student_id: str, category: str, model: str, escalation: Optional[str]):
+        """Record a cascade first pass with model; escalation is the reason it was re-graded, or None."""
+        with self._lock:
+            self.cascade.append({"student": str(student_id), "category": category, "model": model,
+                                 "escalation": escalation})
+
+    def summary(self) -> Dict:
+        """Aggregate the recorded calls into run-level statistics."""
+        with self._lock:
+            calls = list(self.calls)
+            parse_failures = list(self.parse_failures)
+            cascade = list(self.cascade)
+            dedup = list(self.dedup)
+            hedges = list(self.hedges)
+            wall_seconds = time.time() - self.started_at
+
+        def aggregate(group: List[Dict]) -> Dict:
+            latencies = [c["latency"] for c in group]
+            ttfts = [c["ttft"] for c in group if c["ttft"] is not None]
+            prompt_tokens = sum(c["prompt_tokens"] for c in group)
+            completion_tokens = sum(c["completion_tokens"] for c in group)
+            cached_tokens = sum(c["cached_tokens"] for c in group)
+            return {
+                "calls": len(group),
+                "failed_calls": sum(1 for c in group if not c["succeeded"]),
+                "retries": sum(c["retries"] for c in group),
+                "latency_seconds": {f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+                "latency_seconds_sum": sum(latencies),
+                "time_to_first_token_seconds": {f"p{p}": percentile(ttfts, p) for p in PERCENTILES},
+                "streamed_calls": len(ttfts),
+                "aborted_streams": sum(c["aborted_streams"] for c in group),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "prompt_cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+                "estimated_cost_usd": sum(estimate_cost(c["model"], c["prompt_tokens"], c["completion_tokens"], c["cached_tokens"]) for c in group),
+            }
+
+        def group_by(key: str) -> Dict[str, List[Dict]]:
+            groups: Dict[str, List[Dict]] = {}
+            for call in calls:
+                groups.setdefault(call[key], []).append(call)
+            return groups
+
+        by_student = group_by("student")
+        summary = aggregate(calls)
+        summary.update({
+            "wall_seconds": wall_seconds,
+            "calls_per_second": len(calls) / wall_seconds if wall_seconds > 0 else 0.0,
+            "students": len(by_student),
+            "parse_failures": len(parse_failures),
+            "by_model": {model: aggregate(group) for model, group in group_by("model").items()},
+            "by_category": {category: aggregate(group) for category, group in group_by("category").items()},
+            "tokens_per_student": {
+                student: sum(c["prompt_tokens"] + c["completion_tokens"] for c in group)
+                for student, group in by_student.items()
+            },
+            "parse_failures_by_category": {},
+        })
+        for failure in parse_failures:
+            counts = summary["parse_failures_by_category"]
+            counts[failure["category"]] = counts.get(failure["category"], 0) + 1
+        if cascade:
+            summary["cascade"] = _cascade_summary(cascade)
+        if dedup:
+            saved = sum(1 for d in dedup if d["reused"])
+            summary["dedup"] = {
+                "payloads": len(dedup),
+                "unique_payloads": len(dedup) - saved,
+                "calls_saved": saved,
+                "calls_saved_rate": saved / len(dedup),
+            }
+        if hedges:
+            won = sum(1 for h in hedges if h["won"])
+            summary["hedging"] = {
+                "hedged_calls": len(hedges),
+                "hedge_rate": len(hedges) / len(calls) if calls else 0.0,
+                "hedges_won": won,
+            }
+        return summary
+
+    def log_summary(self):
+        """Log the headline numbers of the run."""
+        s = self.summary()
+        if not s["calls"]:
+            return
+        latency = s["latency_seconds"]
+        per_student = s["tokens_per_student"]
+        mean_tokens = sum(per_student.values()) / len(per_student) if per_student else 0
+        logging.info(
+            f"Run metrics — calls: {s['calls']} ({s['calls_per_second']:.2f}/s), retries: {s['retries']}, "
+            f"parse failures: {s['parse_failures']}, latency p50/p95/p99: "
+            f"{latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f}s"
+        )
+        if s["streamed_calls"]:
+            ttft = s["time_to_first_token_seconds"]
+            logging.info(
+                f"Run metrics — streamed calls: {s['streamed_calls']}, aborted streams: {s['aborted_streams']}, "
+                f"first token p50/p95: {ttft['p50']:.2f}/{ttft['p95']:.2f}s"
+            )
+        if "cascade" in s:
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in s["cascade"]["escalations_by_reason"].items())
+            logging.info(
+                f"Run metrics — cascade first passes: {s['cascade']['first_passes']}, escalated: "
+                f"{s['cascade']['escalations']} ({s['cascade']['escalation_rate']:.0%}){f' — {reasons}' if reasons else ''}"
+            )
+        if "dedup" in s:
+            logging.info(
+                f"Run metrics — dedup: {s['dedup']['unique_payloads']} unique of {s['dedup']['payloads']} payloads, "
+                f"{s['dedup']['calls_saved']} gradings saved ({s['dedup']['calls_saved_rate']:.0%})"
+            )
+        if "hedging" in s:
+            logging.info(
+                f"Run metrics — hedged calls: {s['hedging']['hedged_calls']} ({s['hedging']['hedge_rate']:.0%}), "
+                f"duplicate answered first: {s['hedging']['hedges_won']}"
+            )
+        logging.info(
+            f"Run metrics — tokens: {s['prompt_tokens']} prompt ({s['prompt_cache_hit_rate']:.0%} cached) + {s['completion_tokens']} completion, "
+            f"{mean_tokens:.0f} per student, estimated cost: ${s['estimated_cost_usd']:.2f}"
+        )
+
+    def write_json(self, path: str):
+        """Write the run summary as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        logging.info(f"Run metrics saved to {path}")
+
+    def write_prometheus(self, path: str):
+        """Write the run summary in the Prometheus textfile-collector format."""
+        s = self.summary()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List):
+            lines.append(f"# HELP mgmt4901_{name} {help_text}")
+            lines.append(f"# TYPE mgmt4901_{name} {kind}")
+            for labels, value, suffix in samples:
+                label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                label_block = f"{{{label_str}}}" if label_str else ""
+                lines.append(f"mgmt4901_{name}{suffix}{label_block} {value}")
+
+        latency_samples = []
+        for model, agg in s["by_model"].items():
+            for p in PERCENTILES:
+                latency_samples.append(({"model": model, "quantile": str(p / 100)}, agg["latency_seconds"][f"p{p}"], ""))
+            latency_samples.append(({"model": model}, agg["latency_seconds_sum"], "_sum"))
+            latency_samples.append(({"model": model}, agg["calls"], "_count"))
+        metric("llm_call_latency_seconds", "summary", "Chat completion latency.", latency_samples)
+        ttft_samples = []
+        for model, agg in s["by_model"].items():
+            if agg["streamed_calls"]:
+                for p in PERCENTILES:
+                    ttft_samples.append(({"model": model, "quantile": str(p / 100)}, agg["time_to_first_token_seconds"][f"p{p}"], ""))
+                ttft_samples.append(({"model": model}, agg["streamed_calls"], "_count"))
+        if ttft_samples:
+            metric("llm_time_to_first_token_seconds", "summary", "Time to first streamed token.", ttft_samples)
+            metric("llm_aborted_streams_total", "counter", "Streams dropped because the output left JSON format.",
+                   [({"model": model}, agg["aborted_streams"], "") for model, agg in s["by_model"].items()])
+        metric("llm_tokens_total", "counter", "Tokens used by chat completions.", [
+            ({"model": model, "type": kind}, agg[f"{kind}_tokens"], "")
+            for model, agg in s["by_model"].items() for kind in ("prompt", "completion", "cached_prompt")
+        ])
+        metric("llm_retries_total", "counter", "Chat completion retries.",
+               [({"model": model}, agg["retries"], "") for model, agg in s["by_model"].items()])
+        metric("llm_failed_calls_total", "counter", "Chat completions that failed after all retries.",
+               [({"model": model}, agg["failed_calls"], "") for model, agg in s["by_model"].items()])
+        metric("llm_parse_failures_total", "counter", "Responses that could not be parsed into an evaluation.",
+               [({"category": category}, count, "") for category, count in s["parse_failures_by_category"].items()])
+        metric("llm_estimated_cost_dollars", "gauge", "Estimated cost of the run.",
+               [({"model": model}, agg["estimated_cost_usd"], "") for model, agg in s["by_model"].items()])
+        if "cascade" in s:
+            metric("cascade_first_passes_total", "counter", "Categories graded first by the cascade's fast model.",
+                   [({"category": category}, agg["first_passes"], "") for category, agg in s["cascade"]["by_category"].items()])
+            metric("cascade_escalations_total", "counter", "Cascade first passes re-graded by the strong model.",
+                   [({"reason": reason}, count, "") for reason, count in s["cascade"]["escalations_by_reason"].items()])
+        if "dedup" in s:
+            metric("dedup_calls_saved_total", "counter", "Gradings copied from an identical submission instead of calling the API.",
+                   [({}, s["dedup"]["calls_saved"], "")])
+        metric("run_calls_per_second", "gauge", "Chat completions per second of wall time.",
+               [({}, s["calls_per_second"], "")])
+
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        logging.info(f"Prometheus metrics saved to {path}")
+
+    def report(self, json_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """Log the summary and write whichever output files were requested."""
+        self.log_summary()
+        if json_path:
+            self.write_json(json_path)
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+
+def _cascade_summary(cascade: List[Dict]) -> Dict:
+    """First passes, escalations and escalation rates (overall, by reason and by category)."""
+
+    def rates(group: List[Dict]) -> Dict:
+        escalations = sum(1 for c in group if c["escalation"])
+        return {
+            "first_passes": len(group),
+            "escalations": escalations,
+            "escalation_rate": escalations / len(group) if group else 0.0,
+        }
+
+    summary = rates(cascade)
+    summary["escalations_by_reason"] = {}
+    by_category: Dict[str, List[Dict]] = {}
+    for c in cascade:
+        if c["escalation"]:
+            summary["escalations_by_reason"][c["escalation"]] = summary["escalations_by_reason"].get(c["escalation"], 0) + 1
+        by_category.setdefault(c["category"], []).append(c)
+    summary["by_category"] = {category: rates(group) for category, group in by_category.items()}
+    return summary
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Shared by every evaluator in the process
+METRICS = RunMetrics()
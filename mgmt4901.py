@@ -0,0 +1,408 @@
+"""Single command-line entry point for the MGMT 4901 scripts.
+
+Usage: python mgmt4901.py <command> [options]
+
+Each subcommand imports the script it wraps (and with it pandas, openai or the
+Google clients) only when it runs, so `--help` and the light commands start
+quickly. Check with: python -X importtime mgmt4901.py --help
+"""
+import argparse
+import os
+import sys
+
+from registry import EVALUATORS, MAILERS, evaluator_module, mailer_module
+
+def cmd_clean(args):
+    from artifacts import artifact_path, write_artifact
+    from clean_brightspace_quiz import clean_quiz_file, clean_directory
+    if not args.files:
+        clean_directory(args.data_dir)
+        return
+    for path in args.files:
+        print(f"Cleaning {path}...")
+        cleaned = clean_quiz_file(path)
+        outname = artifact_path(path.replace('.xlsx', '_CLEANED.xlsx'))
+        write_artifact(cleaned, outname)
+        print(f"Saved cleaned file: {outname}")
+
+def cmd_merge_all(args):
+    from merge_all_cleaned import merge_all_cleaned
+    merge_all_cleaned(args.data_dir, class_list_file=args.class_list, output_file=args.output)
+
+def cmd_merge_teams(args):
+    from merge_team_number import merge_team_number
+    merge_team_number(args.quiz_file, class_list_file=args.class_list, output_file=args.output)
+
+def cmd_merge_concat(args):
+    from merge_clean_excel import merge_excel_files
+    merge_excel_files(args.data_dir, output_file=args.output)
+
+def cmd_features(args):
+    from feature_engineering import engineer_features
+    engineer_features(args.merged, args.output)
+
+def cmd_likert(args):
+    from apply_likert_formatting import apply_likert_formatting
+    apply_likert_formatting(args.input, args.output)
+
+def cmd_teams(args):
+    from team_formation import form_and_save
+    summary = form_and_save(args.features, args.class_list, output_file=args.output, team_size=args.team_size,
+                            seed=args.seed)
+    before, after = summary["before"], summary["after"]
+    print(f"Formed {summary['teams']} teams for {summary['students']} students in {summary['seconds']:.1f}s")
+    print(f"Teams with someone keen on every role: {before['full_coverage']:.0%} (random) → {after['full_coverage']:.0%}")
+    print(f"Degree/major imbalance: {before['imbalance']:.2f} (random) → {after['imbalance']:.2f}")
+
+def cmd_format(args):
+    from format_feedback import format_feedback
+    format_feedback(eval_file=args.eval_file, class_list_file=args.class_list, output_file=args.output,
+                    chunksize=args.chunksize, keep=args.keep)
+
+def _grading_overrides(args) -> dict:
+    """CONFIG values set by the shared grading options."""
+    return {
+        "model": args.model,
+        "cascade_model": args.cascade_model,
+        "dedup": args.dedup or None,
+        "team_column": args.team_column,
+        "metrics_json": args.metrics_json,
+        "metrics_prom": args.metrics_prom,
+        "trace_file": args.trace,
+    }
+
+def _configure_evaluator(args):
+    """Import the chosen evaluator and apply the shared grading options to its CONFIG."""
+    evaluator = evaluator_module(args.evaluator)
+    overrides = {
+        "submission_file": args.submission_file,
+        "rubric_file": args.rubric_file,
+        "rubric_sheet": args.rubric_sheet,
+        **_grading_overrides(args),
+        "incremental": getattr(args, "incremental", False) or None,
+    }
+    if args.evaluator == "3d":
+        overrides["summary_mode"] = args.summary_mode
+    # evaluate_3d writes back into its workbook; the other evaluators write a long CSV
+    overrides["output_workbook" if args.evaluator == "3d" else "output_csv"] = args.output
+    evaluator.CONFIG.update({key: value for key, value in overrides.items() if value is not None})
+    _configure_client(args)
+    return evaluator
+
+def _configure_client(args):
+    """Apply the backend, retry and streaming options to the shared completion client."""
+    from backends import BACKEND_CONFIG
+    from completions import CLIENT_CONFIG
+    CLIENT_CONFIG["backend"] = args.backend
+    backend_overrides = {"api_base": args.backend_url, "model": args.local_model, "max_concurrency": args.concurrency}
+    BACKEND_CONFIG[args.backend].update({key: value for key, value in backend_overrides.items()
+                                         if value is not None and (key == "max_concurrency" or args.backend == "local")})
+    if args.max_retries is not None:
+        CLIENT_CONFIG["max_retries"] = args.max_retries
+    CLIENT_CONFIG["stream"] = args.stream
+    CLIENT_CONFIG["hedge"] = args.hedge
+    if args.hedge_budget is not None:
+        CLIENT_CONFIG["hedge_budget"] = args.hedge_budget
+
+def cmd_grade(args):
+    evaluator = _configure_evaluator(args)
+    if args.evaluator == "3d":
+        evaluator.main(test_mode=not args.all)
+    else:
+        evaluator.main()
+
+def cmd_regrade(args):
+    import regrade
+    regrade.regrade(_configure_evaluator(args), workers=args.workers)
+
+def cmd_watch(args):
+    import watch
+    evaluator = None
+    if args.evaluator:
+        evaluator = evaluator_module(args.evaluator)
+        overrides = {"rubric_file": args.rubric_file, "rubric_sheet": args.rubric_sheet, **_grading_overrides(args)}
+        evaluator.CONFIG.update({key: value for key, value in overrides.items() if value is not None})
+        _configure_client(args)
+    if args.pattern:
+        watch.WATCH_CONFIG["pattern"] = args.pattern
+    watch.WATCH_CONFIG["settle_seconds"] = args.settle
+    watch.watch(args.data_dir, evaluator, once=args.once, use_inotify=not args.poll)
+
+def cmd_pipeline(args):
+    import pipeline
+    evaluator = None
+    if args.evaluator:
+        evaluator = EVALUATORS[args.evaluator]
+        module = evaluator_module(evaluator)
+        overrides = {"rubric_file": args.rubric_file, "rubric_sheet": args.rubric_sheet, **_grading_overrides(args)}
+        module.CONFIG.update({key: value for key, value in overrides.items() if value is not None})
+        _configure_client(args)
+    mailer = MAILERS[args.mail] if args.mail else None
+
+    def confirm_mail(count: int) -> bool:
+        if args.yes:
+            return True
+        if not sys.stdin.isatty():
+            return False
+        return input(f"Email feedback to {count} students? [y/N] ").strip().lower() == "y"
+
+    stages = pipeline.build_pipeline(args.data_dir, quiz=args.quiz, evaluator=evaluator, mailer=mailer,
+                                     mail_limit=args.mail_limit, confirm_mail=confirm_mail)
+    if args.dry_run:
+        for name, deps in stages.dependencies().items():
+            state = "up to date" if stages.is_fresh(stages.stages[name]) else "would run"
+            print(f"{name}: {state}" + (f" (after {', '.join(deps)})" if deps else ""))
+        return
+    stages.run(workers=args.workers)
+
+def cmd_schedule(args):
+    import scheduler
+    jobs = scheduler.load_jobs(args.jobs_file)
+    overrides = {key: value for key, value in _grading_overrides(args).items() if value is not None}
+    for job in jobs:
+        job.evaluator.CONFIG.update(overrides)
+    _configure_client(args)
+    if args.trace:
+        from tracing import TRACER
+        TRACER.enable()
+    scheduler.run_jobs(jobs, workers=args.workers, metrics_json=args.metrics_json, metrics_prom=args.metrics_prom)
+    if args.trace:
+        TRACER.write_chrome_trace(args.trace)
+
+def cmd_queue_enqueue(args):
+    import workqueue
+    _configure_evaluator(args)
+    workqueue.enqueue(args.db, args.evaluator, job_name=args.job)
+
+def cmd_queue_work(args):
+    import workqueue
+    _configure_client(args)
+    options = {"lease_seconds": args.lease, "claim_size": args.claim_size}
+    if args.processes > 1:
+        workqueue.run_workers(args.db, args.processes, **options)
+    else:
+        workqueue.run_worker(args.db, **options)
+
+def cmd_queue_status(args):
+    import workqueue
+    for job, counts in workqueue.queue_status(args.db).items():
+        total = sum(counts.values())
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        details = ", ".join(f"{status}: {n}" for status, n in sorted(counts.items()))
+        print(f"{job}: {finished}/{total} finished ({details})")
+
+def cmd_queue_merge(args):
+    import workqueue
+    workqueue.merge(args.db, args.job)
+
+def cmd_mail(args):
+    mailer = mailer_module(args.template)
+    df = mailer.load_feedback(args.feedback_csv) if args.feedback_csv else mailer.load_feedback()
+    service = mailer.authenticate_gmail(args.credentials_dir) if args.credentials_dir else mailer.authenticate_gmail()
+    if args.class_list:
+        # Fill in addresses and first names the feedback file is missing from the class list
+        from roster import load_roster
+        df = load_roster(args.class_list).fill(df, ["E-Mail Address", "First Name"])
+    mailer.send_all(df, service, limit=args.limit)
+
+def _add_evaluator_args(p):
+    p.add_argument("evaluator", choices=sorted(EVALUATORS))
+    p.add_argument("--submission-file")
+    p.add_argument("--rubric-file")
+    p.add_argument("--rubric-sheet")
+    p.add_argument("--output", help="Output CSV (3A/submissions) or graded workbook (3d, default: in place)")
+    p.add_argument("--summary-mode", choices=["raw", "categories"],
+                   help="3d only: summarize the raw answers (default) or the category evaluations, "
+                        "falling back to the raw answers when a category failed")
+    _add_grading_args(p)
+
+def _add_grading_args(p):
+    p.add_argument("--model")
+    p.add_argument("--cascade-model",
+                   help="Grade with this fast model first and escalate to --model only for unusable results (e.g. gpt-4o-mini)")
+    p.add_argument("--dedup", action="store_true", help="Grade identical submissions once and copy the result")
+    p.add_argument("--team-column", help="With --dedup, only share grades within teams in this column (e.g. \"Team Number\")")
+    _add_client_args(p)
+    p.add_argument("--metrics-json", help="Write run metrics (latency percentiles, tokens, cost) to this JSON file")
+    p.add_argument("--metrics-prom", help="Write run metrics to this Prometheus textfile")
+    p.add_argument("--trace", help="Record stage spans and write them as Chrome trace-event JSON to this file")
+
+def _add_client_args(p):
+    p.add_argument("--backend", choices=["openai", "local"], default="openai",
+                   help="Hosted OpenAI API, or a local OpenAI-compatible server (llama.cpp, Ollama) for offline grading")
+    p.add_argument("--backend-url", help="Base URL of the local server (default http://127.0.0.1:8080/v1)")
+    p.add_argument("--local-model", help="Model name on the local server (default: the --model name)")
+    p.add_argument("--concurrency", type=int,
+                   help="Requests in flight at once, i.e. students graded in parallel (default 1 for openai, 4 for local)")
+    p.add_argument("--max-retries", type=int, help="Retries per API call on transient errors (default 2)")
+    p.add_argument("--stream", action="store_true",
+                   help="Stream completions and re-issue as soon as the output cannot become valid JSON")
+    p.add_argument("--hedge", action="store_true",
+                   help="Send a duplicate request when a call outlasts its category's p95 latency; the first JSON answer wins")
+    p.add_argument("--hedge-budget", type=float, help="Most duplicate requests per call with --hedge (default 0.1)")
+
+def build_parser() -> argparse.ArgumentParser:
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(prog="mgmt4901", description="MGMT 4901 data cleaning, grading and mailing tools.")
+    parser.add_argument("--artifacts", choices=["xlsx", "parquet", "arrow"],
+                        help="Format of the intermediate files passed between scripts (default xlsx; see artifacts.py)")
+    parser.add_argument("--memory-budget", type=float,
+                        help="MB; clean and merge switch to their low-memory paths above it (see memory.py)")
+    parser.add_argument("--memory-report", help="Track peak memory and top allocation sites per stage into this JSON file")
+    parser.add_argument("--memory-factors",
+                        help="JSON of footprint factors for --memory-budget, calibrated and updated by --memory-report")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("clean", help="Clean Brightspace quiz exports into one row per student")
+    p.add_argument("files", nargs="*", help="Export files to clean (default: every export in --data-dir)")
+    p.add_argument("--data-dir", default=here)
+    p.set_defaults(func=cmd_clean)
+
+    p = sub.add_parser("merge", help="Merge cleaned quiz files, team numbers or raw workbooks")
+    merge_sub = p.add_subparsers(dest="merge_command", required=True)
+    m = merge_sub.add_parser("all", help="Outer-join every *_CLEANED.xlsx with the class list")
+    m.add_argument("--data-dir", default=here)
+    m.add_argument("--class-list", default="00 Class List.xlsx", help="Class list file name inside --data-dir")
+    m.add_argument("--output", default="ALL_MERGED.xlsx", help="Output file name inside --data-dir")
+    m.set_defaults(func=cmd_merge_all)
+    m = merge_sub.add_parser("teams", help="Attach Team Number to a cleaned quiz file")
+    m.add_argument("quiz_file")
+    m.add_argument("--class-list", default="00 Class List.xlsx")
+    m.add_argument("--output", default="cleaned_quiz_with_teams.xlsx")
+    m.set_defaults(func=cmd_merge_teams)
+    m = merge_sub.add_parser("concat", help="Stack every workbook in a directory")
+    m.add_argument("--data-dir", default=here)
+    m.add_argument("--output", default="merged_output.xlsx", help="Output file name inside --data-dir")
+    m.set_defaults(func=cmd_merge_concat)
+
+    p = sub.add_parser("features", help="Add degree/major flags to ALL_MERGED.xlsx")
+    p.add_argument("--merged", default="ALL_MERGED.xlsx")
+    p.add_argument("--output", default="TEAM_FEATURES.xlsx")
+    p.set_defaults(func=cmd_features)
+
+    p = sub.add_parser("likert", help="Colour-code the Likert columns of TEAM_FEATURES.xlsx (always written as Excel)")
+    p.add_argument("--input", default="TEAM_FEATURES.xlsx")
+    p.add_argument("--output", default="TEAM_FEATURES_COLORED.xlsx")
+    p.set_defaults(func=cmd_likert)
+
+    p = sub.add_parser("teams", help="Form teams from TEAM_FEATURES.xlsx and write Team Number into the class list")
+    p.add_argument("--features", default="TEAM_FEATURES.xlsx")
+    p.add_argument("--class-list", default="00 Class List.xlsx")
+    p.add_argument("--output", help="Write the class list with team numbers here instead of in place (with a backup)")
+    p.add_argument("--team-size", type=int, help="Students per team (default TEAM_CONFIG['team_size'])")
+    p.add_argument("--seed", type=int, help="Random seed, for a reproducible assignment")
+    p.set_defaults(func=cmd_teams)
+
+    p = sub.add_parser("grade", help="Grade submissions against the rubric with the OpenAI API")
+    _add_evaluator_args(p)
+    p.add_argument("--all", action="store_true", help="3d only: grade every student instead of the first one")
+    p.add_argument("--incremental", action="store_true",
+                   help="Only grade answers that are new or changed since the last run into the same output")
+    p.set_defaults(func=cmd_grade)
+
+    p = sub.add_parser("regrade", help="Re-grade only the failed or blank cells of an earlier grading run")
+    _add_evaluator_args(p)
+    p.add_argument("--workers", type=int, default=4, help="Concurrent API calls")
+    p.set_defaults(func=cmd_regrade)
+
+    p = sub.add_parser("watch", help="Clean, merge and grade new exports as they land in the data directory")
+    p.add_argument("--data-dir", default=here)
+    p.add_argument("--pattern", help="Glob of the exports to pick up (default \"*Attempt Details.xlsx\")")
+    p.add_argument("--settle", type=float, default=2.0,
+                   help="Seconds a file must stop changing before it is read (partially downloaded files are skipped)")
+    p.add_argument("--poll", action="store_true", help="Poll the directory even if inotify is available")
+    p.add_argument("--once", action="store_true", help="Process the exports already there, then exit")
+    p.add_argument("--evaluator", choices=sorted(EVALUATORS), help="Also grade each export (incrementally)")
+    p.add_argument("--rubric-file")
+    p.add_argument("--rubric-sheet")
+    _add_grading_args(p)
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("pipeline", help="Run clean → merge → features/grading → format as a cached DAG")
+    p.add_argument("--data-dir", default=here)
+    p.add_argument("--quiz", help="Raw export to attach teams to and grade, e.g. \"3A ... - Attempt Details.xlsx\"")
+    p.add_argument("--evaluator", choices=sorted(EVALUATORS), help="Grade the --quiz export with this evaluator")
+    p.add_argument("--rubric-file")
+    p.add_argument("--rubric-sheet")
+    p.add_argument("--mail", choices=sorted(MAILERS), help="Also email the formatted feedback with this template")
+    p.add_argument("--mail-limit", type=int, help="Send at most N new or changed feedback emails without asking")
+    p.add_argument("--yes", action="store_true", help="Send every new or changed feedback email without asking")
+    p.add_argument("--workers", type=int, default=4, help="Stages run at once")
+    p.add_argument("--dry-run", action="store_true", help="Show which stages are up to date without running any")
+    _add_grading_args(p)
+    p.set_defaults(func=cmd_pipeline)
+
+    p = sub.add_parser("schedule", help="Grade several assignments in one run on a shared worker pool")
+    p.add_argument("jobs_file", help="JSON list of jobs: name, evaluator, submission_file, rubric_file, "
+                                     "rubric_sheet, output, priority")
+    p.add_argument("--workers", type=int, help="Students graded at once (default: the backend's concurrency)")
+    _add_grading_args(p)
+    p.set_defaults(func=cmd_schedule)
+
+    p = sub.add_parser("queue", help="Grade through a durable SQLite work queue with many worker processes")
+    queue_sub = p.add_subparsers(dest="queue_command", required=True)
+    q = queue_sub.add_parser("enqueue", help="Split an evaluator run into (student, category) tasks")
+    q.add_argument("--db", default="grading_queue.db")
+    q.add_argument("--job", help="Job name (default: the evaluator module name)")
+    _add_evaluator_args(q)
+    q.set_defaults(func=cmd_queue_enqueue)
+    q = queue_sub.add_parser("work", help="Claim and grade tasks until the queue is drained")
+    q.add_argument("--db", default="grading_queue.db")
+    q.add_argument("--processes", type=int, default=1, help="Worker processes to start on this machine")
+    q.add_argument("--lease", type=float, default=120, help="Seconds a claimed task stays leased without a heartbeat")
+    q.add_argument("--claim-size", type=int, default=1, help="Tasks claimed per database round trip")
+    _add_client_args(q)
+    q.set_defaults(func=cmd_queue_work)
+    q = queue_sub.add_parser("status", help="Show task counts per job")
+    q.add_argument("--db", default="grading_queue.db")
+    q.set_defaults(func=cmd_queue_status)
+    q = queue_sub.add_parser("merge", help="Write finished results in the evaluator's output format")
+    q.add_argument("--db", default="grading_queue.db")
+    q.add_argument("--job", help="Only merge this job")
+    q.set_defaults(func=cmd_queue_merge)
+
+    p = sub.add_parser("format", help="Pivot evaluation output to one row per student")
+    p.add_argument("--eval-file", default="MGMT4901_3A_Evaluation_Output.csv")
+    p.add_argument("--class-list", default="00 Class List.xlsx")
+    p.add_argument("--output", default="3A Final_Formatted_Feedback.csv")
+    p.add_argument("--chunksize", type=int,
+                   help="Stream the evaluation output this many rows at a time and write the result in chunks")
+    p.add_argument("--keep", choices=["last", "best"], default="last",
+                   help="Result to keep when a student and category were graded more than once")
+    p.set_defaults(func=cmd_format)
+
+    p = sub.add_parser("mail", help="Email formatted feedback through the Gmail API")
+    p.add_argument("--template", choices=sorted(MAILERS), default="3B")
+    p.add_argument("--feedback-csv")
+    p.add_argument("--credentials-dir", help="Directory holding credentials.json and token.json")
+    p.add_argument("--limit", type=int, help="Only send the first N emails")
+    p.add_argument("--class-list", help="Fill in missing email addresses and first names from this class list")
+    p.set_defaults(func=cmd_mail)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.artifacts:
+        from artifacts import ARTIFACT_CONFIG
+        ARTIFACT_CONFIG["format"] = args.artifacts
+    if args.memory_budget is None and args.memory_report is None:
+        args.func(args)
+        return
+    from memory import MEMORY, MEMORY_CONFIG, load_factors
+    MEMORY_CONFIG.update({"budget_mb": args.memory_budget, "report_file": args.memory_report,
+                          "factors_file": args.memory_factors})
+    load_factors()
+    try:
+        # The pipeline tracks each of its stages itself
+        if MEMORY.enabled and args.command != "pipeline":
+            with MEMORY.track(args.command):
+                args.func(args)
+        else:
+            args.func(args)
+    finally:
+        if MEMORY.enabled:
+            MEMORY.report()
+
+if __name__ == "__main__":
+    sys.exit(main())
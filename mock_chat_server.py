@@ -0,0 +1,258 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions with a well-formed evaluation JSON for the
+rubric category named in the prompt, after a configurable delay. A share of
+requests can be failed with HTTP 500 or answered with prose instead of JSON
+to exercise the evaluators' retry and parse-failure paths. Requests with
+"stream": true are answered as server-sent events, a few characters per
+chunk with token_latency between chunks. Prompt caching is imitated by
+reporting usage.prompt_tokens_details.cached_tokens for the longest prompt
+prefix (in 128-token blocks, from 1024 tokens up) seen in an earlier request.
+A share of answers from the models in sloppy_models (all models if empty)
+can be made sloppy — a score outside 15–18 or feedback without a quote — to
+exercise the grading cascade. The "pareto" latency distribution gives the
+heavy tail of a few very slow completions, for testing request hedging.
+Used by benchmark.py; can also be run on its own and targeted with openai.api_base:
+
+    python mock_chat_server.py --port 8000 --latency 0.5 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "pareto")
+
+# Shape of the "pareto" distribution: a heavy tail with finite mean but infinite variance
+PARETO_ALPHA = 1.5
+# Cap on a single pareto delay, in multiples of the mean, to keep runs bounded
+PARETO_MAX_FACTOR = 100
+
+class MockChatServer:
+    """Threaded mock chat-completions server with latency and error injection."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 latency_dist: str = "fixed", error_rate: float = 0.0, malformed_rate: float = 0.0,
+                 seed: Optional[int] = None, token_latency: float = 0.0, sloppy_rate: float = 0.0,
+                 sloppy_models: Tuple[str, ...] = ()):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.token_latency = token_latency
+        self.sloppy_rate = sloppy_rate
+        self.sloppy_models = tuple(sloppy_models)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self._seen_prefixes = set()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockChatServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample_latency(self) -> float:
+        """Draw one response delay from the configured distribution (mean ≈ latency)."""
+        with self._lock:
+            if self.latency <= 0:
+                return 0.0
+            if self.latency_dist == "uniform":
+                return self.random.uniform(0, 2 * self.latency)
+            if self.latency_dist == "lognormal":
+                sigma = 0.75
+                return self.random.lognormvariate(0, sigma) * self.latency / (2.718281828 ** (sigma ** 2 / 2))
+            if self.latency_dist == "pareto":
+                scale = self.latency * (PARETO_ALPHA - 1) / PARETO_ALPHA
+                return min(self.random.paretovariate(PARETO_ALPHA) * scale, PARETO_MAX_FACTOR * self.latency)
+            return self.latency
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return self.random.random() < rate
+
+    def completion_content(self, prompt: str, model: str = "mock") -> str:
+        """Build the assistant message for a user prompt."""
+        if self._roll(self.malformed_rate):
+            return "Here is my evaluation of the student's work: it shows promise but needs more testing."
+        quote = _quote_from_prompt(prompt)
+        category = re.search(r'"rubric_category":\s*"([^"]*)"', prompt)
+        score = 15 + len(prompt) % 4
+        feedback = f"Your point that \"{quote}\" shows promise; the next step is testing it with real users."
+        if (not self.sloppy_models or model in self.sloppy_models) and self._roll(self.sloppy_rate):
+            if self._roll(0.5):
+                score = 20
+            else:
+                feedback = "This shows promise; the next step is testing it with real users."
+        if category:
+            return json.dumps({
+                "rubric_category": category.group(1),
+                "feedback": feedback,
+                "score": score,
+            })
+        return json.dumps({
+            "feedback": f"Your prototype work around \"{quote}\" gives you a solid base to iterate from.",
+            "score": score,
+        })
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.request_count += 1
+                time.sleep(server.sample_latency())
+                if not self.path.rstrip("/").endswith("chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                if server._roll(server.error_rate):
+                    with server._lock:
+                        server.error_count += 1
+                    self._send(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                    return
+                if body.get("stream"):
+                    self._stream(server.build_response(body))
+                else:
+                    payload = server.build_response(body)
+                    # A non-streamed answer still takes the full generation time
+                    pieces = -(-len(payload["choices"][0]["message"]["content"]) // 4)
+                    time.sleep(server.token_latency * pieces)
+                    self._send(200, payload)
+
+            def _stream(self, payload: Dict):
+                content = payload["choices"][0]["message"]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+                try:
+                    for i, piece in enumerate(pieces):
+                        chunk = {
+                            "id": payload["id"],
+                            "object": "chat.completion.chunk",
+                            "created": payload["created"],
+                            "model": payload["model"],
+                            "choices": [{"index": 0, "delta": {"content": piece},
+                                         "finish_reason": "stop" if i == len(pieces) - 1 else None}],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                        if server.token_latency:
+                            time.sleep(server.token_latency)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client dropped the stream early
+                    pass
+
+            def _send(self, status: int, payload: Dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def cached_tokens(self, messages) -> int:
+        """Tokens of the longest prompt prefix already seen, the way provider prefix caches count them."""
+        text = "".join(m.get("role", "") + m.get("content", "") for m in messages)
+        block = 128 * 4
+        cached = 0
+        with self._lock:
+            for end in range(block, len(text) + 1, block):
+                prefix = hash(text[:end])
+                if prefix in self._seen_prefixes:
+                    cached = end
+                self._seen_prefixes.add(prefix)
+        return cached // 4 if cached >= 1024 * 4 else 0
+
+    def build_response(self, body: Dict) -> Dict:
+        """Full chat.completion payload for a request body."""
+        messages = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        content = self.completion_content(prompt, body.get("model", "mock"))
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-mock-{self.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": self.cached_tokens(messages)},
+            },
+        }
+
+def _quote_from_prompt(prompt: str) -> str:
+    """A few words of student text from the prompt, for the feedback's direct quote."""
+    for marker in ("Student Responses:", "Response:", "Submissions:"):
+        if marker in prompt:
+            tail = prompt.split(marker, 1)[1]
+            words = [w for w in re.split(r"\s+", tail) if w and ":" not in w][:4]
+            if words:
+                return " ".join(words).strip('"')
+    return "your idea"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean response delay in seconds")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with HTTP 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of responses that are not JSON")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Delay between streamed chunks in seconds")
+    parser.add_argument("--sloppy-rate", type=float, default=0.0,
+                        help="Share of answers with an out-of-band score or no quote")
+    parser.add_argument("--sloppy-models", default="", help="Comma-separated models that give sloppy answers (default: all)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = MockChatServer(args.host, args.port, args.latency, args.latency_dist,
+                            args.error_rate, args.malformed_rate, args.seed, args.token_latency,
+                            args.sloppy_rate, [m for m in args.sloppy_models.split(",") if m])
+    print(f"Mock chat completions server on {server.api_base}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compact multi-select (M-S) answers: one bitmask column per question.
+
+Brightspace exports a multi-select question as one row per option, and the
+cleaned files used to turn each option into its own 0/1 column
+"{question}: {option}". Surveys with many options made the cleaned and
+merged frames very wide and mostly empty. clean_quiz_file now stores one
+column per question holding the bitmask of the checked options (bit i is
+options[i]), with the option labels kept in df.attrs["multi_select"]. Masks
+of up to 64 options are UInt64; wider ones are zero-padded hex strings,
+since neither Parquet nor Arrow has an integer type past 64 bits.
+Parquet and Arrow intermediates keep attrs, so the compact form survives
+from cleaning through merging. expand_multi_select() turns the masks back
+into 0/1 columns; write_artifact() does so whenever it writes Excel.
+"""
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+MULTI_SELECT_ATTR = "multi_select"
+
+# Questions with more options than this store their masks as hex strings
+MAX_MASK_BITS = 64
+
+def mask_column(masks: List, options: List[str], index=None) -> pd.Series:
+    """Integer masks (None where unanswered) as the column for options: UInt64, or zero-padded hex past 64 options."""
+    if len(options) <= MAX_MASK_BITS:
+        return pd.Series(pd.array(masks, dtype="UInt64"), index=index)
+    width = -(-len(options) // 4)
+    return pd.Series([None if m is None or pd.isna(m) else format(int(m), f"0{width}x") for m in masks],
+                     index=index, dtype="string")
+
+def combine_specs(frames: Iterable[pd.DataFrame]) -> Dict[str, List[str]]:
+    """The multi-select option lists of several frames, for a frame merged from them."""
+    specs: Dict[str, List[str]] = {}
+    for df in frames:
+        specs.update(df.attrs.get(MULTI_SELECT_ATTR, {}))
+    return specs
+
+def _option_column(mask: pd.Series, bit: int) -> pd.Series:
+    missing = mask.isna()
+    if mask.dtype != "UInt64":
+        # Hex strings of masks wider than 64 bits
+        values = [0 if m is None or pd.isna(m) else (int(m, 16) >> bit) & 1 for m in mask]
+    else:
+        values = (mask.fillna(0).to_numpy(dtype=np.uint64) >> np.uint64(bit)) & np.uint64(1)
+    column = pd.Series(pd.array(np.asarray(values, dtype=np.int8), dtype="Int8"), index=mask.index)
+    column[missing] = pd.NA
+    return column
+
+def expand_multi_select(df: pd.DataFrame) -> pd.DataFrame:
+    """df with every bitmask column replaced, in place, by one 0/1 column per option."""
+    specs = df.attrs.get(MULTI_SELECT_ATTR)
+    if not specs:
+        return df
+    columns = {}
+    for col in df.columns:
+        if col not in specs:
+            columns[col] = df[col]
+            continue
+        for bit, option in enumerate(specs[col]):
+            columns[f"{col}: {option}"] = _option_column(df[col], bit)
+    expanded = pd.DataFrame(columns, index=df.index)
+    expanded.attrs = {key: value for key, value in df.attrs.items() if key != MULTI_SELECT_ATTR}
+    return expanded
@@ -0,0 +1,301 @@
+"""Run the data scripts as a cached DAG: make-style, but keyed on content hashes.
+
+Two branches share the cleaned exports:
+
+    clean (one stage per export) → merge_all → features → likert
+    clean <quiz> → teams → grade → format → mail (only with --mail)
+
+Each Stage declares its input and output files. A stage is skipped when the
+SHA-256 of its inputs (and its parameters) matches the last successful run
+and its outputs are still what that run wrote; a stage whose upstream
+re-ran but produced the same data is skipped as well (workbooks are hashed
+without their save timestamps). The mail stage is never cached: it keeps
+its own ledger of the rows it sent (mail_ledger.py), mails only new or
+changed rows, and sends nothing without --mail-limit or a confirmation. Hashes and
+timings live in <data_dir>/.pipeline_cache.json. Stages whose inputs are
+ready run in parallel, and the run ends with the critical path: the chain
+of stages that determined the wall time. With --memory-report each stage
+that runs is tracked by memory.MEMORY.
+
+    python mgmt4901.py pipeline --data-dir "Data Files" --quiz "4) Initial Belief Formation - Attempt Details.xlsx" \\
+        --evaluator submissions --rubric-file 2025_05_Rubric_Table.xlsx
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from filehash import file_hash
+from memory import MEMORY
+from registry import evaluator_module, mailer_module
+
+CACHE_FILE = ".pipeline_cache.json"
+
+class Stage:
+    """One step of the pipeline: run() reads inputs and writes outputs."""
+
+    def __init__(self, name: str, run: Callable[[], object], inputs: List[str], outputs: List[str],
+                 params: Optional[Dict] = None, cached: bool = True):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        # False for stages that track their own progress and must run every time
+        self.cached = cached
+
+    def input_key(self) -> str:
+        """Hash of the stage's parameters and the content of its inputs."""
+        digest = hashlib.sha256(json.dumps(self.params, sort_keys=True, default=str).encode())
+        for path in self.inputs:
+            digest.update(f"\x00{path}\x00{file_hash(path)}".encode())
+        return digest.hexdigest()
+
+class Pipeline:
+    """Stages wired together by file names; runs them in dependency order with a thread pool."""
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.stages: Dict[str, Stage] = {}
+        self.cache: Dict[str, Dict] = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def add(self, stage: Stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self.stages[stage.name] = stage
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        """For each stage, the stages that write one of its inputs."""
+        producers = {path: stage.name for stage in self.stages.values() for path in stage.outputs}
+        return {name: sorted({producers[path] for path in stage.inputs if path in producers})
+                for name, stage in self.stages.items()}
+
+    def is_fresh(self, stage: Stage) -> bool:
+        """True if the stage's inputs and outputs are unchanged since its last successful run."""
+        entry = self.cache.get(stage.name)
+        if not stage.cached or entry is None or not all(os.path.exists(path) for path in stage.inputs):
+            return False
+        if entry["inputs"] != stage.input_key():
+            return False
+        return all(os.path.exists(path) and file_hash(path) == entry["outputs"].get(path) for path in stage.outputs)
+
+    def _execute(self, stage: Stage) -> Dict:
+        missing = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"{stage.name}: missing input {missing[0]}")
+        if self.is_fresh(stage):
+            return {"status": "cached", "seconds": 0.0}
+        start = time.time()
+        if MEMORY.enabled:
+            with MEMORY.track(stage.name):
+                stage.run()
+        else:
+            stage.run()
+        seconds = time.time() - start
+        if not stage.cached:
+            return {"status": "ran", "seconds": seconds}
+        self.cache[stage.name] = {
+            "inputs": stage.input_key(),
+            "outputs": {path: file_hash(path) for path in stage.outputs if os.path.exists(path)},
+            "seconds": seconds,
+        }
+        return {"status": "ran", "seconds": seconds}
+
+    def run(self, workers: int = 4) -> Dict[str, Dict]:
+        """Run every stage whose inputs changed; returns {stage: {"status", "seconds"}}.
+
+        While memory is tracked, stages run one at a time so each peak is its own.
+        """
+        if MEMORY.enabled:
+            workers = 1
+        deps = self.dependencies()
+        results: Dict[str, Dict] = {}
+        running = {}
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while len(results) < len(self.stages):
+                blocked = False
+                for name in self.stages:
+                    if name in results or name in running.values():
+                        continue
+                    if any(results.get(dep, {}).get("status") in ("failed", "blocked") for dep in deps[name]):
+                        results[name] = {"status": "blocked", "seconds": 0.0}
+                        logging.warning(f"[{name}] skipped: an upstream stage failed")
+                        blocked = True
+                    elif all(dep in results for dep in deps[name]):
+                        running[pool.submit(self._execute, self.stages[name])] = name
+                if not running:
+                    if blocked:
+                        continue
+                    raise ValueError(f"Dependency cycle among stages: {sorted(set(self.stages) - set(results))}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        logging.info(f"[{name}] {results[name]['status']} ({results[name]['seconds']:.1f}s)")
+                    except Exception as e:
+                        results[name] = {"status": "failed", "seconds": 0.0}
+                        logging.error(f"[{name}] failed: {str(e)}")
+                    self._save_cache()
+        self.report(results, deps, time.time() - start)
+        return results
+
+    def critical_path(self, results: Dict[str, Dict], deps: Dict[str, List[str]]) -> List[str]:
+        """The chain of stages with the largest total time in this run."""
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+
+        def visit(name: str) -> float:
+            if name not in finish:
+                before = max(deps[name], key=visit, default=None)
+                previous[name] = before
+                finish[name] = results[name]["seconds"] + (finish[before] if before else 0.0)
+            return finish[name]
+
+        end = max(self.stages, key=visit)
+        path = []
+        while end:
+            path.append(end)
+            end = previous[end]
+        return path[::-1]
+
+    def report(self, results: Dict[str, Dict], deps: Dict[str, List[str]], wall: float):
+        counts = {}
+        for result in results.values():
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        path = self.critical_path(results, deps)
+        logging.info(f"Pipeline finished in {wall:.1f}s: {counts}")
+        logging.info("Critical path: " + " → ".join(f"{name} ({results[name]['seconds']:.1f}s)" for name in path))
+
+    def _save_cache(self):
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.cache, f, indent=2)
+        os.replace(tmp, self.cache_path)
+
+def build_pipeline(data_dir: str, quiz: Optional[str] = None, evaluator: Optional[str] = None,
+                   mailer: Optional[str] = None, class_list_file: str = "00 Class List.xlsx",
+                   mail_limit: Optional[int] = None, confirm_mail: Optional[Callable[[int], bool]] = None) -> Pipeline:
+    """The standard MGMT 4901 pipeline over the exports in data_dir.
+
+    quiz names the raw export to grade; evaluator and mailer (names or module
+    names from registry.EVALUATORS and registry.MAILERS) add the
+    grading and mailing stages. The evaluator's CONFIG supplies the rubric
+    and model settings. The mail stage sends at most mail_limit new or
+    changed rows; without a limit it asks confirm_mail(count) first and
+    sends nothing if there is no confirm_mail or it returns False.
+    """
+    from artifacts import artifact_path, write_artifact
+    from clean_brightspace_quiz import clean_quiz_file
+    from merge_all_cleaned import merge_cleaned_files, read_class_list
+
+    pipeline = Pipeline(os.path.join(data_dir, CACHE_FILE))
+    path = lambda name: os.path.join(data_dir, name)
+    # Intermediates in the format of artifacts.ARTIFACT_CONFIG; Excel only where people read the result
+    intermediate = lambda name: artifact_path(path(name))
+    class_list = path(class_list_file)
+    exports = [name for name in sorted(os.listdir(data_dir))
+               if name.endswith("Attempt Details.xlsx") and not name.startswith("~$")]
+
+    def clean(source: str, target: str):
+        return lambda: write_artifact(clean_quiz_file(source), target)
+
+    cleaned = []
+    for name in exports:
+        target = intermediate(name.replace(".xlsx", "_CLEANED.xlsx"))
+        cleaned.append(target)
+        pipeline.add(Stage(f"clean:{name}", clean(path(name), target), [path(name)], [target]))
+
+    def merge_all():
+        merged = merge_cleaned_files(read_class_list(class_list), cleaned)
+        write_artifact(merged, intermediate("ALL_MERGED.xlsx"))
+
+    pipeline.add(Stage("merge_all", merge_all, [class_list] + cleaned, [intermediate("ALL_MERGED.xlsx")]))
+
+    def features():
+        from feature_engineering import engineer_features
+        engineer_features(path("ALL_MERGED.xlsx"), path("TEAM_FEATURES.xlsx"))
+
+    pipeline.add(Stage("features", features, [intermediate("ALL_MERGED.xlsx")], [intermediate("TEAM_FEATURES.xlsx")]))
+
+    def likert():
+        from apply_likert_formatting import apply_likert_formatting
+        apply_likert_formatting(path("TEAM_FEATURES.xlsx"), path("TEAM_FEATURES_COLORED.xlsx"))
+
+    pipeline.add(Stage("likert", likert, [intermediate("TEAM_FEATURES.xlsx")], [path("TEAM_FEATURES_COLORED.xlsx")]))
+
+    if not quiz:
+        return pipeline
+    stem = path(quiz[:-len(".xlsx")])
+    quiz_cleaned = artifact_path(f"{stem}_CLEANED.xlsx")
+    teams = artifact_path(f"{stem}_TEAMS.xlsx")
+
+    def attach_teams():
+        from merge_team_number import merge_team_number
+        merge_team_number(quiz_cleaned, class_list_file=class_list, output_file=teams)
+
+    pipeline.add(Stage("teams", attach_teams, [quiz_cleaned, class_list], [teams]))
+    if not evaluator:
+        return pipeline
+
+    module = evaluator_module(evaluator)
+    config = module.CONFIG
+    # evaluate_3d grades into a workbook; the other evaluators write a long CSV for format_feedback
+    writes_csv = "output_csv" in config
+    graded = f"{stem}_Evaluation_Output.csv" if writes_csv else f"{stem}_GRADED.xlsx"
+    grading_params = {key: config.get(key) for key in ("model", "cascade_model", "rubric_sheet", "team_column")}
+
+    def grade():
+        config.update({"submission_file": teams})
+        if writes_csv:
+            config["output_csv"] = graded
+            module.main()
+        else:
+            config["output_workbook"] = graded
+            module.main(test_mode=False)
+
+    pipeline.add(Stage("grade", grade, [teams, config["rubric_file"]], [graded],
+                       params={"evaluator": evaluator, **grading_params}))
+    if not writes_csv:
+        return pipeline
+
+    feedback = f"{stem}_Final_Formatted_Feedback.csv"
+
+    def format_stage():
+        from format_feedback import format_feedback
+        format_feedback(graded, class_list, feedback)
+
+    pipeline.add(Stage("format", format_stage, [graded, class_list], [feedback]))
+    if not mailer:
+        return pipeline
+
+    def mail():
+        from mail_ledger import MailLedger, ledger_path
+        script = mailer_module(mailer)
+        ledger = MailLedger(ledger_path(feedback))
+        # format_feedback already took the addresses and first names from the class list
+        unsent = ledger.unsent(script.load_feedback(feedback))
+        if unsent.empty:
+            logging.info("Every feedback row was already mailed")
+            return
+        if mail_limit is not None:
+            unsent = unsent.head(mail_limit)
+        elif confirm_mail is None or not confirm_mail(len(unsent)):
+            logging.warning(f"Not mailing {len(unsent)} new or changed feedback rows: pass --mail-limit or confirm")
+            return
+        service = script.authenticate_gmail()
+        for idx, row in unsent.iterrows():
+            script.send_all(unsent.loc[[idx]], service)
+            ledger.record(row["username"], row)
+        logging.info(f"Mailed {len(unsent)} feedback rows; sent rows recorded in {ledger.path}")
+
+    # Never cached: the ledger records every row sent, so only new or changed rows go out
+    pipeline.add(Stage("mail", mail, [feedback], [], params={"mailer": mailer}, cached=False))
+    return pipeline
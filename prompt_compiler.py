@@ -0,0 +1,45 @@
+"""Pre-rendered static prompt prefixes for provider prompt caching.
+
+Providers such as OpenAI cache the longest previously seen prompt prefix
+(from about 1024 tokens up) and bill and serve it faster. That only works if
+every request for a category starts with byte-identical text, so each
+evaluator renders the static part of a category prompt (instructions, style
+guide, rubric items, JSON format) once through a PromptCompiler and appends
+the student's content at the very end. The system prompt is already a
+constant, so the shared prefix covers both messages.
+"""
+import logging
+import threading
+from typing import Callable, Dict, List
+
+# Prompts shorter than this are never cached by the provider
+MIN_CACHEABLE_TOKENS = 1024
+
+class PromptCompiler:
+    """Renders each category's static prompt prefix once and reuses it for every student."""
+
+    def __init__(self, render: Callable[[str, List[Dict]], str], system_prompt: str = ""):
+        self._render = render
+        self.system_prompt = system_prompt
+        self._cache: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def prefix(self, category: str, rubric_items: List[Dict]) -> str:
+        """The static prefix for a category, rendered on first use."""
+        key = (category, tuple(str(item.get('item', '')) for item in rubric_items))
+        prefix = self._cache.get(key)
+        if prefix is None:
+            with self._lock:
+                prefix = self._cache.setdefault(key, self._render(category, rubric_items))
+        return prefix
+
+    def build(self, category: str, rubric_items: List[Dict], student_content: str) -> str:
+        """The full user prompt: static prefix followed by the student's content."""
+        return self.prefix(category, rubric_items) + student_content
+
+    def compile(self, rubric_by_category: Dict[str, List[Dict]]):
+        """Render every category's prefix up front and log how much of it the provider can cache."""
+        for category, rubric_items in rubric_by_category.items():
+            prefix_tokens = (len(self.system_prompt) + len(self.prefix(category, rubric_items))) // 4
+            note = "" if prefix_tokens >= MIN_CACHEABLE_TOKENS else f" (below the {MIN_CACHEABLE_TOKENS}-token caching minimum)"
+            logging.info(f"Compiled prompt prefix for {category}: ~{prefix_tokens} tokens{note}")
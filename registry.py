@@ -0,0 +1,25 @@
+"""Names of the evaluator and mailer scripts, shared by the CLI and the grading libraries.
+
+Kept free of heavy imports so mgmt4901.py can build its argument choices
+from it without loading pandas or openai.
+"""
+import importlib
+
+EVALUATORS = {
+    "3A": "evaluate_3A",
+    "3d": "evaluate_3d",
+    "submissions": "evaluate_submissions",
+}
+
+MAILERS = {
+    "3A": "test_email",
+    "3B": "4901S_3B_Email",
+}
+
+def evaluator_module(name: str):
+    """The evaluator module for a short name from EVALUATORS or a module name."""
+    return importlib.import_module(EVALUATORS.get(name, name))
+
+def mailer_module(name: str):
+    """The mailer module for a short name from MAILERS or a module name."""
+    return importlib.import_module(MAILERS.get(name, name))
@@ -0,0 +1,150 @@
+"""Targeted re-grade pass for cells that failed in an earlier run.
+
+Scans an evaluator's output for results whose status is failed: placeholder
+feedback ("Error processing evaluation ...", "Error generating summary ...")
+or none at all. A blank score next to real feedback is the "insufficient
+data" answer the prompts allow and is left alone. Re-grades exactly those
+(student, category) pairs concurrently and merges the new results back in
+place, after a timestamped backup of the file:
+
+- evaluate_3A / evaluate_submissions: the long CSV at CONFIG["output_csv"]
+- evaluate_3d: the graded workbook (CONFIG["output_workbook"] or the submission file)
+
+    python mgmt4901.py regrade 3d --workers 4
+"""
+import logging
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from artifacts import backup_copy, read_artifact
+from dedup import payload_cache
+from grading import run_concurrently
+from metrics import METRICS
+from results_table import ResultsTable, apply_results, result_status, total_scores
+
+def find_failed_rows(output_df: pd.DataFrame) -> List[int]:
+    """Row indices of a long evaluation CSV (username, rubric_category, feedback, score) that need re-grading."""
+    return [idx for idx, category, feedback, score in
+            zip(output_df.index, output_df["rubric_category"], output_df["feedback"], output_df["score"])
+            if result_status(category, feedback, score) == "failed"]
+
+def regrade_csv(evaluator, workers: int = 4) -> int:
+    """Re-grade failed rows of an evaluate_3A/evaluate_submissions CSV in place; returns the number re-graded."""
+    config = evaluator.CONFIG
+    output_df = pd.read_csv(config["output_csv"])
+    failed = find_failed_rows(output_df)
+    logging.info(f"Found {len(failed)} failed cells in {config['output_csv']}")
+    if not failed:
+        return 0
+
+    rubric_by_category = evaluator.load_rubric()
+    submission_df = read_artifact(config["submission_file"])
+    id_column = config["id_column"]
+    payloads = payload_cache(config)
+
+    def grade(idx: int) -> Dict:
+        student_id = output_df.at[idx, "username"]
+        category = output_df.at[idx, "rubric_category"]
+        if category not in rubric_by_category:
+            logging.warning(f"Category {category} is not in the rubric; leaving {student_id} unchanged")
+            return None
+        rows = submission_df[submission_df[id_column] == student_id]
+        if rows.empty:
+            logging.warning(f"Student {student_id} is not in {config['submission_file']}; leaving unchanged")
+            return None
+        return evaluator.evaluate_category(student_id, category, rubric_by_category[category], rows.iloc[0].to_dict(),
+                                           payloads)
+
+    results = run_concurrently(failed, grade, workers)
+
+    output_df["feedback"] = output_df["feedback"].astype(object)
+    output_df["score"] = output_df["score"].astype(object)
+    fixed = 0
+    for idx, evaluation in results.items():
+        if evaluation is None:
+            continue
+        output_df.at[idx, "feedback"] = evaluation["feedback"]
+        output_df.at[idx, "score"] = evaluation["score"]
+        fixed += result_status(output_df.at[idx, "rubric_category"], evaluation["feedback"], evaluation["score"]) != "failed"
+
+    logging.info(f"Backup saved to {backup_copy(config['output_csv'])}")
+    output_df.to_csv(config["output_csv"], index=False)
+    logging.info(f"Re-graded {len(failed)} cells ({fixed} now valid); saved to {config['output_csv']}")
+    return len(failed)
+
+def find_failed_cells(submission_df: pd.DataFrame, feedback_map: Dict[str, str], score_map: Dict[str, str],
+                      id_column: str) -> List[Tuple[int, str]]:
+    """(row index, category) pairs of an evaluate_3d workbook that need re-grading; "SUMMARY" marks the summary.
+
+    Rows with no feedback at all were never graded (e.g. a test-mode run) and are skipped.
+    """
+    failed = []
+    output_cols = list(feedback_map.values()) + ["Summary Feedback"]
+    for idx in submission_df.index:
+        if pd.isna(submission_df.at[idx, id_column]):
+            continue
+        if all(pd.isna(v) or str(v).strip() == "" for v in submission_df.loc[idx, output_cols]):
+            continue
+        for category, feedback_col in feedback_map.items():
+            score = submission_df.at[idx, score_map[category]] if category in score_map else ""
+            if result_status(category, submission_df.at[idx, feedback_col], score) == "failed":
+                failed.append((idx, category))
+        if result_status("SUMMARY", submission_df.at[idx, "Summary Feedback"], None) == "failed":
+            failed.append((idx, "SUMMARY"))
+    return failed
+
+def regrade_workbook(evaluator, workers: int = 4) -> int:
+    """Re-grade failed cells of an evaluate_3d workbook in place; returns the number re-graded."""
+    config = evaluator.CONFIG
+    workbook = evaluator.graded_workbook()
+    submission_df = pd.read_excel(workbook)
+    feedback_map, score_map = evaluator.prepare_output_columns(submission_df)
+    failed = find_failed_cells(submission_df, feedback_map, score_map, config["id_column"])
+    logging.info(f"Found {len(failed)} failed cells in {workbook}")
+    if not failed:
+        return 0
+
+    rubric_by_category = evaluator.load_rubric()
+    failed = [(idx, category) for idx, category in failed if category == "SUMMARY" or rubric_by_category.get(category)]
+    responses_by_row = {idx: evaluator.get_student_responses(submission_df, idx) for idx, _ in failed}
+    payloads = payload_cache(config)
+
+    def grade(task: Tuple[int, str]):
+        idx, category = task
+        student_id = submission_df.at[idx, config["id_column"]]
+        if category == "SUMMARY":
+            # The category results already in the workbook, for summary_mode "categories"
+            category_results = {c: {"feedback": submission_df.at[idx, feedback_map[c]],
+                                    "score": submission_df.at[idx, score_map[c]] if c in score_map else ""}
+                                for c in feedback_map if rubric_by_category.get(c)}
+            return evaluator.evaluate_summary(student_id, responses_by_row[idx], category_results, payloads)
+        return evaluator.evaluate_student_category(student_id, category, rubric_by_category[category], responses_by_row[idx],
+                                                   payloads)
+
+    results = run_concurrently(failed, grade, workers)
+
+    table = ResultsTable()
+    for (idx, category), result in results.items():
+        student_id = submission_df.at[idx, config["id_column"]]
+        if category == "SUMMARY":
+            table.add(idx, student_id, category, result)
+        else:
+            table.add(idx, student_id, category, result["feedback"], result["score"])
+    apply_results(submission_df, table.to_frame(), feedback_map, score_map)
+    submission_df["Total Score"] = total_scores(submission_df, list(score_map.values()))
+
+    logging.info(f"Backup saved to {backup_copy(workbook)}")
+    submission_df.to_excel(workbook, index=False)
+    logging.info(f"Re-graded {len(failed)} cells; saved to {workbook}")
+    return len(failed)
+
+def regrade(evaluator, workers: int = 4) -> int:
+    """Re-grade the failed cells of whichever output format the evaluator produces."""
+    evaluator.load_config()
+    if "output_csv" in evaluator.CONFIG:
+        count = regrade_csv(evaluator, workers)
+    else:
+        count = regrade_workbook(evaluator, workers)
+    METRICS.report(evaluator.CONFIG.get("metrics_json"), evaluator.CONFIG.get("metrics_prom"))
+    return count
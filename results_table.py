@@ -0,0 +1,101 @@
+"""Typed, columnar store for grading results.
+
+Graders append one row per (student, category) to a ResultsTable, which keeps
+each field in its own list instead of a dict per result. to_frame() turns it
+into a DataFrame with fixed dtypes (float scores, string feedback, a
+categorical status) and apply_results() joins it onto a submission workbook
+in one vectorized assignment per dtype, replacing cell-by-cell .at writes.
+The summary feedback is stored as category "SUMMARY" with no score.
+"""
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from grading import NO_RESPONSE_PREFIX, is_failed
+
+SUMMARY_CATEGORY = "SUMMARY"
+
+STATUSES = ["graded", "no_response", "no_score", "failed"]
+
+RESULT_DTYPES = {
+    "row": "int64",
+    "student": "string",
+    "category": "string",
+    "score": "float64",
+    "feedback": "string",
+    "status": pd.CategoricalDtype(STATUSES),
+    "latency": "float64",
+}
+
+def result_status(category: str, feedback, score) -> str:
+    """Status of one result: failed (placeholder feedback), no_response, no_score or graded.
+
+    no_score is real feedback with a blank score, which the prompts allow
+    for insufficient data; only failed results are worth re-grading.
+    """
+    if is_failed(feedback, score, check_score=False):
+        return "failed"
+    if str(feedback).startswith(NO_RESPONSE_PREFIX):
+        return "no_response"
+    if category != SUMMARY_CATEGORY and (pd.isna(score) or str(score).strip() == ""):
+        return "no_score"
+    return "graded"
+
+class ResultsTable:
+    """Thread-safe, append-only columnar table of grading results."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns: Dict[str, List] = {name: [] for name in RESULT_DTYPES}
+
+    def __len__(self) -> int:
+        return len(self._columns["row"])
+
+    def add(self, row: int, student: str, category: str, feedback, score=None, latency: Optional[float] = None):
+        """Append one result; score is parsed to float later and latency is in seconds."""
+        status = result_status(category, feedback, score)
+        with self._lock:
+            self._columns["row"].append(row)
+            self._columns["student"].append(str(student))
+            self._columns["category"].append(category)
+            self._columns["score"].append(score)
+            self._columns["feedback"].append(feedback)
+            self._columns["status"].append(status)
+            self._columns["latency"].append(np.nan if latency is None else latency)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The results as a DataFrame with RESULT_DTYPES; scores that are not numbers become NaN."""
+        with self._lock:
+            columns = {name: list(values) for name, values in self._columns.items()}
+        columns["score"] = pd.to_numeric(pd.Series(columns["score"], dtype=object), errors="coerce")
+        frame = pd.DataFrame(columns)
+        return frame.astype(RESULT_DTYPES)
+
+def _join_block(submission_df: pd.DataFrame, long: pd.DataFrame):
+    """Write long (row, column, value) cells into submission_df in one assignment, leaving other cells as they were."""
+    if long.empty:
+        return
+    wide = long.pivot(index="row", columns="column", values="value")
+    present = long.assign(value=True).pivot(index="row", columns="column", values="value").notna()
+    rows, cols = wide.index, list(wide.columns)
+    current = submission_df.loc[rows, cols]
+    updated = wide.where(present, current)
+    submission_df.loc[rows, cols] = updated.astype(submission_df[cols].dtypes.to_dict())
+
+def apply_results(submission_df: pd.DataFrame, results: pd.DataFrame, feedback_map: Dict[str, str],
+                  score_map: Dict[str, str], summary_column: str = "Summary Feedback"):
+    """Join a results frame onto the workbook's feedback, score and summary columns."""
+    feedback_columns = {**feedback_map, SUMMARY_CATEGORY: summary_column}
+    text = results.assign(column=results["category"].map(feedback_columns))
+    text = text.loc[text["column"].notna(), ["row", "column", "feedback"]].rename(columns={"feedback": "value"})
+    scores = results.assign(column=results["category"].map(score_map))
+    scores = scores.loc[scores["column"].notna(), ["row", "column", "score"]].rename(columns={"score": "value"})
+    _join_block(submission_df, text)
+    _join_block(submission_df, scores)
+
+def total_scores(submission_df: pd.DataFrame, score_columns: List[str]) -> pd.Series:
+    """Rounded sum of the category scores per row, <NA> where a row has no scores; non-numeric cells are skipped."""
+    scores = submission_df[score_columns].apply(pd.to_numeric, errors="coerce")
+    return scores.sum(axis=1, min_count=1).round().astype("Int64")
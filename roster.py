@@ -0,0 +1,185 @@
+"""The class list ("00 Class List.xlsx") loaded once and shared by every script.
+
+Usernames are normalized to join keys (stripped, lower-cased) the same way
+everywhere, so "ABC123" in a Brightspace export matches "abc123" in the
+class list. The first load builds a Roster and checks it for duplicate
+usernames and duplicate names, logging them once. Every class-list row is
+kept in frame; lookups and joins use the first row of each username. The
+roster is then saved as a snapshot next to the class list: the table as
+Parquet (".00 Class List.roster.parquet", see artifacts.py) and a JSON
+sidecar with the class list's content hash and the duplicates. Later runs
+load the snapshot instead of re-reading the workbook until the class list
+changes. Columns mixing numbers and text are strings in both, so a team
+number is 3 or "3" the same way whichever path loaded it. Within a process, rosters are cached by path.
+
+    roster = load_roster("00 Class List.xlsx")
+    roster.lookup("ABC123")                   # RosterEntry(email, first_name, team) or None
+    roster.join(quiz_df, ["Team Number"])     # vectorized, on quiz_df["username"]
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from artifacts import arrow_safe, read_artifact, write_artifact
+from filehash import file_hash
+
+ROSTER_CONFIG = {
+    "snapshot_suffix": ".roster.parquet",  # or ".roster.arrow"; the sidecar is ".roster.json"
+    "email_column": "E-Mail Address",
+    "first_name_column": "First Name",
+    "team_column": "Team Number",
+}
+
+class RosterEntry(NamedTuple):
+    email: Optional[str]
+    first_name: Optional[str]
+    team: Optional[object]
+
+def normalize_usernames(values: pd.Series) -> pd.Series:
+    """Usernames as join keys: strings, stripped and lower-cased (missing values stay missing)."""
+    return values.astype("string").str.strip().str.lower()
+
+def _missing_to_none(value):
+    return None if pd.isna(value) else value
+
+class Roster:
+    """The class list with normalized usernames, and a first-row-wins index of it by username."""
+
+    def __init__(self, table: pd.DataFrame, duplicate_usernames: List[str], duplicate_names: List[str]):
+        self.table = table
+        self.duplicate_usernames = duplicate_usernames
+        self.duplicate_names = duplicate_names
+        # Rows without a username can't be looked up; of duplicates, the first row answers
+        keyed = table[table["username"].notna()]
+        self.index = keyed[~keyed["username"].duplicated(keep="first")].set_index("username", drop=False)
+        self._entries: Optional[Dict[str, RosterEntry]] = None
+
+    @classmethod
+    def build(cls, class_list_file: str) -> "Roster":
+        """Read the class list, normalize its usernames and log duplicate usernames and names; keeps every row."""
+        class_list = pd.read_excel(class_list_file)
+        # Find the username column (case-insensitive)
+        username_col = [col for col in class_list.columns if str(col).lower() == "username"][0]
+        class_list["username"] = normalize_usernames(class_list[username_col])
+
+        missing = int(class_list["username"].isna().sum())
+        if missing:
+            logging.warning(f"{missing} rows in {class_list_file} have no username")
+        usernames = class_list["username"].dropna()
+        duplicate_usernames = sorted(usernames[usernames.duplicated()].unique())
+        if duplicate_usernames:
+            logging.warning(f"Duplicate usernames in {class_list_file}, looked up by their first row: {duplicate_usernames}")
+
+        # Names are "Last Name" + "First Name" when present, else the first column that is not the username
+        name_cols = [col for col in ("Last Name", ROSTER_CONFIG["first_name_column"]) if col in class_list.columns]
+        name_cols = name_cols or [col for col in class_list.columns if col not in (username_col, "username")][:1]
+        duplicate_names = []
+        if name_cols:
+            names = class_list[name_cols].astype("string").fillna("").agg(" ".join, axis=1)
+            duplicate_names = sorted(names[names.duplicated(keep=False)].unique())
+            if duplicate_names:
+                logging.warning(f"Duplicate names in {class_list_file}: {duplicate_names}")
+        # Mixed-type columns (e.g. team numbers and "TBD") become strings here, as in the snapshot,
+        # so a rebuilt roster and one loaded from its snapshot hold the same values
+        return cls(arrow_safe(class_list).reset_index(drop=True), duplicate_usernames, duplicate_names)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Every row of the class list, with the normalized username column."""
+        return self.table.copy()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __contains__(self, username) -> bool:
+        return self.lookup(username) is not None
+
+    def lookup(self, username) -> Optional[RosterEntry]:
+        """The (email, first name, team) of a username, or None if it is not on the class list."""
+        if self._entries is None:
+            columns = [ROSTER_CONFIG[key] for key in ("email_column", "first_name_column", "team_column")]
+            values = [self.index[col].tolist() if col in self.index.columns else [None] * len(self.index)
+                      for col in columns]
+            self._entries = {key: RosterEntry(*(_missing_to_none(v) for v in row))
+                             for key, row in zip(self.index.index, zip(*values))}
+        if username is None or pd.isna(username):
+            return None
+        return self._entries.get(str(username).strip().lower())
+
+    def join(self, df: pd.DataFrame, columns: List[str], on: str = "username") -> pd.DataFrame:
+        """df with the class-list columns for each row's username (missing for usernames not on the list)."""
+        looked_up = self.index[columns].reindex(normalize_usernames(df[on]).to_numpy())
+        joined = df.copy()
+        for col in columns:
+            joined[col] = looked_up[col].to_numpy()
+        return joined
+
+    def fill(self, df: pd.DataFrame, columns: List[str], on: str = "username") -> pd.DataFrame:
+        """df with missing values in columns filled in from the class list."""
+        looked_up = self.join(df[[on]], columns, on)
+        filled = df.copy()
+        for col in columns:
+            filled[col] = filled[col].fillna(looked_up[col]) if col in filled.columns else looked_up[col]
+        return filled
+
+def snapshot_path(class_list_file: str) -> str:
+    directory, name = os.path.split(class_list_file)
+    return os.path.join(directory, f".{os.path.splitext(name)[0]}{ROSTER_CONFIG['snapshot_suffix']}")
+
+def sidecar_path(class_list_file: str) -> str:
+    return os.path.splitext(snapshot_path(class_list_file))[0] + ".json"
+
+def _read_snapshot(class_list_file: str, digest: str) -> Optional[Roster]:
+    """The roster saved for this content hash of the class list, or None."""
+    snapshot, sidecar = snapshot_path(class_list_file), sidecar_path(class_list_file)
+    if not (os.path.exists(snapshot) and os.path.exists(sidecar)):
+        return None
+    try:
+        with open(sidecar) as f:
+            saved = json.load(f)
+        if saved["source_hash"] != digest:
+            return None
+        return Roster(read_artifact(snapshot), saved["duplicate_usernames"], saved["duplicate_names"])
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable roster snapshot {snapshot}: {str(e)}")
+        return None
+
+def _write_snapshot(class_list_file: str, digest: str, roster: Roster):
+    """Save the roster's table and, last, the sidecar that makes the snapshot valid."""
+    snapshot, sidecar = snapshot_path(class_list_file), sidecar_path(class_list_file)
+    root, ext = os.path.splitext(snapshot)
+    try:
+        # The old sidecar goes first, so a half-replaced snapshot is never taken as valid
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        os.replace(write_artifact(roster.table, f"{root}.tmp{ext}"), snapshot)
+        with open(f"{sidecar}.tmp", "w") as f:
+            json.dump({"source_hash": digest, "duplicate_usernames": roster.duplicate_usernames,
+                       "duplicate_names": roster.duplicate_names}, f, indent=2)
+        os.replace(f"{sidecar}.tmp", sidecar)
+    except Exception as e:
+        # Without pyarrow (or a writable data folder) every run rebuilds the roster instead
+        logging.warning(f"Could not save roster snapshot {snapshot}: {str(e)}")
+
+_ROSTERS: Dict[str, Tuple[str, Roster]] = {}
+_ROSTERS_LOCK = threading.Lock()
+
+def load_roster(class_list_file: str = "00 Class List.xlsx") -> Roster:
+    """The roster of class_list_file, from memory or its snapshot when the class list is unchanged."""
+    key = os.path.abspath(class_list_file)
+    digest = file_hash(class_list_file)
+    with _ROSTERS_LOCK:
+        cached = _ROSTERS.get(key)
+        if cached and cached[0] == digest:
+            return cached[1]
+        roster = _read_snapshot(class_list_file, digest)
+        if roster is None:
+            roster = Roster.build(class_list_file)
+            _write_snapshot(class_list_file, digest, roster)
+            logging.info(f"Built roster of {len(roster)} rows from {class_list_file}")
+        _ROSTERS[key] = (digest, roster)
+        return roster
@@ -0,0 +1,218 @@
+"""Grade several assignments in one run through a shared priority queue.
+
+At term end several assignments are graded back to back. The scheduler takes
+a list of jobs (evaluator, submission file, rubric file and sheet, output),
+splits every job into one task per student and feeds all of them through one
+priority queue to a single worker pool, so the backend's request slots stay
+busy across assignments instead of idling between runs. Shared between jobs:
+
+- the backend and its concurrency limit (backends.py), i.e. the rate limit
+- rubrics, loaded once per (evaluator, file, sheet)
+- the prompt-prefix compilers of each evaluator
+
+Grading settings (model, cascade, dedup) come from each evaluator's CONFIG;
+with dedup, each job grades identical payloads once through its own cache.
+Higher-priority jobs are dequeued first; within a priority, jobs run in the
+order given. Progress is logged per job as it crosses every 10%, and each
+job's output is written as soon as its last student is graded.
+
+    python mgmt4901.py schedule jobs.json --backend local --concurrency 8
+
+jobs.json is a list of job objects:
+
+    [{"name": "3A", "evaluator": "3A", "submission_file": "3A.xlsx", "output": "3A_Output.csv", "priority": 1},
+     {"name": "3D", "evaluator": "3d", "submission_file": "3D.xlsx", "rubric_sheet": "Rubric"}]
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from artifacts import artifact_path, read_artifact
+from completions import active_backend
+from dedup import payload_cache
+from metrics import METRICS
+from registry import evaluator_module
+from tracing import span
+
+_rubrics: Dict[tuple, Dict[str, List[Dict]]] = {}
+
+def load_rubric_once(evaluator, rubric_file: str, rubric_sheet: str) -> Dict[str, List[Dict]]:
+    """Load a rubric through the evaluator's own loader, once per (evaluator, file, sheet)."""
+    key = (evaluator.__name__, rubric_file, rubric_sheet)
+    if key not in _rubrics:
+        saved = {k: evaluator.CONFIG[k] for k in ("rubric_file", "rubric_sheet")}
+        evaluator.CONFIG.update({"rubric_file": rubric_file, "rubric_sheet": rubric_sheet})
+        try:
+            _rubrics[key] = evaluator.load_rubric()
+        finally:
+            evaluator.CONFIG.update(saved)
+    return _rubrics[key]
+
+class Job:
+    """One assignment to grade: an evaluator applied to a submission file."""
+
+    def __init__(self, name: str, evaluator: str, submission_file: Optional[str] = None,
+                 rubric_file: Optional[str] = None, rubric_sheet: Optional[str] = None,
+                 output: Optional[str] = None, priority: int = 0):
+        self.name = name
+        self.evaluator = evaluator_module(evaluator)
+        config = self.evaluator.CONFIG
+        self.submission_file = submission_file or config["submission_file"]
+        self.rubric_file = rubric_file or config["rubric_file"]
+        self.rubric_sheet = rubric_sheet or config["rubric_sheet"]
+        # evaluate_3d grades into its workbook; the other evaluators write a long CSV
+        self.writes_csv = "output_csv" in config
+        self.output = output or (config["output_csv"] if self.writes_csv else config["output_workbook"] or artifact_path(self.submission_file, "xlsx"))
+        self.priority = priority
+        self.results: Dict[object, object] = {}
+        self.total = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None  # when the first student is dequeued
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._reported_decile = 0
+
+    def load(self) -> List:
+        """Read the rubric and submissions and return the student ids to grade."""
+        self.rubric = load_rubric_once(self.evaluator, self.rubric_file, self.rubric_sheet)
+        self.payloads = payload_cache(self.evaluator.CONFIG)
+        self.evaluator.PROMPTS.compile(self.rubric if self.writes_csv else {**self.rubric, "SUMMARY": [], "CATEGORY_SUMMARY": []})
+        with span("read_excel", file=self.submission_file, job=self.name):
+            self.submission_df = read_artifact(self.submission_file)
+        id_column = self.evaluator.CONFIG["id_column"]
+        if not self.writes_csv:
+            self.feedback_map, self.score_map = self.evaluator.prepare_output_columns(self.submission_df)
+        students = [s for s in self.submission_df[id_column].unique() if pd.notna(s)]
+        self.total = len(students)
+        return students
+
+    def grade(self, student_id):
+        """Grade one student; returns the evaluator's per-student result, or None on failure."""
+        if self.writes_csv:
+            return self.evaluator.evaluate_all_categories(student_id, self.rubric, self.submission_df, self.payloads)
+        id_column = self.evaluator.CONFIG["id_column"]
+        row_index = self.submission_df.index[self.submission_df[id_column] == student_id][0]
+        return row_index, self.evaluator.evaluate_all_categories(student_id, self.rubric, self.submission_df, row_index,
+                                                                 self.payloads)
+
+    def start(self):
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = time.time()
+
+    def record(self, student_id, result) -> bool:
+        """Store a student's result and log progress; returns True once every student is done."""
+        with self._lock:
+            self.results[student_id] = result
+            self.failed += result is None
+            done = len(self.results)
+            decile = done * 10 // self.total
+            if decile > self._reported_decile or done == self.total:
+                self._reported_decile = decile
+                logging.info(f"[{self.name}] {done}/{self.total} students graded ({done / self.total:.0%}), "
+                             f"{self.failed} failed, {time.time() - self.started_at:.1f}s")
+            return done == self.total
+
+    def write_output(self):
+        """Write the job's results in the evaluator's output format."""
+        graded = [(student_id, result) for student_id, result in self.results.items() if result is not None]
+        if self.writes_csv:
+            rows = [evaluation for _, evaluations in graded for evaluation in evaluations]
+            with span("write_csv", file=self.output, job=self.name):
+                pd.DataFrame(rows).to_csv(self.output, index=False)
+            logging.info(f"[{self.name}] Results saved to {self.output}")
+        else:
+            self.evaluator.join_student_results(self.submission_df, [(s, *r) for s, r in graded],
+                                                self.feedback_map, self.score_map)
+            self.evaluator.save_workbook(self.submission_df, self.submission_file, self.output)
+        self.finished_at = time.time()
+
+    def summary(self) -> Dict:
+        return {
+            "job": self.name,
+            "students": self.total,
+            "failed": self.failed,
+            "output": self.output,
+            "wall_seconds": (self.finished_at or time.time()) - (self.started_at or time.time()),
+        }
+
+class Scheduler:
+    """Runs the tasks of several jobs on one worker pool in priority order."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self.jobs: List[Job] = []
+
+    def add(self, job: Job):
+        if any(other.output == job.output for other in self.jobs):
+            raise ValueError(f"Jobs {job.name} and another job both write {job.output}; give each job its own output")
+        self.jobs.append(job)
+
+    def run(self) -> List[Dict]:
+        """Grade every job and return a summary per job."""
+        for evaluator in {job.evaluator for job in self.jobs}:
+            evaluator.load_config()
+        tasks = queue.PriorityQueue()
+        seq = 0
+        for order, job in enumerate(self.jobs):
+            students = job.load()
+            logging.info(f"[{job.name}] Queued {len(students)} students (priority {job.priority})")
+            if not students:
+                job.start()
+                job.write_output()
+            for student_id in students:
+                tasks.put((-job.priority, order, seq, job, student_id))
+                seq += 1
+
+        workers = self.workers or active_backend().max_concurrency
+        logging.info(f"Grading {seq} students across {len(self.jobs)} jobs with {workers} workers")
+        threads = [threading.Thread(target=self._work, args=(tasks,), daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        summaries = [job.summary() for job in self.jobs]
+        for s in summaries:
+            logging.info(f"[{s['job']}] {s['students']} students, {s['failed']} failed, {s['wall_seconds']:.1f}s → {s['output']}")
+        return summaries
+
+    def _work(self, tasks: queue.PriorityQueue):
+        while True:
+            try:
+                _, _, _, job, student_id = tasks.get_nowait()
+            except queue.Empty:
+                return
+            job.start()
+            try:
+                with span("evaluate_student", student=student_id, job=job.name):
+                    result = job.grade(student_id)
+            except Exception as e:
+                logging.error(f"[{job.name}] Error processing student {student_id}: {str(e)}")
+                result = None
+            if job.record(student_id, result):
+                try:
+                    job.write_output()
+                except Exception as e:
+                    logging.error(f"[{job.name}] Could not write {job.output}: {str(e)}")
+
+def load_jobs(path: str) -> List[Job]:
+    """Read a JSON list of job objects (see the module docstring)."""
+    with open(path) as f:
+        specs = json.load(f)
+    return [Job(**spec) for spec in specs]
+
+def run_jobs(jobs: List[Job], workers: Optional[int] = None, metrics_json: Optional[str] = None,
+             metrics_prom: Optional[str] = None) -> List[Dict]:
+    """Schedule and grade jobs, then report the shared run metrics."""
+    scheduler = Scheduler(workers)
+    for job in jobs:
+        scheduler.add(job)
+    summaries = scheduler.run()
+    METRICS.report(metrics_json, metrics_prom)
+    return summaries
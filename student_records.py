@@ -0,0 +1,119 @@
+"""Compact, read-only student response records for large cohorts.
+
+A StudentRecord keeps one student's answers as a tuple aligned with a shared
+ColumnIndex instead of a dict keyed by long column-header strings, so each
+student costs one pointer per column and the headers are interned once per
+workbook. Records behave like read-only mappings (get, items, iteration by
+column name), so prompt builders written against dicts keep working.
+
+ColumnIndex.select() caches which column ids match a rule (e.g. the columns
+of a rubric category), so the prompt builders scan the headers once per
+workbook rather than once per student and category. ResponsesView adds the
+per-category "responses" text on top of a record without copying it.
+"""
+import sys
+from collections.abc import Mapping
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+class ColumnIndex:
+    """Interned column names of one workbook and cached column selections."""
+
+    __slots__ = ("names", "ids", "_selections")
+
+    def __init__(self, names: Sequence[str]):
+        self.names: Tuple[str, ...] = tuple(sys.intern(str(name)) for name in names)
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self._selections: Dict[Hashable, Tuple[int, ...]] = {}
+
+    def select(self, key: Hashable, rule: Callable[[str], bool]) -> Tuple[int, ...]:
+        """Ids of the columns whose name satisfies rule, computed once per key."""
+        selected = self._selections.get(key)
+        if selected is None:
+            selected = self._selections[key] = tuple(i for i, name in enumerate(self.names) if rule(name))
+        return selected
+
+_indexes: Dict[Tuple[str, ...], ColumnIndex] = {}
+
+def column_index(columns: Sequence[str]) -> ColumnIndex:
+    """The shared ColumnIndex for a set of workbook columns."""
+    key = tuple(str(column) for column in columns)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = ColumnIndex(key)
+    return index
+
+class StudentRecord(Mapping):
+    """One student's answers as a tuple aligned with a ColumnIndex; missing answers are None."""
+
+    __slots__ = ("columns", "values")
+
+    def __init__(self, columns: ColumnIndex, values: Tuple):
+        self.columns = columns
+        self.values = values
+
+    def __getitem__(self, name: str):
+        i = self.columns.ids.get(name)
+        if i is None or self.values[i] is None:
+            raise KeyError(name)
+        return self.values[i]
+
+    def get(self, name: str, default=None):
+        i = self.columns.ids.get(name)
+        if i is None or self.values[i] is None:
+            return default
+        return self.values[i]
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.columns.names
+        return (names[i] for i, value in enumerate(self.values) if value is not None)
+
+    def __len__(self) -> int:
+        return sum(value is not None for value in self.values)
+
+    def take(self, ids: Sequence[int]) -> List:
+        """The non-missing values of the given column ids, in column order."""
+        values = self.values
+        return [values[i] for i in ids if values[i] is not None]
+
+class ResponsesView(Mapping):
+    """A record plus the "responses" text of one category, without copying the record."""
+
+    __slots__ = ("record", "responses")
+
+    def __init__(self, record: Mapping, responses: str):
+        self.record = record
+        self.responses = responses
+
+    def __getitem__(self, name: str):
+        if name == "responses":
+            return self.responses
+        return self.record[name]
+
+    def get(self, name: str, default=None):
+        if name == "responses":
+            return self.responses
+        return self.record.get(name, default)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.record
+        if "responses" not in self.record:
+            yield "responses"
+
+    def __len__(self) -> int:
+        return len(self.record) + ("responses" not in self.record)
+
+def build_record(submission_df: pd.DataFrame, row_index: int, exclude: Sequence[str] = (),
+                 keep: Optional[str] = None) -> StudentRecord:
+    """Record of a row's non-empty text answers, leaving out exclude; the keep column is kept whatever its type."""
+    columns = column_index(submission_df.columns)
+    excluded = columns.select(("exclude", tuple(exclude)), lambda name: name in exclude)
+    row = submission_df.iloc[row_index].tolist()
+    values = [value if isinstance(value, str) and value.strip() else None for value in row]
+    for i in excluded:
+        values[i] = None
+    if keep is not None and keep in columns.ids:
+        value = row[columns.ids[keep]]
+        values[columns.ids[keep]] = None if pd.isna(value) else value
+    return StudentRecord(columns, tuple(values))
@@ -0,0 +1,223 @@
+"""Form capstone teams from TEAM_FEATURES by simulated annealing.
+
+Each student's Hipster/Hacker/Hustler/Handler Likert answers are scored
+0 (Strongly Disagree) to 1 (Strongly Agree). A team's score is
+
+    coverage_weight * sum over roles of the team's strongest member in that role
+  - balance_weight * sum over flags of size * (team share - cohort share)^2
+
+so teams want someone keen on every role and a cohort-like mix of the
+BALANCE_COLUMNS flags (BComm/BMgmt degree, entrepreneurship major). The
+cohort is split into ceil(n / team_size) teams whose sizes differ by at
+most one, so no team is larger than team_size. That is usually team_size
+or one fewer, but small cohorts can get smaller teams: 5 students with
+team_size 4 form teams of 3 and 2. The search swaps students between
+teams: every sweep pairs up all teams at random, proposes one swap per
+pair and scores all of them at once as NumPy arrays, accepting each by the
+Metropolis rule as the temperature cools. Cohorts of a few thousand students take a few seconds.
+
+    python mgmt4901.py teams --features TEAM_FEATURES.xlsx --class-list "00 Class List.xlsx" --team-size 4
+
+Team Number is written back to the class list (after a timestamped backup),
+where merge_team_number picks it up. Only that column of the first sheet
+changes: other sheets and formatting are kept, and students missing from
+the team features keep the team they had.
+"""
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from apply_likert_formatting import likert_headers
+from artifacts import backup_copy, find_artifact, read_artifact
+from roster import normalize_usernames
+
+ROLE_COLUMNS = {
+    "Hipster": likert_headers[0],
+    "Hacker": likert_headers[1],
+    "Hustler": likert_headers[2],
+    "Handler": likert_headers[3],
+}
+
+BALANCE_COLUMNS = ["is_bcomm_or_bmgmt", "is_entrepreneurship_major"]
+
+LIKERT_SCORES = {
+    "strongly disagree": 0.0,
+    "disagree": 0.25,
+    "neutral": 0.5,
+    "agree": 0.75,
+    "strongly agree": 1.0,
+}
+
+TEAM_CONFIG = {
+    "team_size": 4,
+    "coverage_weight": 1.0,
+    "balance_weight": 2.0,
+    "sweeps": 4000,         # each sweep proposes one swap per pair of teams
+    "start_temperature": 0.5,
+    "end_temperature": 0.001,
+    "seed": 0,
+}
+
+def encode_features(features: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """(roles, flags): Likert role scores in [0, 1] (unanswered = neutral) and the 0/1 balance flags."""
+    missing = [column for column in ROLE_COLUMNS.values() if column not in features.columns]
+    if missing:
+        raise ValueError(f"TEAM_FEATURES is missing the role columns: {missing}")
+    roles = np.column_stack([
+        features[column].astype("string").str.strip().str.lower().map(LIKERT_SCORES).astype(float).fillna(0.5)
+        for column in ROLE_COLUMNS.values()
+    ])
+    flag_columns = [column for column in BALANCE_COLUMNS if column in features.columns]
+    flags = features[flag_columns].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy(dtype=float)
+    return roles, flags.reshape(len(features), len(flag_columns))
+
+class TeamObjective:
+    """Vectorized team scores; rows of members index students, with n_students meaning an empty slot."""
+
+    def __init__(self, roles: np.ndarray, flags: np.ndarray, coverage_weight: float = 1.0,
+                 balance_weight: float = 2.0):
+        # An extra all-zero student fills empty slots: it never raises a role maximum or a flag count
+        self.roles = np.vstack([roles, np.zeros((1, roles.shape[1]))])
+        self.flags = np.vstack([flags, np.zeros((1, flags.shape[1]))])
+        self.targets = flags.mean(axis=0) if len(flags) else np.zeros(flags.shape[1])
+        self.coverage_weight = coverage_weight
+        self.balance_weight = balance_weight
+
+    def coverage(self, members: np.ndarray) -> np.ndarray:
+        return self.roles[members].max(axis=-2).sum(axis=-1)
+
+    def imbalance(self, members: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        shares = self.flags[members].sum(axis=-2) / sizes[..., None]
+        return ((shares - self.targets) ** 2 * sizes[..., None]).sum(axis=-1)
+
+    def __call__(self, members: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """Score of each team in members (..., team_size) with sizes (...)."""
+        return self.coverage_weight * self.coverage(members) - self.balance_weight * self.imbalance(members, sizes)
+
+def initial_teams(n_students: int, team_size: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """A random assignment into ceil(n / team_size) teams whose sizes differ by at most one."""
+    n_teams = max(1, -(-n_students // team_size))
+    sizes = np.full(n_teams, n_students // n_teams)
+    sizes[:n_students % n_teams] += 1
+    members = np.full((n_teams, int(sizes.max())), n_students)
+    order = rng.permutation(n_students)
+    start = 0
+    for team, size in enumerate(sizes):
+        members[team, :size] = order[start:start + size]
+        start += size
+    return members, sizes
+
+def anneal(objective: TeamObjective, members: np.ndarray, sizes: np.ndarray, sweeps: int,
+           start_temperature: float, end_temperature: float, rng: np.random.Generator) -> np.ndarray:
+    """Improve members by swapping students between random pairs of teams; returns the best assignment seen."""
+    n_teams = len(members)
+    if n_teams < 2:
+        return members
+    members = members.copy()
+    scores = objective(members, sizes)
+    best, best_total = members.copy(), scores.sum()
+    pairs = n_teams // 2
+    rows = np.arange(pairs)
+    for sweep in range(sweeps):
+        temperature = start_temperature * (end_temperature / start_temperature) ** (sweep / max(sweeps - 1, 1))
+        order = rng.permutation(n_teams)
+        a, b = order[:pairs], order[pairs:2 * pairs]
+        slot_a = rng.integers(0, sizes[a])
+        slot_b = rng.integers(0, sizes[b])
+        new_a, new_b = members[a], members[b]
+        new_a[rows, slot_a], new_b[rows, slot_b] = members[b, slot_b], members[a, slot_a]
+        score_a, score_b = objective(new_a, sizes[a]), objective(new_b, sizes[b])
+        delta = score_a + score_b - scores[a] - scores[b]
+        accept = (delta >= 0) | (rng.random(pairs) < np.exp(np.minimum(delta, 0) / temperature))
+        members[a[accept]], members[b[accept]] = new_a[accept], new_b[accept]
+        scores[a[accept]], scores[b[accept]] = score_a[accept], score_b[accept]
+        total = scores.sum()
+        if total > best_total:
+            best, best_total = members.copy(), total
+    return best
+
+def form_teams(features: pd.DataFrame, team_size: Optional[int] = None, seed: Optional[int] = None,
+               sweeps: Optional[int] = None) -> Tuple[np.ndarray, Dict]:
+    """Team numbers (1-based, one per row of features) and a summary of the objective before and after."""
+    team_size = team_size or TEAM_CONFIG["team_size"]
+    sweeps = TEAM_CONFIG["sweeps"] if sweeps is None else sweeps
+    rng = np.random.default_rng(TEAM_CONFIG["seed"] if seed is None else seed)
+    roles, flags = encode_features(features)
+    objective = TeamObjective(roles, flags, TEAM_CONFIG["coverage_weight"], TEAM_CONFIG["balance_weight"])
+
+    start = time.time()
+    members, sizes = initial_teams(len(features), team_size, rng)
+    before = _describe(objective, members, sizes)
+    members = anneal(objective, members, sizes, sweeps, TEAM_CONFIG["start_temperature"],
+                     TEAM_CONFIG["end_temperature"], rng)
+    after = _describe(objective, members, sizes)
+
+    team_numbers = np.zeros(len(features), dtype=int)
+    for team, row in enumerate(members):
+        team_numbers[row[row < len(features)]] = team + 1
+    summary = {"students": len(features), "teams": len(members), "seconds": time.time() - start,
+               "before": before, "after": after}
+    logging.info(f"Formed {len(members)} teams for {len(features)} students in {summary['seconds']:.1f}s; "
+                 f"objective {before['objective']:.1f} → {after['objective']:.1f}, teams covering every role "
+                 f"{before['full_coverage']:.0%} → {after['full_coverage']:.0%}")
+    return team_numbers, summary
+
+def _describe(objective: TeamObjective, members: np.ndarray, sizes: np.ndarray) -> Dict:
+    strongest = objective.roles[members].max(axis=1)
+    return {
+        "objective": float(objective(members, sizes).sum()),
+        "full_coverage": float((strongest >= LIKERT_SCORES["agree"]).all(axis=1).mean()),
+        "imbalance": float(objective.imbalance(members, sizes).sum()),
+    }
+
+def write_team_numbers(class_list_file: str, team_numbers: pd.Series, output_file: Optional[str] = None) -> pd.DataFrame:
+    """Set Team Number in the class list by username, after a timestamped backup when writing in place.
+
+    Only the Team Number cells of the first sheet are written, through
+    openpyxl; students not in team_numbers keep their current team.
+    """
+    output_file = output_file or class_list_file
+    if output_file == class_list_file:
+        logging.info(f"Backup saved to {backup_copy(class_list_file)}")
+    workbook = openpyxl.load_workbook(class_list_file)
+    sheet = workbook.worksheets[0]
+    header = [cell.value for cell in sheet[1]]
+    # Find the username column (case-insensitive), as Roster.build does
+    username_col = [i for i, name in enumerate(header) if str(name).lower() == "username"][0] + 1
+    if "Team Number" in header:
+        team_col = header.index("Team Number") + 1
+    else:
+        team_col = len(header) + 1
+        sheet.cell(row=1, column=team_col, value="Team Number")
+
+    rows = list(range(2, sheet.max_row + 1))
+    usernames = normalize_usernames(pd.Series([sheet.cell(row=r, column=username_col).value for r in rows], dtype=object))
+    unassigned = 0
+    for row, username in zip(rows, usernames):
+        if pd.isna(username):
+            continue
+        team = team_numbers.get(username)
+        if team is None or pd.isna(team):
+            unassigned += 1
+            continue
+        sheet.cell(row=row, column=team_col, value=int(team))
+    if unassigned:
+        logging.warning(f"{unassigned} students in {class_list_file} are not in the team features and keep their team")
+    workbook.save(output_file)
+    logging.info(f"Team numbers saved to {output_file}")
+    return pd.read_excel(output_file)
+
+def form_and_save(features_file: str = "TEAM_FEATURES.xlsx", class_list_file: str = "00 Class List.xlsx",
+                  output_file: Optional[str] = None, team_size: Optional[int] = None,
+                  seed: Optional[int] = None) -> Dict:
+    """Form teams from the team features and write Team Number into the class list."""
+    features = read_artifact(find_artifact(features_file))
+    features = features[features["username"].notna()].reset_index(drop=True)
+    team_numbers, summary = form_teams(features, team_size, seed)
+    by_username = pd.Series(team_numbers, index=normalize_usernames(features["username"]))
+    write_team_numbers(class_list_file, by_username[~by_username.index.duplicated()], output_file)
+    return summary
@@ -10,21 +10,23 @@ from googleapiclient.discovery import build
 SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 
 # Load feedback data
-df = pd.read_csv("3A Final_Formatted_Feedback.csv")  # Replace with your actual CSV file path
+FEEDBACK_FILE = "3A Final_Formatted_Feedback.csv"  # Replace with your actual CSV file path
 
 # Authenticate with Gmail API using credentials.json from Google Cloud Console
-def authenticate_gmail():
+def authenticate_gmail(credentials_dir="."):
+    credentials_path = os.path.join(credentials_dir, 'credentials.json')
+    token_path = os.path.join(credentials_dir, 'token.json')
     creds = None
-    if os.path.exists('token.json'):
+    if os.path.exists(token_path):
         from google.oauth2.credentials import Credentials
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
+        with open(token_path, 'w') as token:
             token.write(creds.to_json())
     return build('gmail', 'v1', credentials=creds)
 
@@ -76,10 +78,14 @@ def create_message(to, subject, body):
 def send_email(service, message):
     return service.users().messages().send(userId="me", body=message).execute()
 
-if __name__ == '__main__':
-    gmail_service = authenticate_gmail()
+def load_feedback(file_path=FEEDBACK_FILE):
+    """Read the formatted 3A feedback CSV."""
+    return pd.read_csv(file_path)
 
-    for i, row in df.iterrows():
+def send_all(df, gmail_service, limit=None):
+    """Send the 3A feedback email to the first `limit` rows of df (every row if limit is None)."""
+    rows = df if limit is None else df.head(limit)
+    for i, row in rows.iterrows():
         to = row['E-Mail Address']
         subject = "Your Feedback for Assignment 3A – MGMT 4901"
         body = create_email_body(row)
@@ -87,3 +93,7 @@ if __name__ == '__main__':
         print(f"Sending to {to}...")
         send_email(gmail_service, msg)
         print("Sent!")
+
+if __name__ == '__main__':
+    gmail_service = authenticate_gmail()
+    send_all(load_feedback(), gmail_service)
@@ -0,0 +1,246 @@
+"""Clean, merge and grade new Brightspace exports as they land in the data directory.
+
+    python mgmt4901.py watch --data-dir "Data Files" --evaluator 3A --rubric-file 2025_05_Rubric_Table.xlsx
+
+The watcher waits for files matching WATCH_CONFIG["pattern"] (Brightspace's
+"... - Attempt Details.xlsx"). A file is processed once it has stopped
+changing for settle_seconds and opens as a complete workbook, so a download
+that is still being written is left alone. Its content hash is compared with
+the one recorded in the state file, so a touched or re-saved but identical
+export is skipped. Only the export that changed goes through the pipeline:
+
+1. clean_quiz_file → "<export>_CLEANED.xlsx" (or .parquet/.arrow, see artifacts.py)
+2. merge_all_cleaned → ALL_MERGED.xlsx, re-reading only the cleaned file
+   that changed (the others and the class list stay cached in memory)
+3. merge_team_number → "<export>_TEAMS.xlsx"
+4. optionally an evaluator, incrementally (see incremental.py), so only
+   new or changed answers are sent for grading
+
+An export that fails to process is retried after retry_backoff seconds,
+doubling up to max_retry_backoff, for up to max_attempts tries; after that
+it waits until the file changes again.
+
+Changes are picked up through inotify when the inotify_simple package is
+installed on Linux; otherwise the directory is polled every poll_interval
+seconds.
+"""
+import fnmatch
+import json
+import logging
+import os
+import time
+import zipfile
+from typing import Dict, Optional, Tuple
+
+from artifacts import artifact_path, write_artifact
+from clean_brightspace_quiz import clean_quiz_file
+from filehash import file_hash
+from merge_all_cleaned import merge_frames, read_class_list, read_cleaned
+from merge_team_number import merge_team_number
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+WATCH_CONFIG = {
+    "pattern": "*Attempt Details.xlsx",  # raw exports to pick up
+    "settle_seconds": 2.0,               # a file must stop changing this long before it is read
+    "poll_interval": 1.0,                # seconds between scans (and the inotify read timeout)
+    "class_list_file": "00 Class List.xlsx",
+    "merged_file": "ALL_MERGED.xlsx",
+    "state_file": ".watch_state.json",   # content hashes of the exports already processed
+    "retry_backoff": 30.0,               # seconds before a failed export is retried, doubled per failure
+    "max_retry_backoff": 600.0,
+    "max_attempts": 5,                   # failures before an export waits for its file to change
+}
+
+class ExportWatcher:
+    """Pushes new or changed exports in data_dir through cleaning, merging and (optionally) grading."""
+
+    def __init__(self, data_dir: str, evaluator=None, use_inotify: bool = True):
+        self.data_dir = data_dir
+        self.evaluator = evaluator
+        self.state_path = os.path.join(data_dir, WATCH_CONFIG["state_file"])
+        self.processed: Dict[str, str] = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.processed = json.load(f)
+        # name -> (size, mtime_ns, time the file was last seen changing)
+        self.pending: Dict[str, Tuple[int, int, float]] = {}
+        # name -> (size, mtime_ns) when it was last hashed, so polling does not re-hash unchanged files
+        self.checked: Dict[str, Tuple[int, int]] = {}
+        # name -> failed attempts at its current (size, mtime_ns)
+        self.failures: Dict[str, int] = {}
+        self._class_list = None
+        self._class_list_stat: Optional[Tuple[int, int]] = None
+        self._cleaned: Optional[Dict[str, object]] = None
+        self.inotify = None
+        if use_inotify and INotify is not None:
+            self.inotify = INotify()
+            self.inotify.add_watch(data_dir, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.MODIFY)
+        logging.info(f"Watching {data_dir} for {WATCH_CONFIG['pattern']} "
+                     f"({'inotify' if self.inotify else 'polling every ' + str(WATCH_CONFIG['poll_interval']) + 's'})")
+
+    def is_export(self, name: str) -> bool:
+        return fnmatch.fnmatch(name, WATCH_CONFIG["pattern"]) and not name.startswith("~$")
+
+    def _stat(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.data_dir, name))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _note(self, name: str, now: float):
+        """Start or restart the settle timer of name if its size or mtime changed."""
+        stat = self._stat(name)
+        if stat is None:
+            self.pending.pop(name, None)
+            return
+        if self.checked.get(name) == stat:
+            return
+        previous = self.pending.get(name)
+        if previous is None or previous[:2] != stat:
+            if previous is not None:
+                self.failures.pop(name, None)
+            self.pending[name] = (*stat, now)
+
+    def _wait_for_changes(self, timeout: float):
+        """Add files that may have changed to pending: from inotify events, or a scan of the directory."""
+        now = time.time()
+        if self.inotify:
+            for event in self.inotify.read(timeout=int(timeout * 1000)):
+                if event.name and self.is_export(event.name):
+                    self._note(event.name, time.time())
+            # Files already pending are re-checked so their settle timers advance
+            names = list(self.pending)
+        else:
+            time.sleep(timeout)
+            names = [name for name in os.listdir(self.data_dir) if self.is_export(name)]
+        for name in names:
+            self._note(name, now)
+
+    def settled(self):
+        """Pending files that stopped changing at least settle_seconds ago and open as a workbook."""
+        now = time.time()
+        ready = []
+        for name, (_, _, since) in list(self.pending.items()):
+            path = os.path.join(self.data_dir, name)
+            if now - since >= WATCH_CONFIG["settle_seconds"] and zipfile.is_zipfile(path):
+                ready.append(name)
+        return ready
+
+    def scan(self):
+        """Queue every export currently in the directory (the state file filters the unchanged ones)."""
+        now = time.time()
+        for name in sorted(os.listdir(self.data_dir)):
+            if self.is_export(name):
+                self._note(name, now - WATCH_CONFIG["settle_seconds"])
+
+    def process_ready(self) -> int:
+        """Process every settled export whose content changed; returns how many were processed."""
+        count = 0
+        for name in self.settled():
+            size, mtime_ns, _ = self.pending.pop(name)
+            path = os.path.join(self.data_dir, name)
+            digest = file_hash(path)
+            if self.processed.get(name) == digest:
+                logging.debug(f"{name} is unchanged, skipping")
+                self.checked[name] = (size, mtime_ns)
+                continue
+            try:
+                self.process(path)
+            except Exception as e:
+                self._retry_later(name, size, mtime_ns, e)
+                continue
+            self.checked[name] = (size, mtime_ns)
+            self.failures.pop(name, None)
+            self.processed[name] = digest
+            self._save_state()
+            count += 1
+        return count
+
+    def _retry_later(self, name: str, size: int, mtime_ns: int, error: Exception):
+        """Put a failed export back in pending after a backoff, or leave it until it changes once out of attempts."""
+        attempts = self.failures.get(name, 0) + 1
+        if attempts >= WATCH_CONFIG["max_attempts"]:
+            logging.error(f"Could not process {name} after {attempts} attempts, waiting for it to change: {str(error)}")
+            self.failures.pop(name, None)
+            self.checked[name] = (size, mtime_ns)
+            return
+        self.failures[name] = attempts
+        backoff = min(WATCH_CONFIG["retry_backoff"] * 2 ** (attempts - 1), WATCH_CONFIG["max_retry_backoff"])
+        logging.error(f"Could not process {name} (attempt {attempts}), retrying in {backoff:.0f}s: {str(error)}")
+        # settled() releases it once settle_seconds have passed since this time
+        self.pending[name] = (size, mtime_ns, time.time() + backoff - WATCH_CONFIG["settle_seconds"])
+
+    def process(self, path: str):
+        """Clean, merge, attach teams and grade one export."""
+        start = time.time()
+        name = os.path.basename(path)
+        logging.info(f"Processing {name}")
+        cleaned_path = artifact_path(path.replace(".xlsx", "_CLEANED.xlsx"))
+        write_artifact(clean_quiz_file(path), cleaned_path)
+        logging.info(f"Cleaned → {os.path.basename(cleaned_path)}")
+
+        class_list_path = os.path.join(self.data_dir, WATCH_CONFIG["class_list_file"])
+        self._merge(cleaned_path, class_list_path)
+
+        teams_path = artifact_path(path.replace(".xlsx", "_TEAMS.xlsx"))
+        merge_team_number(cleaned_path, class_list_file=class_list_path, output_file=teams_path)
+
+        if self.evaluator is not None:
+            self._grade(teams_path)
+        logging.info(f"Finished {name} in {time.time() - start:.1f}s")
+
+    def _merge(self, cleaned_path: str, class_list_path: str):
+        """Rebuild ALL_MERGED.xlsx, re-reading only the class list (if it changed) and cleaned_path."""
+        stat = self._stat(WATCH_CONFIG["class_list_file"])
+        if self._class_list is None or stat != self._class_list_stat:
+            self._class_list = read_class_list(class_list_path)
+            self._class_list_stat = stat
+        if self._cleaned is None:
+            self._cleaned = {name: read_cleaned(os.path.join(self.data_dir, name))
+                             for name in sorted(os.listdir(self.data_dir)) if name.endswith(artifact_path("_CLEANED.xlsx"))}
+        else:
+            self._cleaned[os.path.basename(cleaned_path)] = read_cleaned(cleaned_path)
+        merged = merge_frames(self._class_list, list(self._cleaned.values()))
+        write_artifact(merged, artifact_path(os.path.join(self.data_dir, WATCH_CONFIG["merged_file"])))
+        logging.info(f"Merged {len(self._cleaned)} cleaned files → {WATCH_CONFIG['merged_file']}")
+
+    def _grade(self, submission_file: str):
+        """Grade the export incrementally into outputs named after it."""
+        config = self.evaluator.CONFIG
+        stem = submission_file.rsplit("_TEAMS", 1)[0]
+        config.update({"submission_file": submission_file, "incremental": True})
+        # evaluate_3d grades into its workbook; the other evaluators write a long CSV
+        if "output_csv" in config:
+            config["output_csv"] = f"{stem}_Evaluation_Output.csv"
+            self.evaluator.main()
+        else:
+            config["output_workbook"] = f"{stem}_GRADED.xlsx"
+            self.evaluator.main(test_mode=False)
+
+    def _save_state(self):
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.processed, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def run(self, once: bool = False):
+        """Process what is already there, then keep watching; with once, stop when nothing but retries is pending."""
+        self.scan()
+        while True:
+            self.process_ready()
+            if once and all(name in self.failures for name in self.pending):
+                return
+            self._wait_for_changes(WATCH_CONFIG["poll_interval"])
+
+def watch(data_dir: str, evaluator=None, once: bool = False, use_inotify: bool = True):
+    """Watch data_dir until interrupted (or, with once, until the exports already there are processed)."""
+    watcher = ExportWatcher(data_dir, evaluator, use_inotify)
+    try:
+        watcher.run(once)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching")
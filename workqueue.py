@@ -0,0 +1,351 @@
+"""Durable, lease-based work queue for grading with many worker processes.
+
+A coordinator splits a grading job into (student, category) tasks and stores
+them in a SQLite database. Any number of worker processes, on this machine
+or others that share the database file, claim tasks under a time-limited
+lease and keep it alive with heartbeats while they grade. A lease that runs
+out (the worker crashed or lost its connection) puts the task back in the
+queue; tasks are given up after MAX_ATTEMPTS. When the queue is drained the
+results are merged into the evaluator's usual output: the long CSV of
+evaluate_3A / evaluate_submissions or the graded evaluate_3d workbook.
+
+    python mgmt4901.py queue enqueue 3A --db grading.db --submission-file "3A.xlsx"
+    python mgmt4901.py queue work --db grading.db --processes 8
+    python mgmt4901.py queue status --db grading.db
+    python mgmt4901.py queue merge --db grading.db
+
+Each worker grades one task at a time, so throughput grows with the number
+of workers until the API rate limit is reached. SQLite relies on file locks,
+which many network filesystems (NFS in particular) do not implement
+reliably; workers on other machines need a share with working locks.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from artifacts import read_artifact
+from dedup import payload_cache
+from grading import is_failed
+from metrics import METRICS
+from registry import evaluator_module
+from results_table import ResultsTable, apply_results, total_scores
+
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+# Evaluator CONFIG keys recorded with a job and applied by every worker
+JOB_CONFIG_KEYS = ("id_column", "model", "cascade_model", "dedup", "team_column", "summary_mode")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    evaluator TEXT NOT NULL,
+    submission_file TEXT NOT NULL,
+    rubric_file TEXT NOT NULL,
+    rubric_sheet TEXT NOT NULL,
+    output TEXT NOT NULL,
+    config TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL REFERENCES jobs(name),
+    student TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | leased | done | failed
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    feedback TEXT,
+    score TEXT,  -- JSON, so numbers and "" survive the round trip
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (job, student, category)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, lease_expires);
+"""
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open the queue database in autocommit mode with WAL journaling and the schema in place."""
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _evaluator(name: str):
+    return evaluator_module(name)
+
+def enqueue(db_path: str, evaluator_name: str, job_name: Optional[str] = None) -> int:
+    """Split a job into (student, category) tasks using the evaluator's current CONFIG; returns tasks added.
+
+    Re-enqueueing the same job only adds tasks that are not in the queue yet.
+    """
+    evaluator = _evaluator(evaluator_name)
+    config = evaluator.CONFIG
+    job_name = job_name or evaluator.__name__
+    writes_csv = "output_csv" in config
+    output = config["output_csv"] if writes_csv else evaluator.graded_workbook()
+    rubric = evaluator.load_rubric()
+    submission_df = read_artifact(config["submission_file"])
+    id_column = config["id_column"]
+
+    categories = [category for category, items in rubric.items() if items]
+    # Summaries built from the category results are queued after every category task, so they usually find them done
+    summary_last = config.get("summary_mode") == "categories"
+    if not writes_csv and not summary_last:
+        categories.append("SUMMARY")
+    tasks = []
+    summaries = []
+    seen = set()
+    for row_index, student_id in submission_df[id_column].items():
+        if pd.isna(student_id) or student_id in seen:
+            continue
+        seen.add(student_id)
+        tasks.extend((job_name, str(student_id), int(row_index), category) for category in categories)
+        if not writes_csv and summary_last:
+            summaries.append((job_name, str(student_id), int(row_index), "SUMMARY"))
+    tasks.extend(summaries)
+
+    conn = connect(db_path)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_name, evaluator_name, config["submission_file"], config["rubric_file"], config["rubric_sheet"],
+             output, json.dumps({key: config.get(key) for key in JOB_CONFIG_KEYS}), time.time()))
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO tasks (job, student, row_index, category) VALUES (?, ?, ?, ?)", tasks)
+        added = conn.total_changes - before
+    conn.close()
+    logging.info(f"Queued {added} tasks for {job_name} ({len(seen)} students x {len(categories) + bool(summaries)} categories) in {db_path}")
+    return added
+
+def queue_status(db_path: str) -> Dict[str, Dict[str, int]]:
+    """Task counts per job and status."""
+    conn = connect(db_path)
+    status: Dict[str, Dict[str, int]] = {}
+    for row in conn.execute("SELECT job, status, COUNT(*) AS n FROM tasks GROUP BY job, status"):
+        status.setdefault(row["job"], {})[row["status"]] = row["n"]
+    conn.close()
+    return status
+
+class Worker:
+    """Claims leased tasks from the queue, grades them and stores the results."""
+
+    def __init__(self, db_path: str, worker_id: Optional[str] = None, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, claim_size: int = 1, poll_seconds: float = 1.0):
+        self.db_path = db_path
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.claim_size = claim_size
+        self.poll_seconds = poll_seconds
+        self.conn = connect(db_path)
+        self._held: List[int] = []
+        self._held_lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+        self.completed = 0
+
+    def claim(self) -> List[sqlite3.Row]:
+        """Lease up to claim_size pending or expired tasks; gives up expired tasks out of attempts."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            rows = self.conn.execute(
+                "SELECT * FROM tasks WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?", (now, self.claim_size)).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                [(self.worker_id, now + self.lease_seconds, now, row["id"]) for row in rows])
+        return rows
+
+    def _heartbeat(self, stop: threading.Event):
+        conn = connect(self.db_path)
+        while not stop.wait(self.lease_seconds / 3):
+            with self._held_lock:
+                held = list(self._held)
+            if held:
+                conn.executemany(
+                    "UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                    [(time.time() + self.lease_seconds, task_id, self.worker_id) for task_id in held])
+        conn.close()
+
+    def _job(self, name: str) -> Dict:
+        """Evaluator, rubric and submissions for a job, loaded once per worker."""
+        if name not in self._jobs:
+            row = self.conn.execute("SELECT * FROM jobs WHERE name = ?", (name,)).fetchone()
+            evaluator = _evaluator(row["evaluator"])
+            evaluator.CONFIG.update({"rubric_file": row["rubric_file"], "rubric_sheet": row["rubric_sheet"]})
+            evaluator.load_config()
+            config = json.loads(row["config"])
+            self._jobs[name] = {
+                "evaluator": evaluator,
+                "config": config,
+                "payloads": payload_cache(config),  # dedup within this worker's share of the job
+                "rubric": evaluator.load_rubric(),
+                "submission_df": read_artifact(row["submission_file"]),
+                "writes_csv": "output_csv" in evaluator.CONFIG,
+            }
+        return self._jobs[name]
+
+    def grade(self, task: sqlite3.Row) -> Dict:
+        """Grade one task with the job's evaluator; returns {"feedback", "score"}."""
+        job = self._job(task["job"])
+        evaluator = job["evaluator"]
+        evaluator.CONFIG.update(job["config"])
+        student_id, category, row_index = task["student"], task["category"], task["row_index"]
+        submission_df = job["submission_df"]
+        if job["writes_csv"]:
+            student_responses = submission_df.loc[row_index].to_dict()
+            return evaluator.evaluate_category(student_id, category, job["rubric"][category], student_responses,
+                                               job["payloads"])
+        student_responses = evaluator.get_student_responses(submission_df, row_index)
+        if category == "SUMMARY":
+            return {"feedback": evaluator.evaluate_summary(student_id, student_responses, self._category_results(task),
+                                                           job["payloads"]),
+                    "score": ""}
+        return evaluator.evaluate_student_category(student_id, category, job["rubric"][category], student_responses,
+                                                   job["payloads"])
+
+    def _category_results(self, task: sqlite3.Row) -> Dict[str, Dict]:
+        """The finished category results of the task's student, for summaries built from them."""
+        rows = self.conn.execute(
+            "SELECT category, feedback, score FROM tasks WHERE job = ? AND student = ? AND category != 'SUMMARY' "
+            "AND status = 'done'", (task["job"], task["student"])).fetchall()
+        results = {row["category"]: {"feedback": row["feedback"], "score": json.loads(row["score"])} for row in rows}
+        # A category still pending counts as missing, so the summary falls back to the raw answers
+        graded = [c for c, items in self._job(task["job"])["rubric"].items() if items]
+        return results if all(c in results for c in graded) else {}
+
+    def finish(self, task: sqlite3.Row, result: Optional[Dict], error: Optional[str] = None):
+        """Store a result, or put the task back for another attempt if it failed."""
+        failed = result is None or is_failed(result["feedback"], result["score"], check_score=task["category"] != "SUMMARY")
+        now = time.time()
+        # task holds the attempt count from before this lease
+        if failed and task["attempts"] + 1 < self.max_attempts:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND worker = ?",
+                (error or (result or {}).get("feedback"), now, task["id"], self.worker_id))
+            return
+        status = "failed" if result is None else "done"
+        # Keep a finished result even if the lease ran out meanwhile, unless another worker already stored one
+        self.conn.execute(
+            "UPDATE tasks SET status = ?, feedback = ?, score = ?, error = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status != 'done'",
+            (status, (result or {}).get("feedback"), json.dumps((result or {}).get("score", "")), error, now, task["id"]))
+        self.completed += 1
+
+    def outstanding(self) -> int:
+        """Tasks that are still pending or leased (possibly by other workers)."""
+        return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def run(self) -> int:
+        """Work until the queue is drained; returns the number of tasks this worker completed."""
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop,), daemon=True)
+        heartbeat.start()
+        logging.info(f"Worker {self.worker_id} started on {self.db_path}")
+        try:
+            while True:
+                tasks = self.claim()
+                if not tasks:
+                    # Other workers may still hold leases that could expire and come back
+                    if not self.outstanding():
+                        break
+                    time.sleep(self.poll_seconds)
+                    continue
+                with self._held_lock:
+                    self._held = [task["id"] for task in tasks]
+                for task in tasks:
+                    try:
+                        self.finish(task, self.grade(task))
+                    except Exception as e:
+                        logging.error(f"[{task['student']} | {task['category']}] Task failed: {str(e)}")
+                        self.finish(task, None, error=str(e))
+                    with self._held_lock:
+                        self._held.remove(task["id"])
+        finally:
+            stop.set()
+            heartbeat.join()
+        logging.info(f"Worker {self.worker_id} finished: {self.completed} tasks")
+        METRICS.log_summary()
+        return self.completed
+
+def run_worker(db_path: str, worker_id: Optional[str] = None, client_settings: Optional[Dict] = None, **options) -> int:
+    """Entry point for one worker process; client_settings carries the parent's client setup into spawned processes."""
+    if client_settings:
+        import openai
+        from backends import BACKEND_CONFIG
+        from completions import CLIENT_CONFIG
+        CLIENT_CONFIG.update(client_settings["client"])
+        for name, backend_options in client_settings["backends"].items():
+            BACKEND_CONFIG[name].update(backend_options)
+        openai.api_base = client_settings["api_base"]
+    return Worker(db_path, worker_id, **options).run()
+
+def run_workers(db_path: str, processes: int, **options) -> List[int]:
+    """Start processes local worker processes and wait for them; returns their exit codes."""
+    import openai
+    from backends import BACKEND_CONFIG
+    from completions import CLIENT_CONFIG
+    client_settings = {"client": dict(CLIENT_CONFIG), "backends": {k: dict(v) for k, v in BACKEND_CONFIG.items()},
+                       "api_base": openai.api_base}
+    workers = [multiprocessing.Process(target=run_worker, args=(db_path, f"{socket.gethostname()}:w{i}", client_settings),
+                                       kwargs=options)
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+def merge(db_path: str, job_name: Optional[str] = None) -> List[str]:
+    """Write finished results of every job (or one job) in its evaluator's output format; returns the files written."""
+    conn = connect(db_path)
+    jobs = conn.execute("SELECT * FROM jobs" + (" WHERE name = ?" if job_name else ""),
+                        (job_name,) if job_name else ()).fetchall()
+    written = []
+    for job in jobs:
+        tasks = pd.read_sql_query(
+            "SELECT student, row_index, category, status, feedback, score FROM tasks WHERE job = ? ORDER BY id",
+            conn, params=(job["name"],))
+        unfinished = int(tasks["status"].isin(["pending", "leased"]).sum())
+        if unfinished:
+            logging.warning(f"[{job['name']}] {unfinished} tasks are not finished yet; merging what is done")
+        tasks = tasks[tasks["status"].isin(["done", "failed"])]
+        tasks["score"] = [json.loads(score) if score is not None else "" for score in tasks["score"]]
+        tasks["feedback"] = tasks["feedback"].fillna("Error processing evaluation. Please try again.")
+        evaluator = _evaluator(job["evaluator"])
+
+        if "output_csv" in evaluator.CONFIG:
+            output_df = tasks.rename(columns={"student": "username", "category": "rubric_category"})
+            output_df[["username", "rubric_category", "feedback", "score"]].to_csv(job["output"], index=False)
+        else:
+            submission_df = read_artifact(job["submission_file"])
+            feedback_map, score_map = evaluator.prepare_output_columns(submission_df)
+            table = ResultsTable()
+            for task in tasks.itertuples(index=False):
+                table.add(task.row_index, task.student, task.category, task.feedback, task.score)
+            apply_results(submission_df, table.to_frame(), feedback_map, score_map)
+            submission_df["Total Score"] = total_scores(submission_df, list(score_map.values()))
+            evaluator.save_workbook(submission_df, job["submission_file"], job["output"])
+        logging.info(f"[{job['name']}] Merged {len(tasks)} results into {job['output']}")
+        written.append(job["output"])
+    conn.close()
+    return written